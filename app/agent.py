@@ -1,67 +1,102 @@
 import os
+import time
+import logging
 import requests
 from bs4 import BeautifulSoup
 from typing import TypedDict, Annotated, List
 
 from langchain.chains import RetrievalQA
 from langchain_core.messages import AIMessage, BaseMessage, ToolMessage, HumanMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.runnables import RunnableConfig
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
 from langchain_core.tools import tool
 from dotenv import load_dotenv
-from serpapi import GoogleSearch
+
+from app.concurrency import run_blocking
+from app.context_builder import estimate_prompt_tokens, estimate_tokens, fit_documents, log_prompt_usage
+from app.retrieval_cache import ShardedRetriever
+from app.retrieval_gate import retrieval_gate
+from app.embeddings import ServiceEmbeddings, get_embedding_service
+from app.metrics import span
+from app.resources import LazyResource
+from app.providers import JobSearchUnavailable, job_search_resource, llm_resource
+from app.vector_index import MmapVectorStore, has_index, has_mmap_format, list_shards
+from app.characters import CHARACTERS
 
 # Load environment variables
 load_dotenv()
-if "GOOGLE_API_KEY" not in os.environ:
-    raise ValueError("GOOGLE_API_KEY environment variable not set.")
-
-# Inisialisasi LLM
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.8)
-print("LLM gemini-1.5-flash diinisialisasi.")
-
-# Inisialisasi model embedding & muat Vector Store umum
-try:
-    embeddings = HuggingFaceEmbeddings(model_name='all-MiniLM-L6-v2')
-    vector_store = FAISS.load_local("faiss_index_all_subjects", embeddings, allow_dangerous_deserialization=True)
-    general_retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-    print("Vector store berhasil dimuat.")
-except Exception as e:
-    print(f"Peringatan: Gagal memuat vector store. Fitur e-learning & karir tidak akan aktif. Error: {e}")
-    general_retriever = None
+
+logger = logging.getLogger(__name__)
+
+# Semua resource berat dibuat secara lazy (saat pertama dipakai atau saat warmup di lifespan),
+# sehingga import modul ini tetap cepat untuk CLI, benchmark, dan tes.
+# LLM & pencarian kerja dipilih lewat LLM_PROVIDER / JOB_SEARCH_PROVIDER (lihat app/providers.py).
+
+
+# Inisialisasi model embedding & muat Vector Store per subjek (satu shard per subfolder knowledge_base)
+FAISS_INDEX_PATH = "faiss_index_all_subjects"
+# Nama shard untuk indeks gabungan lama (file indeks langsung di FAISS_INDEX_PATH)
+LEGACY_SHARD = "_all"
+
+def create_general_retriever() -> ShardedRetriever | None:
+    # Model embedding dipakai bersama dengan recommender (satu salinan per proses)
+    embeddings = ServiceEmbeddings(get_embedding_service())
+
+    def load_vector_store(index_path: str):
+        # Format serving (indeks + docstore di-mmap) dibagi antar worker lewat page cache OS
+        if has_mmap_format(index_path):
+            return MmapVectorStore(index_path, embeddings)
+        logger.warning(f"{index_path} belum punya format mmap, memakai index.pkl (salinan penuh per worker). Jalankan ulang create_vector_store.py.")
+        return FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+
+    try:
+        shard_paths = {name: os.path.join(FAISS_INDEX_PATH, name) for name in list_shards(FAISS_INDEX_PATH)}
+        fallback_shard = None
+        if not shard_paths and has_index(FAISS_INDEX_PATH):
+            logger.warning("Indeks per subjek belum dibangun, semua karakter memakai indeks gabungan lama.")
+            shard_paths = {LEGACY_SHARD: FAISS_INDEX_PATH}
+            fallback_shard = LEGACY_SHARD
+        if not shard_paths:
+            raise FileNotFoundError(f"Tidak ada indeks di {FAISS_INDEX_PATH}")
+        # Tiap shard punya cache semantik sendiri dan dimuat ulang otomatis jika di-rebuild
+        retriever = ShardedRetriever(FAISS_INDEX_PATH, load_vector_store, shard_paths, k=3, fallback_shard=fallback_shard)
+        logger.info(f"Vector store berhasil dimuat: {', '.join(retriever.shards)}.")
+        return retriever
+    except Exception as e:
+        logger.warning(f"Gagal memuat vector store. Fitur e-learning & karir tidak akan aktif. Error: {e}")
+        return None
+
+def warmup_retriever(retriever: ShardedRetriever) -> None:
+    """Satu pencarian dummy per shard (tanpa mengisi cache) agar indeks masuk memori."""
+    retriever.warmup()
+
+# Opsional: tanpa indeks FAISS semua karakter tetap melayani chat, hanya tanpa konteks RAG
+general_retriever_resource = LazyResource("general_retriever", create_general_retriever, warmup=warmup_retriever, required=False)
 
 # --- ALAT PENCARIAN KERJA BARU (MENGGUNAKAN SERPAPI) ---
 @tool
-def job_search_tool(query: str, location: str = "Indonesia") -> str:
+async def job_search_tool(query: str, location: str = "Indonesia") -> str:
     """
     Cari lowongan kerja real-time dari Google Jobs via SerpAPI (dengan tampilan rapi).
     """
-    print(f"--- MEMANGGIL ALAT SERPAPI (GOOGLE JOBS): Query='{query}', Lokasi='{location}' ---")
+    logger.debug(f"Memanggil job_search_tool: query='{query}', lokasi='{location}'")
 
     final_query = query
     if "ai engineer" in query.lower():
         final_query = f'"{query}" OR "Machine Learning Engineer" OR "AI Specialist"'
 
     try:
-        api_key = os.environ.get("SERPAPI_API_KEY")
-        if not api_key:
-            return "⚠️ SERPAPI_API_KEY belum diatur di environment."
-
-        params = {
-            "engine": "google_jobs",
-            "q": final_query,
-            "location": location,
-            "hl": "id",
-            "gl": "id",
-            "api_key": api_key,
-        }
-
-        client = GoogleSearch(params)
-        results = client.get_dict()
+        job_search = await job_search_resource.aget()
+        try:
+            with span("tool"):
+                results = await job_search.search(final_query, location)
+        except JobSearchUnavailable as e:
+            return str(e)
+
+        if results.get("error"):
+            logger.warning(f"SerpAPI: {results['error']}")
 
         jobs = results.get("jobs_results", [])
         if not jobs:
@@ -97,122 +132,95 @@ def job_search_tool(query: str, location: str = "Indonesia") -> str:
         return "\n".join(response_lines)
 
     except Exception as e:
-        print(f"ERROR SerpAPI: {e}")
+        logger.error(f"Pencarian kerja gagal: {e}")
         return f"Terjadi kesalahan teknis: {e}"
 
-# --- IKAT ALAT KE LLM ---
+# --- ALAT YANG BISA DI-BIND KE KARAKTER (lihat `tools` di app/waifu.py) ---
 tools = [job_search_tool]
-llm_with_tools = llm.bind_tools(tools)
+TOOLS_BY_NAME = {t.name: t for t in tools}
 
 # --- DEFINISI STATE ---
 class GraphState(TypedDict):
     character_id: str
     messages: Annotated[List[BaseMessage], "Daftar pesan dalam percakapan"]
-    system_prompt: str
+    user_name: str
+    # Blok ringkasan percakapan untuk system prompt (string kosong jika belum ada)
+    summary: str
 
 # --- NODE 1: CHAT (HANYA UNTUK INPUT MANUSIA) ---
-def chat_node(state: GraphState):
+async def chat_node(state: GraphState, config: RunnableConfig):
     """
     Node ini HANYA menangani input dari pengguna (HumanMessage).
     Tugasnya adalah merespons atau memutuskan untuk memanggil alat.
+    Prompt, chain, dan kapabilitas (RAG, alat, shard) diambil dari registry karakter
+    yang dikompilasi sekali (app/characters.py).
+    `config` diteruskan ke chain agar token LLM ikut ter-stream lewat `astream_events`.
     """
-    print("Memasuki chat_node (Human Input)")
     character_id = state["character_id"]
-    system_prompt = state["system_prompt"]
     messages = state["messages"]
-    
+
     if not messages or not isinstance(messages[-1], HumanMessage):
-        print("Peringatan: chat_node dipanggil tanpa HumanMessage. Mengembalikan state.")
+        logger.warning("chat_node dipanggil tanpa HumanMessage. Mengembalikan state.")
         return state
 
-    current_user_input = messages[-1].content
-    chat_history = messages[:-1]
-    ai_response = None
+    profile = CHARACTERS.get(character_id)
+    if profile is None:
+        return {"messages": messages + [AIMessage(content="Maaf, karakter tidak ditemukan.")]}
 
+    current_user_input = messages[-1].content
     if not current_user_input or current_user_input.strip() == "":
-        print("Input pengguna kosong terdeteksi.")
-        ai_response = AIMessage(content="Hmm, kamu tidak mengatakan apa-apa.")
-        return {"messages": messages + [ai_response], "character_id": character_id, "system_prompt": system_prompt}
-
-    # Logika HINATA (RAG + Tools)
-    if character_id == "HINATA_CHAN" and general_retriever is not None:
-        print(f"Mode RAG + Tools (Human Input) Aktif untuk {character_id}")
-        docs = general_retriever.get_relevant_documents(current_user_input)
-        context_text = "\n\n".join([doc.page_content for doc in docs])
-        
-        rag_plus_tool_prompt = f"""{system_prompt}
-Gunakan pengetahuanmu dari konteks berikut untuk memberikan nasihat karir.
----
-KONTEKS PENGETAHUAN: {context_text}
----
-ATURAN UTAMA DAN PENGECUALIAN PERSONA:
-1. Jika pengguna meminta "lowongan kerja", "cari kerja", "loker", atau sinonimnya:
-2. Kamu HARUS dan WAJIB memanggil alat `job_search_tool` SEGERA.
-3. JANGAN menolak, JANGAN meminta CV. Langsung panggil alat.
-"""
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", rag_plus_tool_prompt),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-        ])
-        chain = prompt | llm_with_tools
-        ai_response = chain.invoke({
-            "chat_history": chat_history,
-            "input": current_user_input,
-            "context": context_text
-        })
-
-    # Logika YUNA (RAG Saja)
-    elif character_id == "YUNA_CHAN" and general_retriever is not None:
-        print(f"Mode RAG (Human Input) Aktif untuk {character_id}")
-        docs = general_retriever.get_relevant_documents(current_user_input)
-        context_text = "\n\n".join([doc.page_content for doc in docs])
-        rag_prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt + "\n\nKonteks:\n{context}"),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-        ])
-        chain = rag_prompt | llm
-        ai_response = chain.invoke({
-            "context": context_text,
-            "chat_history": chat_history,
-            "input": current_user_input,
-        })
-
-    # Logika LAIN (Chat Biasa)
-    else:
-        print(f"Mode Chat Biasa untuk {character_id} Aktif")
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            MessagesPlaceholder(variable_name="chat_history"),
-            ("human", "{input}"),
-        ])
-        chain = prompt_template | llm
-        ai_response = chain.invoke({
-            "chat_history": chat_history,
-            "input": current_user_input,
-        })
-    
-    new_messages = messages + [ai_response]
-    return {"messages": new_messages, "character_id": character_id, "system_prompt": system_prompt}
+        logger.debug("Input pengguna kosong terdeteksi.")
+        return {"messages": messages + [AIMessage(content="Hmm, kamu tidak mengatakan apa-apa.")]}
+
+    variables = {
+        "user_name": state.get("user_name", ""),
+        "summary": state.get("summary", ""),
+        "chat_history": messages[:-1],
+        "input": current_user_input,
+    }
+    context_text = ""
+    use_tools = bool(profile.tool_names)
+    if profile.rag or profile.tool_names:
+        general_retriever = await general_retriever_resource.aget() if profile.rag else None
+        # Basa-basi, emoji, dan pertanyaan di luar topik shard tidak perlu embedding/pencarian FAISS
+        decision = await retrieval_gate.decide(current_user_input, profile, general_retriever)
+        use_tools = decision.use_tools
+        if decision.retrieve:
+            started = time.perf_counter()
+            with span("retrieval"):
+                docs = await run_blocking(
+                    general_retriever.get_relevant_documents, current_user_input, profile.shards, decision.query_vector
+                )
+            context_text = fit_documents(docs)
+            retrieval_gate.observe_retrieval(time.perf_counter() - started, estimate_tokens(context_text))
+        if profile.rag:
+            variables["context"] = context_text
+
+    chain = profile.chain(await llm_resource.aget(), TOOLS_BY_NAME, with_tools=use_tools)
+    with span("llm"):
+        ai_response = await chain.ainvoke(variables, config=config)
+
+    system_tokens = profile.system_tokens(variables["user_name"], variables["summary"])
+    log_prompt_usage(character_id, estimate_prompt_tokens(system_tokens, context_text, messages), ai_response)
+    return {"messages": messages + [ai_response]}
 
 # --- NODE 2: EKSEKUSI ALAT ---
 tool_node = ToolNode(tools)
 
 # --- NODE 3 (PERBAIKAN FINAL): UBAH HASIL ALAT MENJADI JAWABAN ---
-def tool_result_node(state: GraphState):
+async def tool_result_node(state: GraphState):
     """
     Node ini HANYA dipanggil setelah tool_node.
     PERBAIKAN: Node ini TIDAK memanggil LLM. Ia HANYA
     mengubah output ToolMessage menjadi AIMessage.
     Ini 100% menghindari error 'contents is not specified'.
     """
-    print("Memasuki tool_result_node (Mengubah Tool ke AI Message)")
+    logger.debug("Memasuki tool_result_node (Mengubah Tool ke AI Message)")
     messages = state["messages"]
 
     # Pesan terakhir HARUS ToolMessage
     if not messages or not isinstance(messages[-1], ToolMessage):
-        print("Peringatan: tool_result_node dipanggil tanpa ToolMessage.")
+        logger.warning("tool_result_node dipanggil tanpa ToolMessage.")
         ai_response = AIMessage(content="Terjadi kesalahan saat memproses hasil alat.")
         return {"messages": messages + [ai_response]}
 
@@ -227,7 +235,7 @@ def tool_result_node(state: GraphState):
     
     ai_response = AIMessage(content=tool_output)
     
-    print(f"Mengubah ToolMessage menjadi AIMessage: {tool_output[:70]}...")
+    logger.debug(f"Mengubah ToolMessage menjadi AIMessage: {tool_output[:70]}...")
 
     new_messages = messages + [ai_response]
     # Hanya perlu update messages
@@ -239,10 +247,10 @@ def should_continue(state: GraphState) -> str:
     """Memutuskan alur selanjutnya setelah 'chat_node'."""
     last_message = state["messages"][-1]
     if isinstance(last_message, AIMessage) and hasattr(last_message, "tool_calls") and last_message.tool_calls:
-        print("Keputusan: Memanggil Alat (tools)")
+        logger.debug("Keputusan: Memanggil Alat (tools)")
         return "tools"
     else:
-        print("Keputusan: Mengakhiri Alur (end)")
+        logger.debug("Keputusan: Mengakhiri Alur (end)")
         return "end"
 
 # --- DEFINISI WORKFLOW BARU ---
@@ -272,6 +280,6 @@ workflow.add_edge("tools", "tool_result") # <-- SETELAH 'tools', pergi ke 'tool_
 # 5. Tentukan alur setelah 'tool_result'
 workflow.add_edge("tool_result", END) # <-- SETELAH 'tool_result', alur selesai
 
-# Compile agent
+# Compile agent (semua node async, panggil dengan `await chat_agent.ainvoke(...)`)
 chat_agent = workflow.compile()
-print("Workflow agent berhasil di-compile dengan arsitektur anti-error.")
\ No newline at end of file
+logger.info("Workflow agent berhasil di-compile dengan arsitektur anti-error.")
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# TTL pendek: perubahan dari worker lain (yang tidak menerima invalidasi lokal) terlihat paling lambat setelah ini
+AUTH_USER_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+@dataclass
+class _CacheEntry:
+    expires_at: float
+    # Nilai kolom User (bukan objek ORM, karena objek ORM terikat ke satu sesi)
+    values: dict
+
+
+class AuthUserCache:
+    """
+    Cache user hasil resolusi token JWT per proses, agar `current_active_user` tidak melakukan
+    `SELECT user` di setiap request. Entri dihapus saat user diperbarui/dinonaktifkan/dihapus
+    lewat adapter database user (app/users.py) dan kedaluwarsa setelah TTL. Invalidasi hanya
+    berlaku di proses ini; worker uvicorn lain melihat perubahan paling lambat setelah TTL.
+    """
+
+    def __init__(self, ttl_seconds: float = AUTH_USER_CACHE_TTL_SECONDS, max_entries: int = AUTH_USER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[int, _CacheEntry] = OrderedDict()
+        self._versions: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get(self, user_id: int) -> dict | None:
+        entry = self._entries.get(user_id)
+        if entry is None or entry.expires_at < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry.values
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def set(self, user_id: int, values: dict, version: int) -> None:
+        if version != self.version(user_id):
+            # User diperbarui selama query berjalan; hasil query mungkin sudah basi
+            return
+        self._entries[user_id] = _CacheEntry(time.monotonic() + self.ttl_seconds, values)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._versions[user_id] = self.version(user_id) + 1
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            # Setiap hit adalah satu SELECT user yang tidak dijalankan
+            "db_queries_saved": self.hits,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
+
+
+auth_user_cache = AuthUserCache()
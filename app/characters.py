@@ -0,0 +1,86 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable
+
+from app.context_builder import estimate_tokens
+from app.waifu import WAIFU
+
+# Blok konteks RAG bawaan jika karakter tidak mendefinisikan `context_prompt` sendiri
+DEFAULT_CONTEXT_PROMPT = "\n\nKonteks:\n{context}"
+
+
+@dataclass
+class CharacterProfile:
+    """
+    Karakter yang sudah "dikompilasi" sekali saat startup: template prompt siap pakai dan
+    kapabilitasnya. Nama pengguna, ringkasan, dan konteks RAG dikirim sebagai variabel template
+    per giliran, bukan diformat ulang ke dalam string system prompt.
+    """
+    id: str
+    prompt: ChatPromptTemplate
+    # Kapabilitas: retrieval ke shard pengetahuan tertentu dan alat yang boleh dipanggil
+    shards: List[str] = field(default_factory=list)
+    tool_names: List[str] = field(default_factory=list)
+    # Perkiraan token system prompt tanpa variabel, dan berapa kali {user_name} muncul
+    base_system_tokens: int = 0
+    user_name_slots: int = 0
+    # Chain per mode (dengan/tanpa alat), dibuat ulang jika instance LLM berganti
+    _chains: Dict[bool, Runnable] = field(default_factory=dict, repr=False)
+    _chain_llm: Any = field(default=None, repr=False)
+
+    @property
+    def rag(self) -> bool:
+        return bool(self.shards)
+
+    def system_tokens(self, user_name: str, summary: str) -> int:
+        return self.base_system_tokens + self.user_name_slots * estimate_tokens(user_name) + estimate_tokens(summary)
+
+    def chain(self, llm, tools_by_name: Dict[str, Any], with_tools: bool = True) -> Runnable:
+        """
+        `prompt | llm` (dengan alat ter-bind jika ada dan `with_tools`), dibuat sekali per instance LLM.
+        Tanpa alat, skema alat tidak ikut dikirim ke LLM (giliran basa-basi dari gerbang retrieval).
+        """
+        if self._chain_llm is not llm:
+            self._chains = {}
+            self._chain_llm = llm
+        with_tools = with_tools and bool(self.tool_names)
+        chain = self._chains.get(with_tools)
+        if chain is None:
+            model = llm.bind_tools([tools_by_name[name] for name in self.tool_names]) if with_tools else llm
+            chain = self._chains[with_tools] = self.prompt | model
+        return chain
+
+
+def compile_character(character: dict) -> CharacterProfile:
+    shards = list(character.get("knowledge_shards", []))
+    system = character["system_prompt"]
+    if shards:
+        system += character.get("context_prompt", DEFAULT_CONTEXT_PROMPT)
+    # Ringkasan bergulir percakapan (boleh kosong) selalu di akhir system prompt
+    system += "{summary}"
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}"),
+    ])
+    static_text = system
+    for name in ("{user_name}", "{context}", "{summary}"):
+        static_text = static_text.replace(name, "")
+    return CharacterProfile(
+        id=character["id"],
+        prompt=prompt,
+        shards=shards,
+        tool_names=list(character.get("tools", [])),
+        base_system_tokens=estimate_tokens(static_text),
+        user_name_slots=system.count("{user_name}"),
+    )
+
+
+def build_registry(characters: Dict[str, dict] = WAIFU) -> Dict[str, CharacterProfile]:
+    return {character_id: compile_character(character) for character_id, character in characters.items()}
+
+
+# Dibangun sekali saat import; karakter baru cukup ditambahkan di app/waifu.py
+CHARACTERS = build_registry()
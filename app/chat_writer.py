@@ -0,0 +1,228 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List
+
+from sqlalchemy import insert
+
+from app.db import AsyncSessionLocal
+from app.history_cache import ConversationKey, HistoryItem
+from app.metrics import STAGE_SECONDS
+from app.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Mode write-behind: pesan chat disimpan oleh flusher background, bukan di jalur response
+CHAT_WRITE_BEHIND = os.environ.get("CHAT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+# Flush saat jumlah baris mencapai batas ini, atau setelah jeda waktu berikut sejak baris pertama
+CHAT_WRITE_BATCH_SIZE = int(os.environ.get("CHAT_WRITE_BATCH_SIZE", "200"))
+CHAT_WRITE_FLUSH_MS = float(os.environ.get("CHAT_WRITE_FLUSH_MS", "200"))
+# Jumlah pasangan pesan yang boleh menunggu; jika penuh, request menunggu (backpressure)
+CHAT_WRITE_QUEUE_SIZE = int(os.environ.get("CHAT_WRITE_QUEUE_SIZE", "5000"))
+CHAT_WRITE_RETRY_SECONDS = float(os.environ.get("CHAT_WRITE_RETRY_SECONDS", "1"))
+CHAT_WRITE_SHUTDOWN_ATTEMPTS = 3
+
+
+@dataclass
+class _PendingWrite:
+    seq: int
+    key: ConversationKey
+    rows: List[dict]
+
+
+@dataclass
+class _LoadWatch:
+    # Jumlah load_window yang sedang berjalan & jumlah batch percakapan ini yang ter-commit selama itu
+    loaders: int = 0
+    commits: int = 0
+
+
+class ChatMessageWriter:
+    """
+    Write-behind untuk ChatMessage: endpoint chat memanggil `enqueue`, lalu satu flusher
+    background memasukkan pesan ke DB dengan INSERT multi-baris dalam satu transaksi per batch.
+    Pesan yang belum di-commit disimpan di `_pending` agar jalur baca riwayat tetap melihatnya.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = CHAT_WRITE_BATCH_SIZE,
+        flush_ms: float = CHAT_WRITE_FLUSH_MS,
+        queue_size: int = CHAT_WRITE_QUEUE_SIZE,
+        enabled: bool = CHAT_WRITE_BEHIND,
+    ):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._queue: asyncio.Queue[_PendingWrite] = asyncio.Queue(maxsize=queue_size)
+        self._pending: dict[ConversationKey, list[_PendingWrite]] = {}
+        # Hanya berisi percakapan yang riwayatnya sedang dimuat, jadi tidak tumbuh tanpa batas
+        self._watches: dict[ConversationKey, _LoadWatch] = {}
+        self._seq = 0
+        self._task: asyncio.Task | None = None
+        self._collecting: list[_PendingWrite] = []
+        self._flushing: asyncio.Future | None = None
+        self._stopping = False
+        self.enqueued_rows = 0
+        self.flushed_rows = 0
+        self.batches = 0
+        self.failures = 0
+        self.backpressure_waits = 0
+        self.backpressure_seconds_total = 0.0
+        self.flush_seconds_total = 0.0
+        self.lost_rows = 0
+
+    async def enqueue(self, user_id: int, character_id: str, items: List[HistoryItem]) -> None:
+        """Antrekan pesan untuk disimpan. Menunggu jika antrean penuh (DB tertinggal)."""
+        rows = [
+            {"user_id": user_id, "character_id": character_id, "role": role, "content": content, "timestamp": timestamp}
+            for role, content, timestamp in items
+        ]
+        self._seq += 1
+        write = _PendingWrite(self._seq, (user_id, character_id), rows)
+        self._pending.setdefault(write.key, []).append(write)
+        if self._queue.full():
+            self.backpressure_waits += 1
+            started = time.perf_counter()
+            await self._queue.put(write)
+            self.backpressure_seconds_total += time.perf_counter() - started
+        else:
+            self._queue.put_nowait(write)
+        self.enqueued_rows += len(rows)
+
+    def pending_items(self, key: ConversationKey) -> List[HistoryItem]:
+        return [(row["role"], row["content"], row["timestamp"]) for write in self._pending.get(key, []) for row in write.rows]
+
+    async def load_window(self, key: ConversationKey, loader: Callable[[], Awaitable[List[HistoryItem]]], window: int) -> List[HistoryItem]:
+        """
+        Riwayat dari DB ditambah pesan yang masih di antrean. Jika ada batch milik percakapan ini
+        yang ter-commit selama query berjalan (termasuk yang di-enqueue setelah query dimulai),
+        query diulang agar pesan tidak terbaca dua kali.
+        """
+        watch = self._watches.setdefault(key, _LoadWatch())
+        watch.loaders += 1
+        try:
+            while True:
+                commits = watch.commits
+                items = await loader()
+                if watch.commits == commits:
+                    return (items + self.pending_items(key))[-window:]
+        finally:
+            watch.loaders -= 1
+            if not watch.loaders:
+                del self._watches[key]
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="chat-message-writer")
+
+    async def stop(self) -> None:
+        """Hentikan flusher lalu simpan semua pesan yang masih di antrean."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Flush yang sedang berjalan tidak ikut dibatalkan (shield); tunggu sampai selesai
+        if self._flushing is not None:
+            await self._flushing
+        remaining = self._collecting
+        self._collecting = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush_until_ok(remaining[start:start + self.batch_size])
+        if remaining:
+            logger.info(f"Shutdown: {sum(len(w.rows) for w in remaining)} pesan chat di antrean diproses.")
+
+    async def _collect_batch(self) -> None:
+        # Disimpan di atribut (bukan variabel lokal) agar tidak hilang jika task dibatalkan saat shutdown
+        self._collecting.append(await self._queue.get())
+        rows = len(self._collecting[0].rows)
+        deadline = time.monotonic() + self.flush_interval
+        while rows < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                write = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            self._collecting.append(write)
+            rows += len(write.rows)
+
+    async def _run(self) -> None:
+        while True:
+            await self._collect_batch()
+            batch, self._collecting = self._collecting, []
+            self._flushing = asyncio.ensure_future(self._flush_until_ok(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _flush_until_ok(self, batch: list[_PendingWrite]) -> None:
+        """
+        Batch yang gagal dicoba ulang dengan urutan tetap; selama itu antrean penuh menahan request
+        baru (backpressure). Saat shutdown percobaan dibatasi agar aplikasi tetap bisa berhenti.
+        """
+        attempts = 0
+        while not await self._flush(batch):
+            attempts += 1
+            if self._stopping and attempts >= CHAT_WRITE_SHUTDOWN_ATTEMPTS:
+                lost = sum(len(write.rows) for write in batch)
+                self.lost_rows += lost
+                logger.error(f"Shutdown: {lost} pesan chat gagal disimpan.")
+                return
+            await asyncio.sleep(CHAT_WRITE_RETRY_SECONDS)
+
+    async def _flush(self, batch: list[_PendingWrite]) -> bool:
+        rows = [row for write in batch for row in write.rows]
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(insert(ChatMessage), rows)
+                await session.commit()
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Gagal menyimpan batch {len(rows)} pesan chat: {e}")
+            return False
+        flush_seconds = time.perf_counter() - started
+        STAGE_SECONDS.labels("persist_batch").observe(flush_seconds)
+        self.flush_seconds_total += flush_seconds
+        self.batches += 1
+        self.flushed_rows += len(rows)
+        for write in batch:
+            watch = self._watches.get(write.key)
+            if watch is not None:
+                watch.commits += 1
+            writes = self._pending.get(write.key)
+            if writes is None:
+                continue
+            writes.remove(write)
+            if not writes:
+                del self._pending[write.key]
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "enqueued_rows": self.enqueued_rows,
+            "flushed_rows": self.flushed_rows,
+            "batches": self.batches,
+            "avg_rows_per_batch": self.flushed_rows / self.batches if self.batches else 0.0,
+            "avg_flush_ms": 1000 * self.flush_seconds_total / self.batches if self.batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+            "pending_conversations": len(self._pending),
+            "backpressure_waits": self.backpressure_waits,
+            "backpressure_seconds_total": round(self.backpressure_seconds_total, 6),
+            "failures": self.failures,
+            "lost_rows": self.lost_rows,
+        }
+
+
+chat_writer = ChatMessageWriter()
@@ -0,0 +1,29 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Ukuran pool untuk pekerjaan blocking (retrieval FAISS, encode embedding, SDK sinkron).
+# Sengaja dibatasi agar pekerjaan CPU-bound tidak menghabiskan semua core worker uvicorn.
+BLOCKING_POOL_SIZE = int(os.environ.get("BLOCKING_POOL_SIZE", "4"))
+
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_POOL_SIZE,
+    thread_name_prefix="waifu-blocking",
+)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Jalankan fungsi sinkron di thread pool terbatas tanpa memblokir event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, partial(func, *args, **kwargs))
+
+
+def shutdown_blocking_pool() -> None:
+    """Dipanggil saat shutdown aplikasi."""
+    _blocking_executor.shutdown(wait=False, cancel_futures=True)
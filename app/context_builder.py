@@ -0,0 +1,94 @@
+import os
+import math
+import logging
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from app.history_cache import HistoryItem
+
+logger = logging.getLogger(__name__)
+
+# Anggaran token prompt per request (system prompt + ringkasan + konteks RAG + riwayat + pesan baru)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+# Bagian anggaran yang disisihkan untuk chunk hasil retrieval (karakter RAG)
+CONTEXT_RETRIEVAL_TOKEN_BUDGET = int(os.environ.get("CONTEXT_RETRIEVAL_TOKEN_BUDGET", "700"))
+# Perkiraan rata-rata karakter per token (Gemini/SentencePiece, teks Indonesia campur Inggris)
+CONTEXT_CHARS_PER_TOKEN = float(os.environ.get("CONTEXT_CHARS_PER_TOKEN", "4"))
+# Biaya tetap per pesan (penanda peran, pemisah)
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Perkiraan jumlah token tanpa memanggil API (count_tokens Gemini butuh round trip jaringan).
+    Cukup akurat untuk membagi anggaran; angka sebenarnya dicatat dari usage_metadata respons.
+    """
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN) if text else 0
+
+
+def summary_block(summary: str | None) -> str:
+    """Ringkasan percakapan untuk variabel `{summary}` di akhir system prompt."""
+    if not summary:
+        return ""
+    return "\n\nRINGKASAN PERCAKAPAN SEBELUMNYA DENGAN PENGGUNA:\n" + summary
+
+
+def fit_history(history: List[HistoryItem], budget: int) -> List[HistoryItem]:
+    """Ambil pesan terbaru sebanyak yang muat di anggaran (urutan kronologis tetap)."""
+    kept: List[HistoryItem] = []
+    used = 0
+    for item in reversed(history):
+        cost = estimate_tokens(item[1]) + _MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        kept.append(item)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def fit_documents(docs: List[Document], budget: int = CONTEXT_RETRIEVAL_TOKEN_BUDGET) -> str:
+    """
+    Gabungkan chunk retrieval (urut relevansi) sampai anggaran habis; chunk terakhir dipotong
+    jika perlu, sehingga tiga chunk 1000 karakter tidak selalu dikirim utuh.
+    """
+    parts: List[str] = []
+    remaining_chars = int(budget * CONTEXT_CHARS_PER_TOKEN)
+    for doc in docs:
+        if remaining_chars <= 0:
+            break
+        text = doc.page_content[:remaining_chars]
+        parts.append(text)
+        remaining_chars -= len(text) + 2
+    return "\n\n".join(parts)
+
+
+def history_budget(system_tokens: int, latest_input: str, uses_retrieval: bool, budget: int = CONTEXT_TOKEN_BUDGET) -> int:
+    """Sisa anggaran untuk riwayat setelah system prompt (+ ringkasan), konteks RAG, dan pesan baru."""
+    reserved = system_tokens + estimate_tokens(latest_input) + 2 * _MESSAGE_OVERHEAD_TOKENS
+    if uses_retrieval:
+        reserved += CONTEXT_RETRIEVAL_TOKEN_BUDGET
+    return max(0, budget - reserved)
+
+
+def estimate_prompt_tokens(system_tokens: int, context: str, messages: List[BaseMessage]) -> int:
+    total = system_tokens + estimate_tokens(context)
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        total += estimate_tokens(content) + _MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def log_prompt_usage(character_id: str, estimated_tokens: int, response: BaseMessage | None) -> None:
+    """Catat token prompt per request: perkiraan lokal dan angka dari API (jika tersedia)."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    logger.info(
+        f"Prompt {character_id}: perkiraan {estimated_tokens} token, "
+        f"input API {usage.get('input_tokens', '-')}, output API {usage.get('output_tokens', '-')}"
+    )
+
+
+def to_messages(history: List[HistoryItem]) -> List[BaseMessage]:
+    return [HumanMessage(content=content) if role == "human" else AIMessage(content=content) for role, content, _ in history]
@@ -1,12 +1,36 @@
+import os
 from typing import AsyncGenerator
+from dotenv import load_dotenv
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "mysql+asyncmy://root:@127.0.0.1:3306/waifu_db"
+load_dotenv()
 
-async_engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+# MySQL untuk produksi; `sqlite+aiosqlite:///./waifu.db` untuk pengembangan & uji beban lokal
+DATABASE_URL = os.environ.get("DATABASE_URL", "mysql+asyncmy://root:@127.0.0.1:3306/waifu_db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+# Log setiap statement SQL (mahal di jalur request); hanya untuk debugging lokal
+SQL_ECHO = os.environ.get("SQL_ECHO", "false").lower() == "true"
+
+async_engine = create_async_engine(
+    DATABASE_URL,
+    echo=SQL_ECHO,
+    future=True,
+    # SQLite mengunci seluruh file saat menulis; tunggu lock alih-alih langsung gagal
+    connect_args={"timeout": 30} if IS_SQLITE else {},
+)
+
+if IS_SQLITE:
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL: pembaca tidak terblokir oleh penulis; foreign key tidak aktif secara default di SQLite
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 
 # --- PERUBAHAN DI SINI ---
 # Buat sessionmaker sekali saja dan ekspor agar bisa digunakan di file lain
@@ -15,6 +39,17 @@ AsyncSessionLocal = sessionmaker(
     bind=async_engine, class_=AsyncSession, expire_on_commit=False
 )
 
+async def use_read_committed(session: AsyncSession) -> None:
+    """
+    Query baca berat (rekomendasi, snapshot) memakai READ COMMITTED agar tidak menahan snapshot
+    REPEATABLE READ bawaan MySQL. Dialek SQLite tidak mengenal level ini (hanya READ UNCOMMITTED/
+    SERIALIZABLE/AUTOCOMMIT), jadi di SQLite koneksi dipakai apa adanya.
+    """
+    if IS_SQLITE:
+        await session.connection()
+        return
+    await session.connection(execution_options={"isolation_level": "READ COMMITTED"})
+
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     """
     Fungsi ini sekarang khusus untuk dependency injection FastAPI per-request.
@@ -25,6 +60,9 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
 async def create_db_and_tables():
     async with async_engine.begin() as conn:
         # Impor semua model Anda di sini agar terdeteksi oleh SQLModel
-        from app.models import User, Interaction, ChatMessage
+        from app.models import User, Interaction, ChatMessage, UserEmbedding, UserRecommendation, ConversationSummary, SchemaMigration
+        from app.migrations import run_migrations
         await conn.run_sync(SQLModel.metadata.create_all)
+        # create_all tidak mengubah tabel yang sudah ada (misal menambah indeks), jadi lewat migrasi
+        await conn.run_sync(run_migrations)
 
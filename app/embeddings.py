@@ -0,0 +1,191 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.metrics import STAGE_SECONDS, span
+from app.resources import LazyResource
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# Batas jumlah teks per panggilan model.encode
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get("EMBEDDING_MAX_BATCH_SIZE", "64"))
+# Jendela waktu untuk mengumpulkan permintaan paralel menjadi satu batch
+EMBEDDING_BATCH_WINDOW_MS = float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", "5"))
+
+
+@dataclass
+class _EncodeRequest:
+    texts: List[str]
+    future: Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingService:
+    """
+    Satu model SentenceTransformer untuk seluruh proses (retrieval RAG & recommender).
+    Permintaan encode dari banyak thread/coroutine dikumpulkan oleh satu thread batcher
+    dalam jendela waktu singkat, lalu di-encode sekaligus (micro-batching).
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        batch_window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+    ):
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        # Impor di sini: sentence_transformers menarik torch, yang lambat di-import
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self._queue: queue.Queue[_EncodeRequest] = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.max_batch_seen = 0
+        self.queue_wait_seconds_total = 0.0
+        self.queue_wait_seconds_max = 0.0
+        self.encode_seconds_total = 0.0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        future: Future = Future()
+        if not texts:
+            future.set_result(np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32))
+            return future
+        self._queue.put(_EncodeRequest(list(texts), future))
+        return future
+
+    def encode(self, texts: str | List[str]) -> np.ndarray:
+        """Versi sinkron (untuk thread pool / retriever). String tunggal -> vektor 1-D."""
+        if isinstance(texts, str):
+            return self.submit([texts]).result()[0]
+        return self.submit(texts).result()
+
+    async def aencode(self, texts: str | List[str]) -> np.ndarray:
+        """Versi async; tidak memblokir event loop dan tidak memakai thread pool umum."""
+        with span("embedding"):
+            if isinstance(texts, str):
+                return (await asyncio.wrap_future(self.submit([texts])))[0]
+            return await asyncio.wrap_future(self.submit(texts))
+
+    def _collect_batch(self) -> List[_EncodeRequest]:
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.perf_counter() + self.batch_window
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._process_batch(batch)
+            except Exception as e:
+                # Satu batch bermasalah tidak boleh mematikan thread; tanpa thread ini semua encode menggantung
+                logger.exception("Batch embedding gagal diproses.")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def _process_batch(self, batch: List[_EncodeRequest]) -> None:
+        # Future milik request yang sudah dibatalkan (klien putus / timeout) dilewati; set_result
+        # pada future yang dibatalkan akan melempar InvalidStateError
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        texts = [text for request in batch for text in request.texts]
+        try:
+            vectors = np.asarray(self.model.encode(texts, batch_size=self.max_batch_size), dtype=np.float32)
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        encode_seconds = time.perf_counter() - started
+        STAGE_SECONDS.labels("embedding_batch").observe(encode_seconds)
+
+        offset = 0
+        for request in batch:
+            request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+            self.max_batch_seen = max(self.max_batch_seen, len(texts))
+            self.encode_seconds_total += encode_seconds
+            for request in batch:
+                wait = started - request.enqueued_at
+                self.queue_wait_seconds_total += wait
+                self.queue_wait_seconds_max = max(self.queue_wait_seconds_max, wait)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "batches": self.batches,
+                "requests": self.requests,
+                "texts": self.texts,
+                "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_seen,
+                "avg_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+                "avg_queue_wait_ms": 1000 * self.queue_wait_seconds_total / self.requests if self.requests else 0.0,
+                "max_queue_wait_ms": 1000 * self.queue_wait_seconds_max,
+                "encode_seconds_total": round(self.encode_seconds_total, 6),
+                "queue_depth": self._queue.qsize(),
+            }
+
+
+class ServiceEmbeddings(Embeddings):
+    """Adapter LangChain agar FAISS memakai EmbeddingService yang sama."""
+
+    def __init__(self, service: EmbeddingService):
+        self.service = service
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.service.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.service.encode(text).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return (await self.service.aencode(texts)).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.service.aencode(text)).tolist()
+
+
+embedding_service = LazyResource(
+    "embedding_model",
+    EmbeddingService,
+    warmup=lambda service: service.encode("warmup"),
+)
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Akses singleton EmbeddingService; model dimuat sekali per proses saat pertama dibutuhkan."""
+    return embedding_service.get()
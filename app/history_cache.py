@@ -0,0 +1,145 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, List, Tuple
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+# Jumlah pesan terakhir yang dikirim ke agent sebagai memori percakapan
+CHAT_HISTORY_WINDOW = int(os.environ.get("CHAT_HISTORY_WINDOW", "20"))
+HISTORY_CACHE_MAX_ENTRIES = int(os.environ.get("HISTORY_CACHE_MAX_ENTRIES", "5000"))
+# Batas umur jendela di cache: pesan yang ditulis worker lain terlihat paling lambat setelah ini
+HISTORY_CACHE_TTL_SECONDS = float(os.environ.get("HISTORY_CACHE_TTL_SECONDS", "30"))
+# Cache hanya melihat tulisan worker-nya sendiri, jadi bawaannya mati jika uvicorn dijalankan
+# dengan beberapa worker (WEB_CONCURRENCY > 1); bisa dipaksa lewat HISTORY_CACHE_ENABLED
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+HISTORY_CACHE_ENABLED = os.environ.get("HISTORY_CACHE_ENABLED", str(WEB_CONCURRENCY <= 1)).lower() == "true"
+
+ConversationKey = Tuple[int, str]
+# (role, content, timestamp), urut dari yang terlama
+HistoryItem = Tuple[str, str, datetime]
+
+
+async def fetch_history_window(session: AsyncSession, user_id: int, character_id: str, limit: int = CHAT_HISTORY_WINDOW) -> List[HistoryItem]:
+    """N pesan terakhir satu percakapan; memakai indeks (user_id, character_id, timestamp)."""
+    stmt = select(ChatMessage.role, ChatMessage.content, ChatMessage.timestamp).where(
+        ChatMessage.user_id == user_id,
+        ChatMessage.character_id == character_id,
+    ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit)
+    result = await session.exec(stmt)
+    rows = result.all()
+    rows.reverse()
+    return [(role, content, timestamp) for role, content, timestamp in rows]
+
+
+@dataclass
+class _CacheEntry:
+    expires_at: float
+    window: Deque[HistoryItem]
+
+
+class ConversationWindowCache:
+    """
+    LRU per (user_id, character_id) berisi jendela pesan terakhir percakapan.
+    Diperbarui write-through saat pesan baru disimpan, sehingga percakapan yang sedang aktif
+    tidak membaca ulang riwayat dari MySQL. Hanya dipakai dari event loop (tanpa lock).
+    Write-through hanya melihat pesan dari proses ini; entri kedaluwarsa setelah TTL agar pesan
+    dari worker lain tidak hilang selamanya, dan cache mati bawaan pada deployment multi-worker.
+    """
+
+    def __init__(
+        self,
+        window: int = CHAT_HISTORY_WINDOW,
+        max_entries: int = HISTORY_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = HISTORY_CACHE_TTL_SECONDS,
+        enabled: bool = HISTORY_CACHE_ENABLED,
+    ):
+        self.window = window
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled and ttl_seconds > 0
+        self._entries: OrderedDict[ConversationKey, _CacheEntry] = OrderedDict()
+        # Percakapan yang sedang dimuat dari DB -> True jika ada pesan baru selama pemuatan
+        self._loading: dict[ConversationKey, bool] = {}
+        self.hits = 0
+        self.misses = 0
+        self.db_queries = 0
+        self.db_seconds_total = 0.0
+        self.evictions = 0
+        self.expirations = 0
+        self.appends = 0
+
+    async def get_or_load(self, key: ConversationKey, loader: Callable[[], Awaitable[List[HistoryItem]]]) -> List[HistoryItem]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry.window)
+            del self._entries[key]
+            self.expirations += 1
+
+        self.misses += 1
+        self.db_queries += 1
+        self._loading[key] = False
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            items = await loader()
+        finally:
+            self.db_seconds_total += loop.time() - started
+            stale = self._loading.pop(key, False)
+        # Jika pesan baru ditulis selama query berjalan, hasil query bisa tertinggal; jangan di-cache
+        if self.enabled and not stale and key not in self._entries:
+            self._store(key, items)
+        return items
+
+    def append(self, key: ConversationKey, items: List[HistoryItem]) -> None:
+        """Write-through: tambahkan pesan baru ke jendela yang sudah di-cache."""
+        if key in self._loading:
+            self._loading[key] = True
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.window.extend(items)
+        self._entries.move_to_end(key)
+        self.appends += 1
+
+    def invalidate(self, key: ConversationKey) -> None:
+        self._entries.pop(key, None)
+        if key in self._loading:
+            self._loading[key] = True
+
+    def _store(self, key: ConversationKey, items: List[HistoryItem]) -> None:
+        self._entries[key] = _CacheEntry(time.monotonic() + self.ttl_seconds, deque(items, maxlen=self.window))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "db_queries": self.db_queries,
+            "avg_db_query_ms": 1000 * self.db_seconds_total / self.db_queries if self.db_queries else 0.0,
+            "appends": self.appends,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+conversation_cache = ConversationWindowCache()
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Tuple
+
+from app.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Lowongan jarang berubah dalam hitungan menit; 0 = cache dimatikan
+JOB_SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("JOB_SEARCH_CACHE_TTL_SECONDS", "1800"))
+JOB_SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("JOB_SEARCH_CACHE_MAX_ENTRIES", "2000"))
+# File JSON untuk menyimpan cache antar restart (kosong = hanya in-memory)
+JOB_SEARCH_CACHE_PATH = os.environ.get("JOB_SEARCH_CACHE_PATH", "")
+# Entri baru ditulis ke file paling sering sekali per interval ini, dan sekali lagi saat shutdown
+JOB_SEARCH_CACHE_FLUSH_SECONDS = float(os.environ.get("JOB_SEARCH_CACHE_FLUSH_SECONDS", "60"))
+
+SearchKey = Tuple[str, str]
+
+
+def normalize_key(query: str, location: str) -> SearchKey:
+    """`"Lowongan  Python"`, `"lowongan python "` -> kunci yang sama."""
+    return " ".join(query.lower().split()), " ".join(location.lower().split())
+
+
+@dataclass
+class _CacheEntry:
+    # Waktu wall-clock (bukan monotonic) agar tetap bermakna setelah dibaca ulang dari disk
+    expires_at: float
+    value: dict
+
+
+class JobSearchCache:
+    """
+    Cache TTL hasil pencarian lowongan per (query, lokasi) yang dinormalisasi.
+    - Pencarian paralel dengan kunci sama digabung menjadi satu panggilan keluar (single-flight).
+    - Respons error dari provider tidak di-cache.
+    - Opsional disimpan ke file JSON: dimuat saat `start`, ditulis atomik di thread pool
+      paling sering sekali per `flush_seconds` jika ada entri baru, dan saat `stop`.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = JOB_SEARCH_CACHE_TTL_SECONDS,
+        max_entries: int = JOB_SEARCH_CACHE_MAX_ENTRIES,
+        path: str = JOB_SEARCH_CACHE_PATH,
+        flush_seconds: float = JOB_SEARCH_CACHE_FLUSH_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._entries: OrderedDict[SearchKey, _CacheEntry] = OrderedDict()
+        self._inflight: dict[SearchKey, asyncio.Task] = {}
+        # Ada entri baru yang belum ditulis ke file
+        self._dirty = False
+        self._task: asyncio.Task | None = None
+        self._save_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.fetch_seconds_total = 0.0
+
+    def get(self, key: SearchKey) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def set(self, key: SearchKey, value: dict) -> None:
+        self._entries[key] = _CacheEntry(time.time() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, key: SearchKey, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        start = time.perf_counter()
+        try:
+            value = await fetch()
+        finally:
+            self.fetches += 1
+            self.fetch_seconds_total += time.perf_counter() - start
+        if self.ttl_seconds > 0 and "error" not in value:
+            self.set(key, value)
+            self._dirty = True
+        return value
+
+    async def get_or_fetch(self, query: str, location: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        key = normalize_key(query, location)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: pembatalan satu request tidak membatalkan pencarian milik request lain
+        return await asyncio.shield(task)
+
+    async def start(self) -> None:
+        """Muat file cache (di thread pool) lalu jalankan flusher periodik."""
+        if not self.path or self._task is not None:
+            return
+        await self._load_from_disk()
+        self._task = asyncio.create_task(self._run(), name="job-search-cache-flusher")
+
+    async def stop(self) -> None:
+        """Hentikan flusher lalu tulis entri yang belum tersimpan."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._save_to_disk()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self._save_to_disk()
+
+    async def _load_from_disk(self) -> None:
+        try:
+            rows = await run_blocking(_read_json, self.path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache pencarian kerja {self.path} tidak bisa dibaca, diabaikan: {e}")
+            return
+        if rows is None:
+            return
+        now = time.time()
+        for row in rows:
+            key = (row["query"], row["location"])
+            # Entri yang sudah di-set sejak startup lebih baru daripada isi file
+            if row["expires_at"] > now and key not in self._entries:
+                self._entries[key] = _CacheEntry(row["expires_at"], row["value"])
+        logger.info(f"Cache pencarian kerja: {len(self._entries)} entri dimuat dari {self.path}")
+
+    async def _save_to_disk(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        rows = [
+            {"query": key[0], "location": key[1], "expires_at": entry.expires_at, "value": entry.value}
+            for key, entry in self._entries.items()
+        ]
+        async with self._save_lock:
+            try:
+                await run_blocking(_write_json_atomic, self.path, rows)
+            except OSError as e:
+                # Dicoba lagi pada flush berikutnya
+                self._dirty = True
+                logger.warning(f"Gagal menyimpan cache pencarian kerja ke {self.path}: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "fetches": self.fetches,
+            "fetch_seconds_avg": self.fetch_seconds_total / self.fetches if self.fetches else 0.0,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "persisted": bool(self.path),
+        }
+
+
+def _read_json(path: str) -> list | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json_atomic(path: str, rows: list) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+job_search_cache = JobSearchCache()
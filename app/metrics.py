@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# Level log aplikasi; DEBUG menampilkan jejak per giliran chat (node, alat, skor rekomendasi)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Header Server-Timing berisi durasi tiap tahap (bisa dimatikan jika tidak ingin diekspos ke klien)
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
+# Tahap pipeline chat/rekomendasi berlangsung dari ~1 ms (cache) sampai puluhan detik (LLM)
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "waifu_stage_duration_seconds",
+    "Durasi tahap pipeline (history, retrieval, llm, tool, persist, recommendation, embedding)",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "waifu_http_request_duration_seconds",
+    "Durasi request HTTP sampai header response dikirim",
+    ["method", "route", "status"],
+    buckets=_BUCKETS,
+)
+STAGE_ERRORS = Counter("waifu_stage_errors_total", "Tahap pipeline yang berakhir dengan exception", ["stage"])
+
+# Span milik request yang sedang berjalan: [(tahap, detik)]; None di luar request HTTP
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Catat durasi satu tahap ke histogram dan ke Server-Timing request aktif (jika ada)."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """`with span("retrieval"): ...` — bisa dipakai di kode sync maupun di dalam coroutine."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def server_timing_header(spans: List[Tuple[str, float]], total: float) -> str:
+    # Tahap yang terjadi berulang (misal embedding) dijumlahkan jadi satu entri
+    totals: dict[str, float] = {}
+    for stage, seconds in spans:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TimingMiddleware:
+    """
+    Middleware ASGI: menyiapkan wadah span per request, menambahkan header `Server-Timing`
+    dan mencatat durasi request ke histogram per route (template path, bukan URL mentah).
+    Untuk response streaming (SSE) header dikirim di awal, jadi hanya memuat tahap sebelum
+    token pertama (history, retrieval); tahap sesudahnya tetap tercatat di /metrics.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                route = scope.get("route")
+                REQUEST_SECONDS.labels(
+                    scope["method"], getattr(route, "path", "unmatched"), str(message["status"])
+                ).observe(elapsed)
+                if SERVER_TIMING_ENABLED:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(spans, elapsed).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def configure_logging() -> None:
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        force=True,
+    )
@@ -0,0 +1,69 @@
+"""
+Migrasi skema sederhana untuk tabel yang sudah ada di database.
+
+`SQLModel.metadata.create_all` hanya membuat tabel baru, tidak menambah indeks/kolom ke tabel lama.
+Setiap migrasi dijalankan sekali (dicatat di tabel `schemamigration`) dan juga aman dijalankan ulang.
+Dipanggil otomatis dari `create_db_and_tables`, atau manual:
+
+    python -m app.migrations
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import inspect, insert, select
+from sqlalchemy.engine import Connection
+
+from app.models import ChatMessage, SchemaMigration
+
+logger = logging.getLogger(__name__)
+
+
+def _create_index_if_missing(conn: Connection, index) -> None:
+    existing = {ix["name"] for ix in inspect(conn).get_indexes(index.table.name)}
+    if index.name in existing:
+        logger.info(f"Indeks {index.name} sudah ada.")
+        return
+    logger.info(f"Membuat indeks {index.name} pada tabel {index.table.name}...")
+    index.create(conn)
+
+
+def _chatmessage_history_index(conn: Connection) -> None:
+    """Indeks komposit untuk query jendela riwayat chat (WHERE user_id, character_id ORDER BY timestamp)."""
+    index = next(ix for ix in ChatMessage.__table__.indexes if ix.name == "ix_chatmessage_user_character_timestamp")
+    _create_index_if_missing(conn, index)
+
+
+def _chatmessage_timestamp_index(conn: Connection) -> None:
+    """Indeks waktu untuk ekspor inkremental snapshot rekomendasi (WHERE timestamp > watermark)."""
+    index = next(ix for ix in ChatMessage.__table__.indexes if ix.name == "ix_chatmessage_timestamp")
+    _create_index_if_missing(conn, index)
+
+
+MIGRATIONS: list[tuple[str, Callable[[Connection], None]]] = [
+    ("0001_chatmessage_history_index", _chatmessage_history_index),
+    ("0002_chatmessage_timestamp_index", _chatmessage_timestamp_index),
+]
+
+
+def run_migrations(conn: Connection) -> list[str]:
+    """Jalankan migrasi yang belum tercatat. Dipanggil lewat `AsyncConnection.run_sync`."""
+    table = SchemaMigration.__table__
+    applied = set(conn.execute(select(table.c.id)).scalars())
+    ran = []
+    for migration_id, migrate in MIGRATIONS:
+        if migration_id in applied:
+            continue
+        migrate(conn)
+        conn.execute(insert(table).values(id=migration_id, applied_at=datetime.utcnow()))
+        ran.append(migration_id)
+        logger.info(f"Migrasi {migration_id} selesai.")
+    return ran
+
+
+if __name__ == "__main__":
+    from app.db import create_db_and_tables
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(create_db_and_tables())
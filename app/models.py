@@ -3,7 +3,7 @@ from sqlmodel import Field, SQLModel
 from fastapi_users_db_sqlmodel import SQLModelBaseUserDB
 from fastapi_users.schemas import BaseUser, BaseUserCreate, BaseUserUpdate
 from datetime import datetime
-from sqlalchemy import Column, TEXT # <-- 1. Tambahkan impor ini
+from sqlalchemy import Column, Index, TEXT, LargeBinary # <-- 1. Tambahkan impor ini
 
 
 # === MODEL DATABASE ===
@@ -52,6 +52,13 @@ class InteractionCreate(SQLModel):
 
 # === MODEL UNTUK MEMORI CHAT ===
 class ChatMessage(SQLModel, table=True):
+    # Jendela riwayat dibaca per (user, karakter) urut waktu; lihat migrasi 0001 di app/migrations.py
+    # Ekspor snapshot rekomendasi membaca pesan baru per rentang waktu; lihat migrasi 0002
+    __table_args__ = (
+        Index("ix_chatmessage_user_character_timestamp", "user_id", "character_id", "timestamp"),
+        Index("ix_chatmessage_timestamp", "timestamp"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
     character_id: str
@@ -60,3 +67,40 @@ class ChatMessage(SQLModel, table=True):
     content: str = Field(sa_column=Column(TEXT))
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+
+
+# === MODEL UNTUK VEKTOR PROFIL USER (REKOMENDASI) ===
+class UserEmbedding(SQLModel, table=True):
+    """
+    Rata-rata berjalan (opsional dengan peluruhan waktu) dari embedding pesan user.
+    Diperbarui secara inkremental setiap ada ChatMessage baru.
+    """
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    vector: bytes = Field(sa_column=Column(LargeBinary))  # float32, little-endian
+    weight: float = Field(default=0.0)  # total bobot efektif setelah peluruhan
+    message_count: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# === MODEL UNTUK HASIL REKOMENDASI YANG DIHITUNG DI BACKGROUND ===
+class UserRecommendation(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    character_ids: str  # JSON list id karakter, urut dari skor tertinggi
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# === MODEL UNTUK RINGKASAN BERGULIR PERCAKAPAN ===
+class ConversationSummary(SQLModel, table=True):
+    """Ringkasan semua pesan percakapan sampai `covered_until`; pesan setelahnya dikirim apa adanya."""
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    character_id: str = Field(primary_key=True, max_length=64)
+    summary: str = Field(sa_column=Column(TEXT))
+    covered_until: datetime
+    message_count: int = Field(default=0)  # jumlah pesan yang sudah diringkas
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# === MODEL UNTUK MENCATAT MIGRASI SKEMA YANG SUDAH DIJALANKAN ===
+class SchemaMigration(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,257 @@
+"""
+Provider LLM dan pencarian kerja yang bisa diganti lewat environment.
+
+- LLM_PROVIDER=gemini (default) | stub
+- JOB_SEARCH_PROVIDER=serpapi (default) | stub
+
+Provider `stub` bersifat deterministik (jawaban sama untuk input yang sama), tanpa jaringan dan
+tanpa kuota, dengan latensi & jumlah token yang bisa diatur. Dipakai untuk uji beban (loadtest.py)
+dan benchmark.
+"""
+import os
+import json
+import logging
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.job_search_cache import JobSearchCache, job_search_cache
+from app.resources import LazyResource
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini").lower()
+JOB_SEARCH_PROVIDER = os.environ.get("JOB_SEARCH_PROVIDER", "serpapi").lower()
+
+# Stub LLM: latensi sebelum token pertama, jumlah token jawaban, jeda antar token saat streaming
+STUB_LLM_LATENCY_MS = float(os.environ.get("STUB_LLM_LATENCY_MS", "500"))
+STUB_LLM_OUTPUT_TOKENS = int(os.environ.get("STUB_LLM_OUTPUT_TOKENS", "60"))
+STUB_LLM_TOKEN_DELAY_MS = float(os.environ.get("STUB_LLM_TOKEN_DELAY_MS", "10"))
+# SerpAPI: base URL (arahkan ke fake_serpapi.py untuk uji lokal), timeout & ukuran pool koneksi
+SERPAPI_BASE_URL = os.environ.get("SERPAPI_BASE_URL", "https://serpapi.com")
+SERPAPI_TIMEOUT_SECONDS = float(os.environ.get("SERPAPI_TIMEOUT_SECONDS", "10"))
+SERPAPI_MAX_CONNECTIONS = int(os.environ.get("SERPAPI_MAX_CONNECTIONS", "20"))
+# Stub pencarian kerja
+STUB_JOB_SEARCH_LATENCY_MS = float(os.environ.get("STUB_JOB_SEARCH_LATENCY_MS", "300"))
+STUB_JOB_SEARCH_RESULTS = int(os.environ.get("STUB_JOB_SEARCH_RESULTS", "5"))
+
+# Kata kunci yang membuat stub LLM memanggil job_search_tool (meniru aturan di prompt Hinata)
+_JOB_KEYWORDS = ("lowongan", "loker", "cari kerja", "job")
+_STUB_VOCABULARY = (
+    "ehehe~ kamu pasti bisa kok semangat belajar karir python javascript data model portofolio "
+    "latihan proyek wawancara cv linkedin konsep dasar fungsi variabel algoritma umm itu menarik "
+    "coba langkah berikutnya pelan-pelan ya aku bantu jelaskan contoh sederhana"
+).split()
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, default=str)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    LLM palsu deterministik. Jika di-`bind_tools` dengan job_search_tool dan pesan terakhir berisi
+    kata kunci lowongan, model mengembalikan tool call (jalur tool di graph ikut teruji).
+    Mode `blocking` meniru klien sinkron yang memblokir event loop (untuk benchmark).
+    """
+    latency: float = STUB_LLM_LATENCY_MS / 1000
+    output_tokens: int = STUB_LLM_OUTPUT_TOKENS
+    token_delay: float = STUB_LLM_TOKEN_DELAY_MS / 1000
+    blocking: bool = False
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any) -> "StubChatModel":
+        names = [getattr(t, "name", None) or getattr(t, "__name__", str(t)) for t in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        last = _message_text(messages[-1]) if messages else ""
+        digest = _digest(last)
+        input_tokens = sum(len(_message_text(m)) for m in messages) // 4
+        if "job_search_tool" in self.tool_names and messages[-1].type == "human" and any(k in last.lower() for k in _JOB_KEYWORDS):
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": "job_search_tool", "args": {"query": last[:80], "location": "Indonesia"}, "id": f"call_{digest[:12]}"}],
+                usage_metadata={"input_tokens": input_tokens, "output_tokens": 10, "total_tokens": input_tokens + 10},
+            )
+        rng = random.Random(int(digest[:16], 16))
+        words = [rng.choice(_STUB_VOCABULARY) for _ in range(self.output_tokens)]
+        return AIMessage(
+            content=" ".join(words),
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": self.output_tokens, "total_tokens": input_tokens + self.output_tokens},
+        )
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            time.sleep(self.token_delay)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._reply(messages)):
+            await asyncio.sleep(self.token_delay)
+            yield chunk
+
+    @staticmethod
+    def _chunks(reply: AIMessage) -> List[ChatGenerationChunk]:
+        if reply.tool_calls:
+            call = reply.tool_calls[0]
+            return [ChatGenerationChunk(message=AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}],
+                usage_metadata=reply.usage_metadata,
+            ))]
+        words = reply.content.split(" ")
+        chunks = [ChatGenerationChunk(message=AIMessageChunk(content=("" if i == 0 else " ") + word)) for i, word in enumerate(words)]
+        chunks[-1].message.usage_metadata = reply.usage_metadata
+        return chunks
+
+
+def create_llm() -> BaseChatModel:
+    if LLM_PROVIDER == "stub":
+        logger.info("LLM stub (lokal, deterministik) diinisialisasi.")
+        return StubChatModel()
+    if LLM_PROVIDER != "gemini":
+        raise ValueError(f"LLM_PROVIDER tidak dikenal: {LLM_PROVIDER}. Pilihan: gemini, stub")
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    if "GOOGLE_API_KEY" not in os.environ:
+        raise ValueError("GOOGLE_API_KEY environment variable not set.")
+    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.8)
+    logger.info("LLM gemini-2.5-flash diinisialisasi.")
+    return llm
+
+
+class JobSearchUnavailable(Exception):
+    """Provider tidak bisa dipakai (misal API key belum diatur); pesannya ditampilkan ke pengguna."""
+
+
+class SerpApiJobSearch:
+    """
+    Google Jobs via SerpAPI dengan httpx async: koneksi di-pool (keep-alive) dan setiap panggilan
+    dibatasi timeout. `SERPAPI_BASE_URL` bisa diarahkan ke server palsu lokal (fake_serpapi.py).
+    Mengembalikan dict mentah SerpAPI (kunci `jobs_results`).
+    """
+
+    def __init__(self, base_url: str = SERPAPI_BASE_URL, timeout: float = SERPAPI_TIMEOUT_SECONDS):
+        self.base_url = base_url
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(max_connections=SERPAPI_MAX_CONNECTIONS, max_keepalive_connections=SERPAPI_MAX_CONNECTIONS),
+            )
+        return self._client
+
+    async def search(self, query: str, location: str) -> dict:
+        api_key = os.environ.get("SERPAPI_API_KEY")
+        if not api_key:
+            raise JobSearchUnavailable("⚠️ SERPAPI_API_KEY belum diatur di environment.")
+
+        params = {
+            "engine": "google_jobs",
+            "q": query,
+            "location": location,
+            "hl": "id",
+            "gl": "id",
+            "api_key": api_key,
+        }
+        try:
+            response = await self._get_client().get("/search.json", params=params)
+        except httpx.TimeoutException:
+            raise JobSearchUnavailable("⏱️ Pencarian lowongan sedang lambat, coba lagi sebentar lagi ya.")
+        # SerpAPI mengirim {"error": ...} untuk kuota habis / query tidak valid; biarkan diteruskan
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response.json()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class StubJobSearch:
+    """Hasil lowongan palsu deterministik dengan format yang sama seperti SerpAPI."""
+
+    def __init__(self, latency: float = STUB_JOB_SEARCH_LATENCY_MS / 1000, num_results: int = STUB_JOB_SEARCH_RESULTS):
+        self.latency = latency
+        self.num_results = num_results
+
+    async def search(self, query: str, location: str) -> dict:
+        await asyncio.sleep(self.latency)
+        digest = _digest(f"{query}|{location}")[:10]
+        return {"jobs_results": [
+            {
+                "title": f"{query.strip().title()} ({i})",
+                "company_name": f"PT Contoh Teknologi {i}",
+                "location": location,
+                "job_id": f"stub-{digest}-{i}",
+            }
+            for i in range(1, self.num_results + 1)
+        ]}
+
+
+class CachedJobSearch:
+    """Provider pencarian kerja + cache TTL & single-flight (lihat app/job_search_cache.py)."""
+
+    def __init__(self, provider, cache: JobSearchCache = job_search_cache):
+        self.provider = provider
+        self.cache = cache
+
+    async def search(self, query: str, location: str) -> dict:
+        return await self.cache.get_or_fetch(query, location, lambda: self.provider.search(query, location))
+
+    async def aclose(self) -> None:
+        close = getattr(self.provider, "aclose", None)
+        if close is not None:
+            await close()
+
+
+def create_job_search() -> CachedJobSearch:
+    if JOB_SEARCH_PROVIDER == "stub":
+        return CachedJobSearch(StubJobSearch())
+    if JOB_SEARCH_PROVIDER != "serpapi":
+        raise ValueError(f"JOB_SEARCH_PROVIDER tidak dikenal: {JOB_SEARCH_PROVIDER}. Pilihan: serpapi, stub")
+    return CachedJobSearch(SerpApiJobSearch())
+
+
+llm_resource = LazyResource("llm", create_llm)
+# Opsional: tanpa pencarian kerja, alat mengembalikan pesan "tidak tersedia" dan chat tetap jalan
+job_search_resource = LazyResource("job_search", create_job_search, required=False)
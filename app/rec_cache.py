@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+REC_CACHE_TTL_SECONDS = float(os.environ.get("REC_CACHE_TTL_SECONDS", "300"))
+REC_CACHE_MAX_ENTRIES = int(os.environ.get("REC_CACHE_MAX_ENTRIES", "10000"))
+
+
+@dataclass
+class _CacheEntry:
+    version: int
+    expires_at: float
+    value: list[str]
+
+
+class RecommendationCache:
+    """
+    Cache hasil rekomendasi per user.
+    - Entri tidak valid jika versi user berubah (`bump` dipanggil setelah chat baru di-commit)
+      atau TTL habis (skor kolaboratif ikut berubah saat user lain chat).
+    - Permintaan paralel untuk user & versi yang sama digabung menjadi satu komputasi (single-flight).
+    """
+
+    def __init__(self, ttl_seconds: float = REC_CACHE_TTL_SECONDS, max_entries: int = REC_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._versions: dict[int, int] = {}
+        self._entries: OrderedDict[int, _CacheEntry] = OrderedDict()
+        self._inflight: dict[tuple[int, int], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.computations = 0
+        self.compute_seconds_total = 0.0
+
+    def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int) -> None:
+        """Tandai data user berubah; entri cache lama otomatis dianggap basi."""
+        self._versions[user_id] = self.version(user_id) + 1
+        self._entries.pop(user_id, None)
+
+    def get(self, user_id: int) -> list[str] | None:
+        entry = self._entries.get(user_id)
+        if entry is None or entry.version != self.version(user_id) or entry.expires_at < time.monotonic():
+            return None
+        self._entries.move_to_end(user_id)
+        return entry.value
+
+    def set(self, user_id: int, value: list[str], version: int | None = None) -> None:
+        version = self.version(user_id) if version is None else version
+        if version != self.version(user_id):
+            # Data user sudah berubah selama komputasi, jangan simpan hasil basi
+            return
+        self._entries[user_id] = _CacheEntry(version, time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _compute(self, user_id: int, version: int, compute: Callable[[], Awaitable[list[str]]]) -> list[str]:
+        start = time.perf_counter()
+        try:
+            value = await compute()
+        finally:
+            self.computations += 1
+            self.compute_seconds_total += time.perf_counter() - start
+        self.set(user_id, value, version)
+        return value
+
+    async def get_or_compute(
+        self,
+        user_id: int,
+        compute: Callable[[], Awaitable[list[str]]],
+        record_stats: bool = True,
+    ) -> list[str]:
+        """`record_stats=False` untuk pemanggil internal (worker) agar hit rate mencerminkan request user."""
+        cached = self.get(user_id)
+        if cached is not None:
+            self.hits += record_stats
+            return cached
+
+        self.misses += record_stats
+        key = (user_id, self.version(user_id))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(user_id, key[1], compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += record_stats
+        # shield: pembatalan satu request tidak membatalkan komputasi milik request lain
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "computations": self.computations,
+            "compute_seconds_total": round(self.compute_seconds_total, 6),
+            "compute_seconds_avg": self.compute_seconds_total / self.computations if self.computations else 0.0,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+        }
+
+
+recommendation_cache = RecommendationCache()
@@ -0,0 +1,413 @@
+"""
+Snapshot analitik untuk recommender: agregat interaksi user x karakter dan vektor profil user
+dalam file Arrow IPC (kolumnar, tanpa kompresi) yang dibaca lewat memory map.
+
+Jalur rekomendasi membaca snapshot ini alih-alih men-scan tabel ChatMessage/UserEmbedding di
+MySQL yang sama dengan trafik chat. Ekspor bersifat inkremental: hanya pesan dengan id di atas
+watermark `covered_id` yang diagregasi lalu digabung dengan snapshot sebelumnya. Id dialokasikan
+saat INSERT, jadi pesan yang tertahan di antrean write-behind tetap masuk di ekspor berikutnya.
+
+    python -m app.rec_snapshot export          # inkremental (otomatis tiap 5 menit di proses API)
+    python -m app.rec_snapshot export --full   # bangun ulang dari seluruh riwayat
+    python -m app.rec_snapshot status
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import logging
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+from prometheus_client import Gauge
+from sqlalchemy import func
+from sqlmodel import select
+
+from app.concurrency import run_blocking
+from app.db import AsyncSessionLocal, use_read_committed
+from app.models import ChatMessage, UserEmbedding
+
+logger = logging.getLogger(__name__)
+
+REC_SNAPSHOT_DIR = os.environ.get("REC_SNAPSHOT_DIR", "rec_snapshot")
+# Rekomendasi memakai snapshot jika tersedia (false = selalu query database seperti sebelumnya)
+REC_SNAPSHOT_ENABLED = os.environ.get("REC_SNAPSHOT_ENABLED", "true").lower() == "true"
+# Snapshot lebih tua dari ini ditandai basi dan tidak dipakai (rekomendasi kembali query database)
+REC_SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get("REC_SNAPSHOT_MAX_AGE_SECONDS", "900"))
+# Interval pengecekan file snapshot baru oleh worker API
+REC_SNAPSHOT_CHECK_SECONDS = float(os.environ.get("REC_SNAPSHOT_CHECK_SECONDS", "30"))
+# Ekspor periodik di dalam proses API (0 = mati, misal jika CLI dijalankan via cron). Antar worker
+# dikoordinasikan lewat file lock, jadi hanya satu proses yang mengekspor pada satu waktu.
+REC_SNAPSHOT_EXPORT_INTERVAL_SECONDS = float(os.environ.get("REC_SNAPSHOT_EXPORT_INTERVAL_SECONDS", "300"))
+# Setiap N ekspor periodik dibangun ulang penuh, menutup celah id dari transaksi yang commit
+# belakangan dengan id lebih kecil dari watermark (0 = selalu inkremental)
+REC_SNAPSHOT_FULL_EVERY = int(os.environ.get("REC_SNAPSHOT_FULL_EVERY", "12"))
+# Lock ekspor yang lebih tua dari ini dianggap milik proses yang mati
+REC_SNAPSHOT_LOCK_STALE_SECONDS = float(os.environ.get("REC_SNAPSHOT_LOCK_STALE_SECONDS", "600"))
+
+META_FILENAME = "meta.json"
+LOCK_FILENAME = "export.lock"
+INTERACTIONS_FILENAME = "interactions.arrow"
+USER_VECTORS_FILENAME = "user_vectors.arrow"
+
+INTERACTIONS_SCHEMA = pa.schema([
+    ("user_id", pa.int64()),
+    ("character_id", pa.string()),
+    ("message_count", pa.int64()),
+    ("last_seen", pa.timestamp("us")),
+])
+
+
+def user_vectors_schema(dim: int) -> pa.Schema:
+    return pa.schema([
+        ("user_id", pa.int64()),
+        # Sudah dinormalisasi L2, siap untuk kemiripan kosinus (perkalian titik)
+        ("vector", pa.list_(pa.float32(), dim)),
+        ("message_count", pa.int64()),
+        ("updated_at", pa.timestamp("us")),
+    ])
+
+
+@dataclass
+class SnapshotData:
+    exported_at: datetime
+    covered_id: int
+    user_ids: np.ndarray  # int64, satu per baris `vectors`
+    vectors: np.ndarray  # float32 (n_user, dim), view di atas memory map
+    interaction_user_ids: np.ndarray
+    interaction_character_ids: List[str]
+    interaction_counts: np.ndarray
+    interaction_last_seen: np.ndarray
+
+    @property
+    def version(self) -> str:
+        return self.exported_at.isoformat()
+
+
+def read_meta(directory: str = REC_SNAPSHOT_DIR) -> dict | None:
+    path = os.path.join(directory, META_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _read_table(path: str) -> pa.Table:
+    # memory_map + format IPC tanpa kompresi: buffer kolom menunjuk langsung ke page cache
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def _write_table_atomic(table: pa.Table, path: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _write_meta_atomic(meta: dict, directory: str) -> None:
+    path = os.path.join(directory, META_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(directory: str = REC_SNAPSHOT_DIR) -> SnapshotData | None:
+    meta = read_meta(directory)
+    if meta is None:
+        return None
+    vectors_table = _read_table(os.path.join(directory, USER_VECTORS_FILENAME)).combine_chunks()
+    interactions = _read_table(os.path.join(directory, INTERACTIONS_FILENAME)).combine_chunks()
+
+    dim = meta["dim"]
+    vector_column = vectors_table.column("vector")
+    if len(vector_column) and dim:
+        vectors = vector_column.chunk(0).flatten().to_numpy(zero_copy_only=True).reshape(-1, dim)
+    else:
+        vectors = np.zeros((0, dim), dtype=np.float32)
+    return SnapshotData(
+        exported_at=datetime.fromisoformat(meta["exported_at"]),
+        covered_id=meta.get("covered_id", 0),
+        user_ids=vectors_table.column("user_id").to_numpy(),
+        vectors=vectors,
+        interaction_user_ids=interactions.column("user_id").to_numpy(),
+        interaction_character_ids=interactions.column("character_id").to_pylist(),
+        interaction_counts=interactions.column("message_count").to_numpy(),
+        interaction_last_seen=interactions.column("last_seen").to_numpy(),
+    )
+
+
+@contextmanager
+def export_lock(directory: str = REC_SNAPSHOT_DIR) -> Iterator[bool]:
+    """
+    File lock lintas proses (O_EXCL, portabel): True jika lock didapat. Lock basi milik proses
+    yang mati di tengah ekspor diambil alih setelah REC_SNAPSHOT_LOCK_STALE_SECONDS.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, LOCK_FILENAME)
+    try:
+        if time.time() - os.path.getmtime(path) > REC_SNAPSHOT_LOCK_STALE_SECONDS:
+            os.remove(path)
+    except OSError:
+        pass
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        yield False
+        return
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield True
+    finally:
+        with suppress(OSError):
+            os.remove(path)
+
+
+async def export_snapshot(directory: str = REC_SNAPSHOT_DIR, full: bool = False) -> dict:
+    """
+    Tulis snapshot baru. Inkremental: agregasi pesan dengan id > covered_id lalu gabungkan dengan
+    agregat sebelumnya. Vektor user selalu dibaca ulang (satu baris per user).
+    Mengembalikan metadata snapshot. Pemanggil sebaiknya memegang `export_lock`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = None if full else read_meta(directory)
+    # Snapshot format lama (watermark timestamp) dibangun ulang penuh sekali
+    if previous is not None and "covered_id" not in previous:
+        previous = None
+    covered_id = previous["covered_id"] if previous else 0
+    started = time.perf_counter()
+
+    async with AsyncSessionLocal() as session:
+        await use_read_committed(session)
+        stmt = select(
+            ChatMessage.user_id,
+            ChatMessage.character_id,
+            func.count(ChatMessage.id),
+            func.max(ChatMessage.timestamp),
+            func.max(ChatMessage.id),
+        ).where(ChatMessage.id > covered_id).group_by(ChatMessage.user_id, ChatMessage.character_id)
+        new_rows = (await session.exec(stmt)).all()
+        vector_rows = (await session.exec(select(
+            UserEmbedding.user_id, UserEmbedding.vector, UserEmbedding.message_count, UserEmbedding.updated_at
+        ))).all()
+
+    # Penggabungan & penulisan Arrow berjalan O(user + interaksi) di Python; dijalankan di thread
+    # pool agar event loop worker API (chat, SSE) tidak tertahan selama ekspor periodik
+    return await run_blocking(_write_snapshot, directory, previous, covered_id, new_rows, vector_rows, started)
+
+
+def _write_snapshot(
+    directory: str,
+    previous: dict | None,
+    covered_id: int,
+    new_rows: list,
+    vector_rows: list,
+    started: float,
+) -> dict:
+    # Gabungkan agregat lama (dari file snapshot sebelumnya) dengan pesan baru
+    aggregates: dict[tuple[int, str], tuple[int, datetime]] = {}
+    if previous is not None:
+        old = _read_table(os.path.join(directory, INTERACTIONS_FILENAME))
+        for uid, char_id, count, last_seen in zip(*(old.column(name).to_pylist() for name in INTERACTIONS_SCHEMA.names)):
+            aggregates[(uid, char_id)] = (count, last_seen)
+    for uid, char_id, count, last_seen, max_id in new_rows:
+        old_count, old_last_seen = aggregates.get((uid, char_id), (0, last_seen))
+        aggregates[(uid, char_id)] = (old_count + count, max(old_last_seen, last_seen))
+        covered_id = max(covered_id, max_id)
+
+    interactions = pa.table({
+        "user_id": [uid for uid, _ in aggregates],
+        "character_id": [char_id for _, char_id in aggregates],
+        "message_count": [count for count, _ in aggregates.values()],
+        "last_seen": [last_seen for _, last_seen in aggregates.values()],
+    }, schema=INTERACTIONS_SCHEMA)
+
+    if vector_rows:
+        matrix = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector, _, _ in vector_rows])
+        matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        dim = matrix.shape[1]
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+        dim = 0
+    vectors = pa.table({
+        "user_id": pa.array([uid for uid, _, _, _ in vector_rows], pa.int64()),
+        "vector": pa.FixedSizeListArray.from_arrays(pa.array(matrix.astype(np.float32).ravel(), pa.float32()), dim),
+        "message_count": pa.array([count for _, _, count, _ in vector_rows], pa.int64()),
+        "updated_at": pa.array([updated_at for _, _, _, updated_at in vector_rows], pa.timestamp("us")),
+    }, schema=user_vectors_schema(dim))
+
+    _write_table_atomic(interactions, os.path.join(directory, INTERACTIONS_FILENAME))
+    _write_table_atomic(vectors, os.path.join(directory, USER_VECTORS_FILENAME))
+    meta = {
+        "exported_at": datetime.utcnow().isoformat(),
+        "covered_id": covered_id,
+        "mode": "full" if previous is None else "incremental",
+        "new_pairs": len(new_rows),
+        "interactions": interactions.num_rows,
+        "users": vectors.num_rows,
+        "dim": dim,
+        "export_seconds": round(time.perf_counter() - started, 3),
+    }
+    # meta ditulis terakhir: pembaca hanya memuat ulang setelah kedua file baru siap
+    _write_meta_atomic(meta, directory)
+    logger.info(
+        f"Snapshot rekomendasi ({meta['mode']}): {meta['new_pairs']} pasangan baru, "
+        f"{meta['interactions']} interaksi, {meta['users']} user, {meta['export_seconds']:.2f} s"
+    )
+    return meta
+
+
+class RecommendationSnapshot:
+    """
+    Pembaca snapshot untuk proses API: file di-mmap sekali dan dimuat ulang otomatis jika
+    meta.json berubah (dicek paling sering tiap REC_SNAPSHOT_CHECK_SECONDS).
+    """
+
+    def __init__(self, directory: str = REC_SNAPSHOT_DIR, check_seconds: float = REC_SNAPSHOT_CHECK_SECONDS):
+        self.directory = directory
+        self.check_seconds = check_seconds
+        self._data: Optional[SnapshotData] = None
+        self._meta_mtime: float | None = None
+        self._checked_at = 0.0
+        self.loads = 0
+        self.load_failures = 0
+
+    def get(self) -> SnapshotData | None:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_seconds:
+            self._checked_at = now
+            self._reload_if_changed()
+        return self._data
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.path.getmtime(os.path.join(self.directory, META_FILENAME))
+        except OSError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        try:
+            self._data = load_snapshot(self.directory)
+            self._meta_mtime = mtime
+            self.loads += 1
+            logger.info(f"Snapshot rekomendasi dimuat: {len(self._data.user_ids)} user, ekspor {self._data.version}")
+        except Exception as e:
+            self.load_failures += 1
+            logger.error(f"Gagal memuat snapshot rekomendasi dari {self.directory}: {e}")
+
+    def age_seconds(self) -> float | None:
+        if self._data is None:
+            return None
+        return (datetime.utcnow() - self._data.exported_at).total_seconds()
+
+    def get_fresh(self) -> SnapshotData | None:
+        """Snapshot hanya jika umurnya masih di bawah REC_SNAPSHOT_MAX_AGE_SECONDS."""
+        data = self.get()
+        if data is None or self.age_seconds() > REC_SNAPSHOT_MAX_AGE_SECONDS:
+            return None
+        return data
+
+    def stats(self) -> dict:
+        self.get()
+        age = self.age_seconds()
+        return {
+            "enabled": REC_SNAPSHOT_ENABLED,
+            "available": self._data is not None,
+            "exported_at": self._data.version if self._data else None,
+            "covered_id": self._data.covered_id if self._data else None,
+            "age_seconds": age,
+            "stale": age is None or age > REC_SNAPSHOT_MAX_AGE_SECONDS,
+            "users": len(self._data.user_ids) if self._data else 0,
+            "interactions": len(self._data.interaction_user_ids) if self._data else 0,
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+        }
+
+
+class SnapshotExporter:
+    """
+    Ekspor inkremental periodik di dalam proses API (lihat REC_SNAPSHOT_EXPORT_INTERVAL_SECONDS),
+    dengan rebuild penuh setiap REC_SNAPSHOT_FULL_EVERY ekspor. Worker yang tidak mendapat
+    `export_lock` melewati gilirannya.
+    """
+
+    def __init__(self, interval_seconds: float = REC_SNAPSHOT_EXPORT_INTERVAL_SECONDS, full_every: int = REC_SNAPSHOT_FULL_EVERY):
+        self.interval_seconds = interval_seconds
+        self.full_every = full_every
+        self.exports = 0
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if REC_SNAPSHOT_ENABLED and self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="rec-snapshot-exporter")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                with export_lock() as acquired:
+                    if acquired:
+                        full = self.full_every > 0 and self.exports % self.full_every == self.full_every - 1
+                        await export_snapshot(full=full)
+                        self.exports += 1
+            except Exception as e:
+                logger.error(f"Ekspor snapshot rekomendasi gagal: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+rec_snapshot = RecommendationSnapshot()
+snapshot_exporter = SnapshotExporter()
+
+
+def _snapshot_age_metric() -> float:
+    age = rec_snapshot.age_seconds()
+    return -1.0 if age is None else age
+
+
+SNAPSHOT_AGE_SECONDS = Gauge("waifu_rec_snapshot_age_seconds", "Umur snapshot rekomendasi yang dimuat (-1 jika belum ada)")
+SNAPSHOT_AGE_SECONDS.set_function(_snapshot_age_metric)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ekspor snapshot analitik untuk recommender.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Tulis snapshot (inkremental secara default).")
+    export_parser.add_argument("--full", action="store_true", help="Bangun ulang dari seluruh riwayat chat.")
+    export_parser.add_argument("--dir", default=REC_SNAPSHOT_DIR)
+    status_parser = subparsers.add_parser("status", help="Tampilkan metadata & umur snapshot.")
+    status_parser.add_argument("--dir", default=REC_SNAPSHOT_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "export":
+        from app.db import create_db_and_tables
+
+        async def run_export() -> dict:
+            await create_db_and_tables()
+            with export_lock(args.dir) as acquired:
+                if not acquired:
+                    raise SystemExit(f"Ekspor lain sedang berjalan ({os.path.join(args.dir, LOCK_FILENAME)}).")
+                return await export_snapshot(args.dir, full=args.full)
+
+        print(json.dumps(asyncio.run(run_export()), indent=2))
+    elif args.command == "status":
+        meta = read_meta(args.dir)
+        if meta is None:
+            print(f"Belum ada snapshot di {args.dir}.")
+        else:
+            age = (datetime.utcnow() - datetime.fromisoformat(meta["exported_at"])).total_seconds()
+            print(json.dumps({**meta, "age_seconds": round(age, 1), "stale": age > REC_SNAPSHOT_MAX_AGE_SECONDS}, indent=2))
@@ -0,0 +1,109 @@
+import os
+import time
+import asyncio
+import logging
+
+from app.rec_cache import recommendation_cache
+from app.recomender import compute_and_store_recommendations
+
+logger = logging.getLogger(__name__)
+
+# Tunggu sampai user berhenti chat selama N detik sebelum menghitung ulang
+REC_WORKER_DEBOUNCE_SECONDS = float(os.environ.get("REC_WORKER_DEBOUNCE_SECONDS", "5"))
+# Batas penundaan sejak event pertama: user yang terus chat tetap dihitung ulang paling lambat setelah ini
+REC_WORKER_MAX_DELAY_SECONDS = float(os.environ.get("REC_WORKER_MAX_DELAY_SECONDS", "30"))
+REC_WORKER_QUEUE_SIZE = int(os.environ.get("REC_WORKER_QUEUE_SIZE", "1000"))
+
+
+class RecommendationWorker:
+    """
+    Worker background yang menghitung ulang rekomendasi di luar jalur request.
+    Endpoint chat memanggil `notify(user_id)`; event dikumpulkan dengan debounce
+    sehingga satu sesi chat yang panjang hanya memicu satu komputasi per `max_delay_seconds`.
+    """
+
+    def __init__(
+        self,
+        debounce_seconds: float = REC_WORKER_DEBOUNCE_SECONDS,
+        queue_size: int = REC_WORKER_QUEUE_SIZE,
+        max_delay_seconds: float = REC_WORKER_MAX_DELAY_SECONDS,
+    ):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self._queue: asyncio.Queue[int] = asyncio.Queue(maxsize=queue_size)
+        self._due: dict[int, float] = {}
+        # Waktu event pertama yang belum diproses per user (batas atas debounce)
+        self._first_seen: dict[int, float] = {}
+        self._task: asyncio.Task | None = None
+        self.events_received = 0
+        self.events_dropped = 0
+        self.recomputed = 0
+        self.failures = 0
+
+    def notify(self, user_id: int) -> None:
+        """Catat bahwa data user berubah. Tidak pernah memblokir; event dibuang jika antrean penuh."""
+        try:
+            self._queue.put_nowait(user_id)
+            self.events_received += 1
+        except asyncio.QueueFull:
+            # Request berikutnya akan menghitung sendiri lewat cache, jadi aman dibuang
+            self.events_dropped += 1
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="recommendation-worker")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            timeout = None
+            if self._due:
+                timeout = max(min(self._due.values()) - time.monotonic(), 0.0)
+            try:
+                user_id = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                # Setiap event baru menunda jadwal komputasi user tersebut (debounce), tetapi tidak
+                # melewati max_delay sejak event pertama
+                now = time.monotonic()
+                first_seen = self._first_seen.setdefault(user_id, now)
+                self._due[user_id] = min(now + self.debounce_seconds, first_seen + self.max_delay_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+            # Dicek setiap putaran, agar arus event dari user lain tidak menahan user yang sudah jatuh tempo
+            now = time.monotonic()
+            ready = [uid for uid, due in self._due.items() if due <= now]
+            for user_id in ready:
+                del self._due[user_id]
+                del self._first_seen[user_id]
+                await self._recompute(user_id)
+
+    async def _recompute(self, user_id: int) -> None:
+        try:
+            # Lewat cache agar request yang datang bersamaan ikut menunggu hasil yang sama
+            await recommendation_cache.get_or_compute(
+                user_id, lambda: compute_and_store_recommendations(user_id), record_stats=False
+            )
+            self.recomputed += 1
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Worker rekomendasi gagal untuk user {user_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "events_received": self.events_received,
+            "events_dropped": self.events_dropped,
+            "pending": len(self._due) + self._queue.qsize(),
+            "recomputed": self.recomputed,
+            "failures": self.failures,
+        }
+
+
+recommendation_worker = RecommendationWorker()
@@ -1,124 +1,359 @@
-import pandas as pd
 import numpy as np
+from scipy import sparse
 from sqlmodel import select
-from sqlalchemy import desc
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
+from sqlalchemy import desc, func
+from sqlalchemy.exc import IntegrityError, OperationalError
+import os
+import json
+import asyncio
+import hashlib
+import argparse
 import logging
+from datetime import datetime
 
 # Impor dari aplikasi kita
-from app.db import AsyncSessionLocal
-from app.models import ChatMessage
+from app.db import AsyncSessionLocal, create_db_and_tables, use_read_committed
+from app.models import ChatMessage, User, UserEmbedding, UserRecommendation
 from app.waifu import WAIFU
+from app.embeddings import EmbeddingService, embedding_service
+from app.metrics import span
+from app.concurrency import run_blocking
+from app.rec_snapshot import REC_SNAPSHOT_ENABLED, SnapshotData, rec_snapshot
 
-# Konfigurasi logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Muat model embedding sekali saja
-try:
-    logger.info("Memuat model Sentence Transformer...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    logger.info("Model berhasil dimuat.")
-except Exception as e:
-    logger.error(f"Gagal memuat model: {e}")
-    model = None
+# Percobaan ulang read-modify-write vektor user saat dua chat pertama user baru berbarengan
+USER_VECTOR_UPDATE_ATTEMPTS = 3
+# Umur maksimum indeks kolaboratif yang dibangun dari database (fallback tanpa snapshot)
+REC_COLLAB_INDEX_TTL_SECONDS = float(os.environ.get("REC_COLLAB_INDEX_TTL_SECONDS", "60"))
+
+# Waktu paruh (hari) untuk peluruhan vektor profil user. 0 = rata-rata biasa tanpa peluruhan.
+USER_VECTOR_HALF_LIFE_DAYS = float(os.environ.get("USER_VECTOR_HALF_LIFE_DAYS", "0"))
+
+async def get_model() -> EmbeddingService | None:
+    """
+    Model embedding bersama (sama dengan retrieval RAG) dengan micro-batching.
+    Dimuat saat pertama dibutuhkan; None jika gagal dimuat.
+    """
+    try:
+        return await embedding_service.aget()
+    except Exception as e:
+        logger.error(f"Gagal memuat model: {e}")
+        return None
+
+# Jumlah pesan terbaru per karakter yang dipakai untuk skor konten (Recency Boost)
+CONTENT_HISTORY_WINDOW = 20
+
+# Cache vektor persona: sha256(system_prompt) -> embedding. Prompt jarang berubah,
+# jadi cukup di-encode sekali per proses dan otomatis terhitung ulang jika isinya diubah.
+_persona_vector_cache: dict[str, np.ndarray] = {}
+
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+async def get_character_vectors() -> dict[str, np.ndarray]:
+    """Vektor persona setiap karakter di WAIFU, hanya prompt baru/berubah yang di-encode (satu batch)."""
+    hashes = {char_id: _prompt_hash(data['system_prompt']) for char_id, data in WAIFU.items()}
+    missing = {h: WAIFU[char_id]['system_prompt'] for char_id, h in hashes.items() if h not in _persona_vector_cache}
+    if missing:
+        model = await get_model()
+        encoded = await model.aencode(list(missing.values()))
+        for h, vector in zip(missing.keys(), encoded):
+            _persona_vector_cache[h] = np.asarray(vector, dtype=np.float32)
+    return {char_id: _persona_vector_cache[h] for char_id, h in hashes.items()}
 
 async def calculate_content_scores(user_id: int, character_vectors: dict) -> dict[str, float]:
     """
     STRATEGI FINAL: Menghitung skor afinitas HANYA berdasarkan 20 pesan TERAKHIR.
     Ini memberikan "Recency Boost", membuat sistem sangat responsif.
+    Riwayat semua karakter diambil dengan satu query berjendela (ROW_NUMBER) dan
+    semua percakapan di-encode dalam satu batch.
     """
-    content_scores = {}
+    content_scores = {char_id: 0.0 for char_id in character_vectors}
     async with AsyncSessionLocal() as session:
-        await session.connection(execution_options={"isolation_level": "READ COMMITTED"})
-        
-        for char_id, char_vector in character_vectors.items():
-            # --- PERUBAHAN KUNCI DI SINI ---
-            # 1. Ambil HANYA 20 pesan TERBARU user dengan karakter ini.
-            stmt = select(ChatMessage).where(
-                ChatMessage.user_id == user_id,
-                ChatMessage.character_id == char_id
-            ).order_by(desc(ChatMessage.timestamp)).limit(20) # Urutkan dari terbaru, ambil 20
-            
-            result = await session.exec(stmt)
-            messages = result.all()
-            
-            if not messages:
-                content_scores[char_id] = 0.0
-                continue
-            
-            # 2. Gabungkan percakapan TERBARU yang relevan.
-            conversation_text = " ".join([msg.content for msg in messages])
-            
-            # 3. Buat vektor dari percakapan spesifik ini.
-            conversation_vector = model.encode(conversation_text)
-            
-            # 4. Hitung kemiripan antara persona karakter dan interaksi TERBARU user.
-            similarity = cosine_similarity(
-                conversation_vector.reshape(1, -1),
-                char_vector.reshape(1, -1)
-            )
-            content_scores[char_id] = float(similarity[0][0])
-            
-    logger.info(f"--- SKOR KONTEN (Recency Boost) --- \n{content_scores}\n")
+        await use_read_committed(session)
+
+        # 1. Ambil 20 pesan TERBARU user untuk setiap karakter dalam satu query.
+        ranked = select(
+            ChatMessage.character_id,
+            ChatMessage.content,
+            func.row_number().over(
+                partition_by=ChatMessage.character_id,
+                order_by=desc(ChatMessage.timestamp),
+            ).label("rn"),
+        ).where(
+            ChatMessage.user_id == user_id,
+            ChatMessage.character_id.in_(list(character_vectors.keys())),
+        ).subquery()
+        stmt = select(ranked.c.character_id, ranked.c.content).where(
+            ranked.c.rn <= CONTENT_HISTORY_WINDOW
+        ).order_by(ranked.c.character_id, ranked.c.rn)
+        rows = (await session.exec(stmt)).all()
+
+    # 2. Gabungkan percakapan TERBARU per karakter.
+    conversations: dict[str, list[str]] = {}
+    for char_id, content in rows:
+        conversations.setdefault(char_id, []).append(content)
+    if not conversations:
+        logger.debug(f"--- SKOR KONTEN (Recency Boost) --- \n{content_scores}\n")
+        return content_scores
+
+    char_ids = list(conversations.keys())
+    texts = [" ".join(conversations[char_id]) for char_id in char_ids]
+
+    # 3. Encode semua percakapan dalam satu batch.
+    model = await get_model()
+    conversation_vectors = np.asarray(await model.aencode(texts), dtype=np.float32)
+
+    # 4. Kemiripan kosinus antara persona karakter dan interaksi TERBARU user (vektorisasi).
+    persona_matrix = np.stack([character_vectors[char_id] for char_id in char_ids])
+    similarities = np.sum(conversation_vectors * persona_matrix, axis=1) / (
+        np.linalg.norm(conversation_vectors, axis=1) * np.linalg.norm(persona_matrix, axis=1) + 1e-12
+    )
+    for char_id, similarity in zip(char_ids, similarities):
+        content_scores[char_id] = float(similarity)
+
+    logger.debug(f"--- SKOR KONTEN (Recency Boost) --- \n{content_scores}\n")
     return content_scores
 
+def fold_user_vector(
+    prev_vector: np.ndarray | None,
+    prev_weight: float,
+    prev_time: datetime | None,
+    new_vectors: np.ndarray,
+    now: datetime,
+) -> tuple[np.ndarray, float]:
+    """
+    Gabungkan embedding pesan baru ke rata-rata berjalan milik user.
+    Jika USER_VECTOR_HALF_LIFE_DAYS > 0, bobot lama meluruh secara eksponensial terhadap waktu.
+    """
+    decay = 1.0
+    if prev_vector is not None and prev_time is not None and USER_VECTOR_HALF_LIFE_DAYS > 0:
+        elapsed_days = max((now - prev_time).total_seconds(), 0.0) / 86400
+        decay = 0.5 ** (elapsed_days / USER_VECTOR_HALF_LIFE_DAYS)
+
+    old_weight = prev_weight * decay if prev_vector is not None else 0.0
+    new_weight = old_weight + len(new_vectors)
+    total = new_vectors.sum(axis=0, dtype=np.float64)
+    if prev_vector is not None:
+        total += prev_vector.astype(np.float64) * old_weight
+    return (total / new_weight).astype(np.float32), new_weight
+
+async def update_user_vector(user_id: int, texts: list[str]) -> None:
+    """
+    Perbarui vektor profil user secara inkremental dari pesan yang baru disimpan.
+    Dipanggil sebagai background task setelah /api/chat melakukan commit.
+    """
+    texts = [t for t in texts if t and t.strip()]
+    if not texts:
+        return
+    model = await get_model()
+    if model is None:
+        return
+    new_vectors = np.asarray(await model.aencode(texts), dtype=np.float32)
+    now = datetime.utcnow()
+
+    for attempt in range(1, USER_VECTOR_UPDATE_ATTEMPTS + 1):
+        try:
+            await _fold_into_user_row(user_id, new_vectors, len(texts), now)
+            return
+        except (IntegrityError, OperationalError) as e:
+            # FOR UPDATE tidak mengunci baris yang belum ada: dua INSERT pertama bisa bentrok di
+            # primary key (atau deadlock gap lock di MySQL). Ulangi; percobaan berikutnya melihat
+            # baris yang sudah di-commit dan menguncinya.
+            if attempt == USER_VECTOR_UPDATE_ATTEMPTS:
+                raise
+            logger.debug(f"Pembaruan vektor user {user_id} bentrok, mencoba lagi ({attempt}): {e}")
+
+async def _fold_into_user_row(user_id: int, new_vectors: np.ndarray, message_count: int, now: datetime) -> None:
+    async with AsyncSessionLocal() as session:
+        # Kunci baris user agar dua chat paralel tidak saling menimpa pembaruan
+        stmt = select(UserEmbedding).where(UserEmbedding.user_id == user_id).with_for_update()
+        row = (await session.exec(stmt)).first()
+        if row is None:
+            vector, weight = fold_user_vector(None, 0.0, None, new_vectors, now)
+            row = UserEmbedding(user_id=user_id, vector=vector.tobytes(), weight=weight, message_count=message_count, updated_at=now)
+        else:
+            prev_vector = np.frombuffer(row.vector, dtype=np.float32)
+            vector, weight = fold_user_vector(prev_vector, row.weight, row.updated_at, new_vectors, now)
+            row.vector = vector.tobytes()
+            row.weight = weight
+            row.message_count += message_count
+            row.updated_at = now
+        session.add(row)
+        await session.commit()
+
+async def backfill_user_vectors(batch_size: int = 64) -> int:
+    """
+    Bangun ulang seluruh tabel UserEmbedding dari riwayat ChatMessage (untuk data lama).
+    Pesan diproses per user sesuai urutan waktu sehingga peluruhan sama dengan jalur inkremental.
+    Mengembalikan jumlah user yang diproses.
+    """
+    model = await get_model()
+    if model is None:
+        return 0
+    async with AsyncSessionLocal() as session:
+        user_ids = (await session.exec(select(ChatMessage.user_id).distinct())).all()
+
+    for user_id in user_ids:
+        async with AsyncSessionLocal() as session:
+            stmt = select(ChatMessage.content, ChatMessage.timestamp).where(
+                ChatMessage.user_id == user_id
+            ).order_by(ChatMessage.timestamp)
+            rows = (await session.exec(stmt)).all()
+            rows = [(content, ts) for content, ts in rows if content and content.strip()]
+            if not rows:
+                continue
+
+            # Kirim per potongan agar permintaan interaktif tetap bisa masuk di antara batch backfill
+            texts = [content for content, _ in rows]
+            encoded = np.concatenate([
+                await model.aencode(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)
+            ]).astype(np.float32, copy=False)
+            vector, weight, last_time = None, 0.0, None
+            for vec, (_, ts) in zip(encoded, rows):
+                vector, weight = fold_user_vector(vector, weight, last_time, vec.reshape(1, -1), ts)
+                last_time = ts
+
+            row = await session.get(UserEmbedding, user_id)
+            if row is None:
+                row = UserEmbedding(user_id=user_id)
+            row.vector = vector.tobytes()
+            row.weight = weight
+            row.message_count = len(rows)
+            row.updated_at = last_time
+            session.add(row)
+            await session.commit()
+        logger.info(f"Backfill vektor user {user_id}: {len(rows)} pesan.")
+    return len(user_ids)
+
 async def get_all_user_vectors_for_collab() -> dict[int, np.ndarray]:
-    """Fungsi bantuan untuk collaborative filtering (tidak berubah)."""
-    user_conversations = {}
+    """Baca vektor profil user yang sudah dihitung sebelumnya (tabel UserEmbedding)."""
     async with AsyncSessionLocal() as session:
-        await session.connection(execution_options={"isolation_level": "READ COMMITTED"})
-        stmt = select(ChatMessage)
-        messages = (await session.exec(stmt)).all()
-        for msg in messages:
-            user_conversations.setdefault(msg.user_id, "")
-            user_conversations[msg.user_id] += f"{msg.content} "
-    
-    return {uid: model.encode(text) for uid, text in user_conversations.items()}
-
-def collaborative_scores(target_user_id: int, user_vectors: dict, all_interactions_df: pd.DataFrame) -> dict:
-    """Fungsi ini tidak berubah."""
-    if target_user_id not in user_vectors or len(user_vectors) < 2:
-        return {}
-    target_vector = user_vectors[target_user_id]
-    similarities = {
-        uid: cosine_similarity(target_vector.reshape(1, -1), vec.reshape(1, -1))[0][0]
-        for uid, vec in user_vectors.items() if uid != target_user_id
-    }
-    if not similarities:
-        return {}
-    similar_users = sorted(similarities.items(), key=lambda item: item[1], reverse=True)[:5]
-    recommended_chars = {}
-    for user_id, score in similar_users:
-        liked_chars = all_interactions_df[all_interactions_df['user_id'] == user_id]['character_id'].tolist()
-        for char in liked_chars:
-            recommended_chars.setdefault(char, 0.0)
-            recommended_chars[char] += float(score)
-    return recommended_chars
+        await use_read_committed(session)
+        rows = (await session.exec(select(UserEmbedding.user_id, UserEmbedding.vector))).all()
+    return {uid: np.frombuffer(vector, dtype=np.float32) for uid, vector in rows}
+
+# Jumlah tetangga terdekat yang dipakai untuk collaborative filtering
+COLLAB_TOP_K = 5
+
+class CollaborativeIndex:
+    """
+    Struktur tervektorisasi untuk collaborative filtering:
+    - `user_matrix`: vektor profil semua user (float32, ter-normalisasi L2), satu baris per user.
+    - `interactions`: matriks sparse user -> karakter (1 jika user pernah chat dengan karakter).
+    Skor karakter untuk satu user = satu perkalian matriks-vektor + satu perkalian sparse.
+    """
+
+    def __init__(self, user_ids: list[int], user_matrix: np.ndarray, character_ids: list[str], interactions: sparse.csr_matrix):
+        self.user_ids = user_ids
+        self.user_index = {uid: i for i, uid in enumerate(user_ids)}
+        self.user_matrix = user_matrix
+        self.character_ids = character_ids
+        self.interactions = interactions
+
+    @classmethod
+    def build(cls, user_vectors: dict[int, np.ndarray], interactions: list[tuple[int, str]]) -> "CollaborativeIndex":
+        user_ids = list(user_vectors.keys())
+        if user_ids:
+            matrix = np.stack([user_vectors[uid] for uid in user_ids]).astype(np.float32, copy=False)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, 1e-12)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return cls.from_unit_vectors(user_ids, matrix, interactions)
+
+    @classmethod
+    def from_unit_vectors(cls, user_ids: list[int], matrix: np.ndarray, interactions: list[tuple[int, str]]) -> "CollaborativeIndex":
+        """`matrix` sudah ter-normalisasi L2 (misal view mmap dari snapshot), dipakai tanpa disalin."""
+        user_index = {uid: i for i, uid in enumerate(user_ids)}
+        character_ids = sorted({char_id for _, char_id in interactions})
+        char_index = {char_id: j for j, char_id in enumerate(character_ids)}
+        pairs = [(user_index[uid], char_index[char_id]) for uid, char_id in interactions if uid in user_index]
+        rows = np.fromiter((r for r, _ in pairs), dtype=np.int32, count=len(pairs))
+        cols = np.fromiter((c for _, c in pairs), dtype=np.int32, count=len(pairs))
+        data = np.ones(len(pairs), dtype=np.float32)
+        interaction_matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(user_ids), len(character_ids)))
+        # Pasangan duplikat dijumlahkan oleh csr_matrix, ubah kembali menjadi biner
+        interaction_matrix.data[:] = 1.0
+        return cls(user_ids, matrix, character_ids, interaction_matrix)
+
+    def scores(self, target_user_id: int, top_k: int = COLLAB_TOP_K) -> dict[str, float]:
+        """Jumlah kemiripan dari top-k user terdekat untuk setiap karakter yang mereka sukai."""
+        target = self.user_index.get(target_user_id)
+        if target is None or len(self.user_ids) < 2:
+            return {}
+
+        similarities = self.user_matrix @ self.user_matrix[target]
+        similarities[target] = -np.inf
+        k = min(top_k, len(self.user_ids) - 1)
+        neighbours = np.argpartition(-similarities, k - 1)[:k]
+
+        neighbour_interactions = self.interactions[neighbours]
+        char_scores = neighbour_interactions.T @ similarities[neighbours]
+        liked = np.asarray(neighbour_interactions.sum(axis=0)).ravel() > 0
+        return {self.character_ids[j]: float(char_scores[j]) for j in np.flatnonzero(liked)}
+
+# Indeks kolaboratif dari snapshot, dibangun sekali per versi snapshot (bukan per request)
+_snapshot_index: tuple[str, CollaborativeIndex] | None = None
+# Indeks dari database (snapshot mati/belum ada/basi): dipakai ulang selama TTL -> (monotonic dibangun, indeks)
+_db_index: tuple[float, CollaborativeIndex] | None = None
+_db_index_lock = asyncio.Lock()
+
+def _index_from_snapshot(data: SnapshotData) -> CollaborativeIndex:
+    interactions = [
+        (int(uid), char_id)
+        for uid, char_id, count in zip(data.interaction_user_ids, data.interaction_character_ids, data.interaction_counts)
+        if count > 0
+    ]
+    return CollaborativeIndex.from_unit_vectors([int(uid) for uid in data.user_ids], data.vectors, interactions)
+
+async def get_collaborative_index() -> CollaborativeIndex:
+    """
+    Dari snapshot Arrow (app/rec_snapshot.py) jika tersedia, sehingga rekomendasi tidak men-scan
+    tabel chat di database OLTP; jika belum ada snapshot atau snapshot sudah basi (user baru belum
+    masuk), fallback ke query database. Indeks hasil fallback juga dipakai ulang selama
+    REC_COLLAB_INDEX_TTL_SECONDS, jadi scan tabel terjadi paling sering sekali per TTL per worker.
+    """
+    global _snapshot_index, _db_index
+    if REC_SNAPSHOT_ENABLED:
+        data = await run_blocking(rec_snapshot.get_fresh)
+        if data is not None:
+            if _snapshot_index is None or _snapshot_index[0] != data.version:
+                _snapshot_index = (data.version, await run_blocking(_index_from_snapshot, data))
+            return _snapshot_index[1]
+
+    loop = asyncio.get_running_loop()
+    if _db_index is not None and loop.time() - _db_index[0] < REC_COLLAB_INDEX_TTL_SECONDS:
+        return _db_index[1]
+    # Satu pembangunan ulang per worker; request lain menunggu hasil yang sama
+    async with _db_index_lock:
+        if _db_index is not None and loop.time() - _db_index[0] < REC_COLLAB_INDEX_TTL_SECONDS:
+            return _db_index[1]
+        user_vectors_for_collab = await get_all_user_vectors_for_collab()
+        async with AsyncSessionLocal() as session:
+            await use_read_committed(session)
+            stmt = select(ChatMessage.user_id, ChatMessage.character_id).distinct()
+            interactions = [(uid, char_id) for uid, char_id in (await session.exec(stmt)).all()]
+        index = await run_blocking(CollaborativeIndex.build, user_vectors_for_collab, interactions)
+        _db_index = (loop.time(), index)
+        return index
 
 async def hybrid_recommendation(user_id: int, alpha: float = 0.7) -> list[str]:
-    if model is None:
+    if await get_model() is None:
         return []
 
-    logger.info(f"--- MEMULAI REKOMENDASI (STRATEGI FINAL DENGAN RECENCY BOOST) UNTUK USER: {user_id} ---")
+    logger.debug(f"--- MEMULAI REKOMENDASI (STRATEGI FINAL DENGAN RECENCY BOOST) UNTUK USER: {user_id} ---")
 
-    character_prompts = {char_id: data['system_prompt'] for char_id, data in WAIFU.items()}
-    character_vectors = {char_id: model.encode(prompt) for char_id, prompt in character_prompts.items()}
+    character_vectors = await get_character_vectors()
 
     content_scores = await calculate_content_scores(user_id, character_vectors)
 
-    user_vectors_for_collab = await get_all_user_vectors_for_collab()
-    async with AsyncSessionLocal() as session:
-        await session.connection(execution_options={"isolation_level": "READ COMMITTED"})
-        stmt = select(ChatMessage.user_id, ChatMessage.character_id).distinct()
-        interactions = (await session.exec(stmt)).all()
-        all_interactions_df = pd.DataFrame(interactions, columns=['user_id', 'character_id'])
-    
-    collab_scores = collaborative_scores(user_id, user_vectors_for_collab, all_interactions_df)
+    collab_index = await get_collaborative_index()
+    collab_scores = collab_index.scores(user_id)
     max_collab_score = max(collab_scores.values()) if collab_scores else 1.0
     collab_scores_normalized = {char: score / max_collab_score for char, score in collab_scores.items()}
-    logger.info(f"--- SKOR KOLABORATIF (Normalized) --- \n{collab_scores_normalized}\n")
+    logger.debug(f"--- SKOR KOLABORATIF (Normalized) --- \n{collab_scores_normalized}\n")
 
     final_scores = {}
     all_char_ids = set(content_scores.keys()) | set(collab_scores_normalized.keys())
@@ -126,13 +361,98 @@ async def hybrid_recommendation(user_id: int, alpha: float = 0.7) -> list[str]:
         content = content_scores.get(char_id, 0.0)
         collab = collab_scores_normalized.get(char_id, 0.0)
         final_scores[char_id] = (alpha * content) + ((1 - alpha) * collab)
-    logger.info(f"--- SKOR FINAL GABUNGAN --- \n{final_scores}\n")
+    logger.debug(f"--- SKOR FINAL GABUNGAN --- \n{final_scores}\n")
 
-    interacted_chars = set(all_interactions_df[all_interactions_df['user_id'] == user_id]['character_id'].unique())
     scores_to_sort = final_scores
 
     sorted_recommendations = sorted(scores_to_sort.items(), key=lambda item: item[1], reverse=True)
     recommendation_ids = [char_id for char_id, score in sorted_recommendations[:3]]
-    logger.info(f"--- REKOMENDASI FINAL --- \n{recommendation_ids}\n")
+    logger.debug(f"--- REKOMENDASI FINAL --- \n{recommendation_ids}\n")
     
-    return recommendation_ids
\ No newline at end of file
+    return recommendation_ids
+
+# Umur maksimum hasil rekomendasi tersimpan sebelum dianggap basi (aktivitas user lain ikut memengaruhi skor)
+STORED_RECOMMENDATION_MAX_AGE_SECONDS = float(os.environ.get("STORED_RECOMMENDATION_MAX_AGE_SECONDS", "3600"))
+
+async def store_recommendations(user_id: int, recommendation_ids: list[str]) -> None:
+    """Simpan hasil rekomendasi yang sudah dihitung (dipakai worker background & CLI)."""
+    async with AsyncSessionLocal() as session:
+        row = await session.get(UserRecommendation, user_id)
+        if row is None:
+            row = UserRecommendation(user_id=user_id, character_ids="[]")
+        row.character_ids = json.dumps(recommendation_ids)
+        row.computed_at = datetime.utcnow()
+        session.add(row)
+        await session.commit()
+
+async def load_stored_recommendations(user_id: int) -> list[str] | None:
+    """
+    Ambil hasil tersimpan jika masih segar: dihitung setelah aktivitas chat terakhir user
+    (UserEmbedding.updated_at) dan belum melewati batas umur. None jika harus dihitung ulang.
+    """
+    async with AsyncSessionLocal() as session:
+        stored = await session.get(UserRecommendation, user_id)
+        if stored is None:
+            return None
+        profile = await session.get(UserEmbedding, user_id)
+    if profile is not None and profile.updated_at > stored.computed_at:
+        return None
+    if (datetime.utcnow() - stored.computed_at).total_seconds() > STORED_RECOMMENDATION_MAX_AGE_SECONDS:
+        return None
+    return json.loads(stored.character_ids)
+
+async def compute_and_store_recommendations(user_id: int) -> list[str]:
+    recommendation_ids = await hybrid_recommendation(user_id)
+    await store_recommendations(user_id, recommendation_ids)
+    return recommendation_ids
+
+async def get_recommendations(user_id: int) -> list[str]:
+    """Jalur request: pakai hasil precompute jika masih segar, selain itu hitung & simpan."""
+    with span("recommendation"):
+        stored = await load_stored_recommendations(user_id)
+        if stored is not None:
+            return stored
+        return await compute_and_store_recommendations(user_id)
+
+async def recompute_all_recommendations(concurrency: int = 4) -> int:
+    """Hitung ulang rekomendasi semua user secara massal. Mengembalikan jumlah user."""
+    async with AsyncSessionLocal() as session:
+        user_ids = (await session.exec(select(User.id))).all()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def recompute(user_id: int) -> None:
+        async with semaphore:
+            try:
+                await compute_and_store_recommendations(user_id)
+            except Exception as e:
+                logger.error(f"Gagal menghitung rekomendasi user {user_id}: {e}")
+
+    await asyncio.gather(*(recompute(uid) for uid in user_ids))
+    return len(user_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Utilitas recommender.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Bangun ulang vektor profil semua user dari riwayat chat.")
+    backfill_parser.add_argument("--batch-size", type=int, default=64)
+    recompute_parser = subparsers.add_parser("recompute-all", help="Hitung ulang dan simpan rekomendasi untuk semua user.")
+    recompute_parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "backfill":
+        async def run_backfill() -> int:
+            await create_db_and_tables()
+            return await backfill_user_vectors(batch_size=args.batch_size)
+
+        total = asyncio.run(run_backfill())
+        logger.info(f"Backfill selesai untuk {total} user.")
+
+    elif args.command == "recompute-all":
+        async def run_recompute() -> int:
+            await create_db_and_tables()
+            return await recompute_all_recommendations(concurrency=args.concurrency)
+
+        total = asyncio.run(run_recompute())
+        logger.info(f"Rekomendasi dihitung ulang untuk {total} user.")
@@ -0,0 +1,130 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+from app.concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """
+    Resource berat (LLM client, model embedding, indeks FAISS) yang baru dibuat saat pertama
+    kali dibutuhkan, sehingga `import` modul aplikasi tetap cepat.
+    `warmup` opsional dijalankan sekali setelah resource dimuat (misal encode/search dummy).
+    Resource `required` yang gagal dimuat (exception atau factory mengembalikan None) membuat
+    aplikasi tidak pernah ditandai siap.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], T],
+        warmup: Optional[Callable[[T], None]] = None,
+        required: bool = True,
+    ):
+        self.name = name
+        self.factory = factory
+        self.warmup_fn = warmup
+        self.required = required
+        self._value: Optional[T] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds: float | None = None
+        self.warmup_seconds: float | None = None
+        _registry.append(self)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._value = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+                    logger.info(f"Resource '{self.name}' dimuat dalam {self.load_seconds:.2f} s")
+        return self._value
+
+    async def aget(self) -> T:
+        """Seperti `get`, tetapi pemuatan pertama dijalankan di thread pool agar event loop tidak terblokir."""
+        if self._loaded:
+            return self._value
+        return await run_blocking(self.get)
+
+    def warmup(self) -> None:
+        value = self.get()
+        if self.warmup_fn is not None and value is not None and self.warmup_seconds is None:
+            start = time.perf_counter()
+            self.warmup_fn(value)
+            self.warmup_seconds = time.perf_counter() - start
+
+    def reset(self) -> None:
+        """Dipakai oleh skrip benchmark/uji beban untuk mengganti resource dengan stub."""
+        with self._lock:
+            self._value = None
+            self._loaded = False
+
+    def override(self, value: T) -> None:
+        with self._lock:
+            self._value = value
+            self._loaded = True
+
+
+_registry: list[LazyResource] = []
+_ready = False
+# Resource wajib yang gagal saat warmup: nama -> pesan error
+_failed: dict[str, str] = {}
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def failed_resources() -> dict[str, str]:
+    return dict(_failed)
+
+
+def mark_ready() -> None:
+    global _ready
+    _ready = True
+
+
+async def warmup_resources() -> None:
+    """
+    Muat semua resource terdaftar secara paralel (masing-masing di thread pool),
+    jalankan warmup-nya, lalu tandai aplikasi siap hanya jika semua resource wajib berhasil.
+    Log berisi rincian waktu startup.
+    """
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_blocking(resource.warmup) for resource in _registry),
+        return_exceptions=True,
+    )
+    total = time.perf_counter() - start
+
+    logger.info("Rincian waktu startup (warmup):")
+    for resource, result in zip(_registry, results):
+        if not isinstance(result, Exception) and resource.get() is None:
+            # Factory yang menelan error-nya sendiri (misal indeks FAISS tidak ada) mengembalikan None
+            result = RuntimeError("resource tidak tersedia")
+        if isinstance(result, Exception):
+            logger.error(f"  {resource.name:<20} GAGAL: {result}")
+            if resource.required:
+                _failed[resource.name] = str(result)
+            continue
+        load = f"{resource.load_seconds:.2f} s" if resource.load_seconds is not None else "-"
+        warm = f"{resource.warmup_seconds:.2f} s" if resource.warmup_seconds is not None else "-"
+        logger.info(f"  {resource.name:<20} load {load:>8}  warmup {warm:>8}")
+    logger.info(f"  {'total (paralel)':<20} {total:.2f} s")
+    if _failed:
+        logger.error(f"Aplikasi tidak ditandai siap, resource wajib gagal: {', '.join(_failed)}")
+        return
+    mark_ready()
@@ -0,0 +1,339 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.vector_index import compute_centroid, flat_vectors, load_centroid
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "512"))
+# Ambang kemiripan kosinus agar query dianggap "hampir sama" dengan query yang sudah di-cache
+RETRIEVAL_CACHE_THRESHOLD = float(os.environ.get("RETRIEVAL_CACHE_THRESHOLD", "0.95"))
+# Seberapa sering (detik) file indeks dicek untuk mendeteksi rebuild
+RETRIEVAL_INDEX_CHECK_SECONDS = float(os.environ.get("RETRIEVAL_INDEX_CHECK_SECONDS", "30"))
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = re.compile(r"^[^\w]+|[^\w]+$")
+
+
+def normalize_query(query: str) -> str:
+    """'  Cara bikin CV ATS??' -> 'cara bikin cv ats'"""
+    query = _WHITESPACE.sub(" ", query.strip().lower())
+    return _EDGE_PUNCTUATION.sub("", query)
+
+
+@dataclass
+class _CacheEntry:
+    results: List[Tuple[Document, float]]
+    slot: int
+
+
+class SemanticRetrievalCache:
+    """
+    Retriever dengan cache LRU di depan FAISS.
+    - Query yang sama setelah normalisasi dikembalikan tanpa embedding maupun pencarian.
+    - Query yang embedding-nya mirip (kosinus >= threshold) dengan query di cache juga dianggap hit.
+    - Jika file indeks di disk berubah (rebuild), vector store dimuat ulang dan cache dikosongkan.
+    Antarmuka `get_relevant_documents` sama dengan retriever LangChain.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], object],
+        index_path: str,
+        k: int = 3,
+        max_entries: int = RETRIEVAL_CACHE_SIZE,
+        threshold: float = RETRIEVAL_CACHE_THRESHOLD,
+        check_interval: float = RETRIEVAL_INDEX_CHECK_SECONDS,
+    ):
+        self.loader = loader
+        self.index_path = index_path
+        self.k = k
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._matrix: np.ndarray | None = None  # satu baris per slot, vektor ter-normalisasi
+        self._valid: np.ndarray = np.zeros(max_entries, dtype=bool)
+        self._slot_keys: list[str | None] = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.vector_store = loader()
+        self._index_mtime = self._read_index_mtime()
+        self._last_check = time.monotonic()
+
+    def _read_index_mtime(self) -> float | None:
+        # index_meta.json ditulis paling akhir oleh create_vector_store.py, jadi ikut dipantau
+        mtimes = []
+        for filename in ("index.faiss", "index_meta.json"):
+            try:
+                mtimes.append(os.path.getmtime(os.path.join(self.index_path, filename)))
+            except OSError:
+                pass
+        return max(mtimes) if mtimes else None
+
+    def _check_index(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        mtime = self._read_index_mtime()
+        if mtime is None or mtime == self._index_mtime:
+            return
+        logger.info("Indeks FAISS berubah di disk, memuat ulang vector store dan mengosongkan cache retrieval.")
+        vector_store = self.loader()
+        with self._lock:
+            self.vector_store = vector_store
+            self._index_mtime = mtime
+            self._clear()
+            self.invalidations += 1
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._valid[:] = False
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+            self.invalidations += 1
+
+    def _insert(self, key: str, vector: np.ndarray, results: List[Tuple[Document, float]]) -> None:
+        if key in self._entries:
+            return
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        if not self._free_slots:
+            _, evicted = self._entries.popitem(last=False)
+            self._valid[evicted.slot] = False
+            self._slot_keys[evicted.slot] = None
+            self._free_slots.append(evicted.slot)
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._matrix[slot] = vector
+        self._valid[slot] = True
+        self._slot_keys[slot] = key
+        self._entries[key] = _CacheEntry(results, slot)
+
+    def _nearest(self, vector: np.ndarray) -> _CacheEntry | None:
+        if self._matrix is None or not self._valid.any():
+            return None
+        similarities = np.where(self._valid, self._matrix @ vector, -1.0)
+        slot = int(np.argmax(similarities))
+        if similarities[slot] < self.threshold:
+            return None
+        key = self._slot_keys[slot]
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embedding query ter-normalisasi (dipakai untuk lookup semantik dan pencarian)."""
+        vector = np.asarray(self.vector_store.embeddings.embed_query(query), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def cached_vector(self, query: str) -> np.ndarray | None:
+        """Embedding tersimpan untuk query yang persis sama setelah normalisasi (tanpa mengubah statistik)."""
+        with self._lock:
+            entry = self._entries.get(normalize_query(query))
+            # Disalin: slot bisa dipakai ulang entri lain setelah lock dilepas
+            return None if entry is None else self._matrix[entry.slot].copy()
+
+    def get_scored_documents(self, query: str, embed: Callable[[], np.ndarray] | None = None) -> List[Tuple[Document, float]]:
+        """
+        Seperti `get_relevant_documents` tetapi menyertakan jarak L2 tiap dokumen.
+        `embed` opsional menyediakan embedding query, sehingga beberapa shard bisa memakai satu embedding.
+        """
+        self._check_index()
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits_exact += 1
+                return entry.results
+            vector_store = self.vector_store
+
+        vector = embed() if embed is not None else self.embed_query(query)
+
+        with self._lock:
+            entry = self._nearest(vector)
+            if entry is not None:
+                self.hits_semantic += 1
+                return entry.results
+            self.misses += 1
+
+        # Embedding query dipakai ulang untuk pencarian, jadi tidak ada encode kedua
+        results = vector_store.similarity_search_with_score_by_vector(vector.tolist(), k=self.k)
+        with self._lock:
+            if vector_store is self.vector_store:
+                self._insert(key, vector, results)
+        return results
+
+    def get_relevant_documents(self, query: str) -> List[Document]:
+        return [doc for doc, _ in self.get_scored_documents(query)]
+
+    def stats(self) -> dict:
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": (self.hits_exact + self.hits_semantic) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class ShardedRetriever:
+    """
+    Satu SemanticRetrievalCache per shard (subfolder knowledge_base). Query hanya dicari di shard
+    yang diminta; embedding query dihitung paling banyak sekali, lalu hasil antar shard digabung
+    berdasarkan jarak dan diambil `k` teratas.
+    Shard baru yang muncul di disk setelah startup dimuat saat pertama kali diminta.
+    """
+
+    def __init__(
+        self,
+        index_root: str,
+        loader: Callable[[str], object],
+        shard_paths: dict[str, str],
+        k: int = 3,
+        fallback_shard: str | None = None,
+    ):
+        self.index_root = index_root
+        self.loader = loader
+        self.k = k
+        # Dipakai jika tidak ada satu pun shard yang diminta tersedia (misal indeks gabungan lama)
+        self.fallback_shard = fallback_shard
+        self._lock = threading.Lock()
+        self.shards: dict[str, SemanticRetrievalCache] = {}
+        self.shard_queries: dict[str, int] = {}
+        self.missing_shard_requests = 0
+        self._centroids: dict[str, tuple[object, np.ndarray | None]] = {}
+        for name, index_path in shard_paths.items():
+            self._load_shard(name, index_path)
+
+    def _load_shard(self, name: str, index_path: str | None = None) -> SemanticRetrievalCache | None:
+        index_path = index_path or os.path.join(self.index_root, name)
+        if not os.path.isdir(index_path):
+            return None
+        shard = SemanticRetrievalCache(loader=lambda: self.loader(index_path), index_path=index_path, k=self.k)
+        self.shards[name] = shard
+        self.shard_queries.setdefault(name, 0)
+        logger.info(f"Shard '{name}' dimuat dari {index_path}.")
+        return shard
+
+    def _get_shard(self, name: str) -> SemanticRetrievalCache | None:
+        shard = self.shards.get(name)
+        if shard is not None:
+            return shard
+        with self._lock:
+            if name in self.shards:
+                return self.shards[name]
+            try:
+                return self._load_shard(name)
+            except Exception as e:
+                logger.warning(f"Shard '{name}' gagal dimuat: {e}")
+                return None
+
+    def _resolve_shards(self, shard_names: List[str] | None, count_missing: bool = True) -> List[Tuple[str, SemanticRetrievalCache]]:
+        names = list(self.shards) if shard_names is None else shard_names
+        shards = []
+        for name in names:
+            shard = self._get_shard(name)
+            if shard is None:
+                self.missing_shard_requests += count_missing
+                continue
+            shards.append((name, shard))
+        if not shards and self.fallback_shard in self.shards:
+            shards = [(self.fallback_shard, self.shards[self.fallback_shard])]
+        return shards
+
+    def _centroid(self, name: str, shard: SemanticRetrievalCache) -> np.ndarray | None:
+        """Centroid shard dari centroid.npy; untuk shard flat lama tanpa file, dihitung dari indeks."""
+        vector_store = shard.vector_store
+        cached = self._centroids.get(name)
+        # Dibandingkan dengan objek vector store agar centroid ikut diperbarui saat shard di-rebuild
+        if cached is not None and cached[0] is vector_store:
+            return cached[1]
+        centroid = load_centroid(shard.index_path)
+        if centroid is None and getattr(vector_store, "index_type", "flat") == "flat":
+            centroid = compute_centroid(flat_vectors(vector_store.index))
+        self._centroids[name] = (vector_store, centroid)
+        return centroid
+
+    def query_vector_and_similarity(
+        self, query: str, shard_names: List[str] | None = None
+    ) -> Tuple[np.ndarray | None, float | None, bool]:
+        """
+        Embedding query (ter-normalisasi), kemiripan kosinus tertinggi ke centroid shard yang diminta,
+        dan apakah embedding baru dihitung. Query yang persis ada di cache shard memakai vektor
+        tersimpan, jadi pengulangan tetap tanpa embedding. Kemiripan None jika tidak ada shard atau
+        tidak ada centroid yang bisa dipakai.
+        """
+        shards = self._resolve_shards(shard_names, count_missing=False)
+        if not shards:
+            return None, None, False
+        vector = next((v for v in (shard.cached_vector(query) for _, shard in shards) if v is not None), None)
+        embedded = vector is None
+        if embedded:
+            vector = shards[0][1].embed_query(query)
+        centroids = [c for c in (self._centroid(name, shard) for name, shard in shards) if c is not None]
+        if not centroids:
+            return vector, None, embedded
+        return vector, float(max(np.dot(centroid, vector) for centroid in centroids)), embedded
+
+    def get_relevant_documents(
+        self,
+        query: str,
+        shard_names: List[str] | None = None,
+        query_vector: np.ndarray | None = None,
+    ) -> List[Document]:
+        """`query_vector` opsional: embedding yang sudah dihitung (misal oleh gerbang retrieval)."""
+        shards = self._resolve_shards(shard_names)
+        if not shards:
+            return []
+
+        vector: list[np.ndarray] = [] if query_vector is None else [query_vector]
+
+        def embed() -> np.ndarray:
+            if not vector:
+                vector.append(shards[0][1].embed_query(query))
+            return vector[0]
+
+        merged: List[Tuple[Document, float]] = []
+        for name, shard in shards:
+            self.shard_queries[name] += 1
+            merged.extend(shard.get_scored_documents(query, embed=embed))
+        if len(shards) > 1:
+            merged.sort(key=lambda item: item[1])
+        return [doc for doc, _ in merged[:self.k]]
+
+    def warmup(self) -> None:
+        """Satu pencarian dummy per shard langsung ke vector store (tanpa mengisi cache)."""
+        for shard in self.shards.values():
+            shard.vector_store.similarity_search_by_vector(shard.embed_query("warmup").tolist(), k=1)
+
+    def stats(self) -> dict:
+        return {
+            "missing_shard_requests": self.missing_shard_requests,
+            "shards": {
+                name: {"queries": self.shard_queries.get(name, 0), **shard.stats()}
+                for name, shard in self.shards.items()
+            },
+        }
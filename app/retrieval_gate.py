@@ -0,0 +1,202 @@
+import os
+import re
+import time
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+from prometheus_client import Counter
+
+from app.concurrency import run_blocking
+from app.metrics import record
+
+logger = logging.getLogger(__name__)
+
+# Matikan untuk kembali ke perilaku lama (retrieval + alat di setiap giliran)
+RETRIEVAL_GATE_ENABLED = os.environ.get("RETRIEVAL_GATE_ENABLED", "true").lower() == "true"
+# Kemiripan kosinus minimum query ke centroid shard karakter agar retrieval dijalankan.
+# Bergantung pada model embedding; nilai bawaan untuk all-MiniLM-L6-v2.
+RETRIEVAL_GATE_MIN_SIMILARITY = float(os.environ.get("RETRIEVAL_GATE_MIN_SIMILARITY", "0.2"))
+# Pesan sependek ini yang seluruh katanya sapaan/ucapan terima kasih ("hai kak", "makasih ya") tidak di-retrieve
+RETRIEVAL_GATE_CHITCHAT_MAX_WORDS = int(os.environ.get("RETRIEVAL_GATE_CHITCHAT_MAX_WORDS", "5"))
+# Ringkasan skip rate & latensi yang dihemat ditulis ke log setiap N keputusan (0 = tidak pernah)
+RETRIEVAL_GATE_LOG_EVERY = int(os.environ.get("RETRIEVAL_GATE_LOG_EVERY", "200"))
+
+_WORDS = re.compile(r"\w+")
+_LAUGHTER = re.compile(r"^(?:(?:wk)+w?|(?:ha)+h?|(?:he)+h?|(?:hi)+h?|(?:xi)+|a?ww+|o+k+e*|y+a+)$")
+# Hanya sapaan, ucapan terima kasih/persetujuan, dan sapaan orang. Kata fungsi yang bisa
+# membawa pertanyaan ("apa", "gimana", "aku", "tidak") sengaja tidak dimasukkan.
+CHITCHAT_WORDS = frozenset("""
+    hai hay hi halo hallo hello helo hey hei pagi siang sore malam met selamat good morning night
+    makasih makasi mksh trims thanks thank thx you tengkyu terima kasih
+    ok oke okay okey sip siap baik mantap mantul keren nice cool wow iya ya yoi yup yes
+    kak kakak sis bro min dong deh
+    bye dadah sampai jumpa
+""".split())
+# Frasa sapaan yang memuat kata fungsi, dibuang sebelum pengecekan kata
+_CHITCHAT_PHRASES = re.compile(r"\bapa kabar\b")
+# Permintaan pencarian lowongan yang dijawab alat; hasil alat dikirim langsung ke pengguna
+# (tool_result_node), jadi konteks RAG tidak dipakai di giliran ini. Wajib ada niat mencari plus
+# posisi: "carikan magang UI/UX", "lowongan data analyst". Pertanyaan karier seperti "tips magang
+# pertama" atau "tips cari kerja buat fresh graduate" tetap di-retrieve (alat tetap ter-bind).
+_JOB_NOUNS = r"(?:lowongan|loker|kerja|kerjaan|pekerjaan|magang|internship|jobs?|vacanc(?:y|ies))"
+_NOT_A_ROLE = r"(?!(?:yang|itu|ini|apa|untuk|buat|bagi|di|ke|dan|atau|kerja|magang|pertama|gimana|bagaimana)\b)"
+_JOB_REQUEST = re.compile(
+    rf"\b(?:(?:cari|carikan|cariin|nyari|nyariin|search|find)\s+(?:info\s+)?{_JOB_NOUNS}|lowongan|loker)"
+    rf"\s+(?:kerja\s+|magang\s+)?{_NOT_A_ROLE}[a-z]\w*",
+    re.IGNORECASE,
+)
+
+# Bobot EWMA untuk estimasi durasi embedding & pencarian (dasar estimasi latensi yang dihemat)
+_EWMA_ALPHA = 0.1
+
+GATE_DECISIONS = Counter(
+    "waifu_retrieval_gate_total",
+    "Keputusan gerbang retrieval per giliran chat",
+    ["decision", "reason"],
+)
+
+
+@dataclass
+class GateDecision:
+    retrieve: bool
+    use_tools: bool
+    reason: str
+    # Embedding query yang sudah dihitung untuk cek centroid; dipakai ulang oleh retrieval
+    query_vector: np.ndarray | None = None
+    similarity: float | None = None
+
+
+def is_job_request(text: str) -> bool:
+    return _JOB_REQUEST.search(text) is not None
+
+
+def is_chitchat(text: str) -> bool:
+    words = _WORDS.findall(_CHITCHAT_PHRASES.sub(" ", text.lower()))
+    if len(words) > RETRIEVAL_GATE_CHITCHAT_MAX_WORDS:
+        return False
+    return all(word in CHITCHAT_WORDS or _LAUGHTER.match(word) for word in words)
+
+
+class RetrievalGate:
+    """
+    Memutuskan per giliran, sebelum retrieval, apakah konteks RAG perlu diambil dan apakah
+    alat perlu di-bind ke LLM:
+    - tanpa huruf/angka (emoji, tanda baca) atau basa-basi pendek -> tanpa retrieval & tanpa alat
+    - permintaan lowongan (karakter beralat) -> alat saja, tanpa retrieval
+    - selain itu -> kemiripan embedding query ke centroid shard karakter; di bawah ambang,
+      retrieval dilewati. Query yang persis ada di cache retrieval memakai vektor tersimpan
+      (tanpa embedding); selain itu embedding dihitung sekali dan dipakai ulang oleh retrieval.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RETRIEVAL_GATE_ENABLED,
+        min_similarity: float = RETRIEVAL_GATE_MIN_SIMILARITY,
+        log_every: int = RETRIEVAL_GATE_LOG_EVERY,
+    ):
+        self.enabled = enabled
+        self.min_similarity = min_similarity
+        self.log_every = log_every
+        self.turns = 0
+        self.retrieval_skipped = 0
+        self.tools_skipped = 0
+        self.reasons: dict[str, int] = {}
+        self.gate_seconds = 0.0
+        self.saved_seconds = 0.0
+        self.saved_context_tokens = 0.0
+        self._embed_seconds: float | None = None
+        self._search_seconds: float | None = None
+        self._context_tokens: float | None = None
+
+    @staticmethod
+    def _ewma(current: float | None, value: float) -> float:
+        return value if current is None else current + _EWMA_ALPHA * (value - current)
+
+    async def decide(self, text: str, profile, retriever) -> GateDecision:
+        started = time.perf_counter()
+        decision = await self._classify(text, profile, retriever)
+        elapsed = time.perf_counter() - started
+        record("retrieval_gate", elapsed)
+        self._account(decision, profile, elapsed)
+        return decision
+
+    async def _classify(self, text: str, profile, retriever) -> GateDecision:
+        has_tools = bool(profile.tool_names)
+        can_retrieve = profile.rag and retriever is not None
+        if not self.enabled:
+            return GateDecision(can_retrieve, has_tools, "disabled")
+        if not _WORDS.search(text):
+            return GateDecision(False, False, "no_text")
+        if has_tools and is_job_request(text):
+            return GateDecision(False, True, "job_request")
+        if is_chitchat(text):
+            return GateDecision(False, False, "chitchat")
+        if not can_retrieve:
+            return GateDecision(False, has_tools, "no_rag")
+
+        started = time.perf_counter()
+        vector, similarity, embedded = await run_blocking(retriever.query_vector_and_similarity, text, profile.shards)
+        if embedded:
+            self._embed_seconds = self._ewma(self._embed_seconds, time.perf_counter() - started)
+        if similarity is None:
+            return GateDecision(True, has_tools, "no_centroid", vector)
+        if similarity < self.min_similarity:
+            return GateDecision(False, has_tools, "off_topic", vector, similarity)
+        return GateDecision(True, has_tools, "on_topic", vector, similarity)
+
+    def _account(self, decision: GateDecision, profile, elapsed: float) -> None:
+        self.turns += 1
+        self.gate_seconds += elapsed
+        self.reasons[decision.reason] = self.reasons.get(decision.reason, 0) + 1
+        # "no_rag"/"disabled" berarti memang tidak ada yang bisa di-retrieve, bukan penghematan
+        if profile.rag and not decision.retrieve and decision.reason not in ("no_rag", "disabled"):
+            self.retrieval_skipped += 1
+            # Giliran off_topic sudah membayar embedding di gerbang; yang dihemat hanya pencarian
+            saved = self._search_seconds or 0.0
+            if decision.query_vector is None:
+                saved += self._embed_seconds or 0.0
+            self.saved_seconds += saved
+            self.saved_context_tokens += self._context_tokens or 0.0
+        if profile.tool_names and not decision.use_tools:
+            self.tools_skipped += 1
+        GATE_DECISIONS.labels("retrieve" if decision.retrieve else "skip", decision.reason).inc()
+        similarity = "-" if decision.similarity is None else f"{decision.similarity:.3f}"
+        logger.debug(
+            f"Gerbang retrieval {profile.id}: {decision.reason} (kemiripan {similarity}), "
+            f"retrieval={decision.retrieve}, alat={decision.use_tools}"
+        )
+        if self.log_every and self.turns % self.log_every == 0:
+            stats = self.stats()
+            logger.info(
+                f"Gerbang retrieval: {stats['turns']} giliran, retrieval dilewati {stats['retrieval_skip_rate']:.0%}, "
+                f"alat dilewati {stats['tool_skip_rate']:.0%}, hemat ~{stats['saved_ms']:.0f} ms "
+                f"& ~{stats['saved_context_tokens']:.0f} token konteks"
+            )
+
+    def observe_retrieval(self, seconds: float, context_tokens: int) -> None:
+        """Durasi pencarian (tanpa embedding jika vektor dari gerbang) & ukuran konteks giliran yang di-retrieve."""
+        self._search_seconds = self._ewma(self._search_seconds, seconds)
+        self._context_tokens = self._ewma(self._context_tokens, context_tokens)
+
+    def stats(self) -> dict:
+        turns = self.turns
+        return {
+            "enabled": self.enabled,
+            "min_similarity": self.min_similarity,
+            "turns": turns,
+            "retrieval_skipped": self.retrieval_skipped,
+            "retrieval_skip_rate": self.retrieval_skipped / turns if turns else 0.0,
+            "tools_skipped": self.tools_skipped,
+            "tool_skip_rate": self.tools_skipped / turns if turns else 0.0,
+            "reasons": dict(self.reasons),
+            # Estimasi dari EWMA durasi embedding/pencarian giliran yang tetap di-retrieve
+            "saved_ms": self.saved_seconds * 1000,
+            "saved_context_tokens": self.saved_context_tokens,
+            "gate_ms_avg": self.gate_seconds * 1000 / turns if turns else 0.0,
+            "embed_ms_ewma": (self._embed_seconds or 0.0) * 1000,
+            "search_ms_ewma": (self._search_seconds or 0.0) * 1000,
+        }
+
+
+retrieval_gate = RetrievalGate()
@@ -0,0 +1,152 @@
+import os
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List
+
+from app.db import AsyncSessionLocal
+from app.history_cache import ConversationKey, HistoryItem
+from app.models import ConversationSummary
+
+logger = logging.getLogger(__name__)
+
+# Pesan terbaru yang selalu dikirim apa adanya (tidak diringkas)
+SUMMARY_KEEP_RECENT = int(os.environ.get("SUMMARY_KEEP_RECENT", "6"))
+# Ringkasan baru diperbarui jika ada minimal sekian pesan lama yang belum diringkas
+SUMMARY_MIN_NEW_MESSAGES = int(os.environ.get("SUMMARY_MIN_NEW_MESSAGES", "6"))
+SUMMARY_MAX_WORDS = int(os.environ.get("SUMMARY_MAX_WORDS", "150"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get("SUMMARY_CACHE_MAX_ENTRIES", "5000"))
+
+SUMMARY_PROMPT = """Kamu merangkum percakapan antara pengguna dan karakter {character_id}.
+Perbarui ringkasan lama dengan pesan-pesan baru di bawah. Pertahankan fakta tentang pengguna
+(nama panggilan, tujuan, preferensi, masalah), topik yang sudah dibahas, dan janji/rencana yang dibuat.
+Tulis maksimal {max_words} kata dalam bahasa Indonesia, tanpa pembuka atau penutup.
+
+RINGKASAN LAMA:
+{previous}
+
+PESAN BARU:
+{transcript}
+
+RINGKASAN BARU:"""
+
+
+@dataclass
+class SummaryState:
+    summary: str
+    covered_until: datetime
+    message_count: int
+
+
+def unsummarized(history: List[HistoryItem], state: SummaryState | None) -> List[HistoryItem]:
+    """Pesan yang belum tercakup ringkasan (lebih baru dari `covered_until`)."""
+    if state is None:
+        return history
+    return [item for item in history if item[2] > state.covered_until]
+
+
+class SummaryStore:
+    """
+    Ringkasan bergulir per (user_id, character_id): dibaca dari tabel ConversationSummary sekali,
+    lalu disimpan di LRU in-process dan diperbarui write-through oleh `refresh`.
+    """
+
+    def __init__(self, max_entries: int = SUMMARY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[ConversationKey, SummaryState | None] = OrderedDict()
+        self._refreshing: set[ConversationKey] = set()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.folded_messages = 0
+        self.failures = 0
+
+    async def get(self, key: ConversationKey) -> SummaryState | None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        async with AsyncSessionLocal() as session:
+            row = await session.get(ConversationSummary, key)
+        state = SummaryState(row.summary, row.covered_until, row.message_count) if row else None
+        self._store(key, state)
+        return state
+
+    def _store(self, key: ConversationKey, state: SummaryState | None) -> None:
+        self._entries[key] = state
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def refresh(self, key: ConversationKey, history: List[HistoryItem], llm) -> None:
+        """
+        Lipat pesan lama yang belum diringkas ke dalam ringkasan (background task setelah chat).
+        Hanya berjalan jika pesan lama yang tertunda >= SUMMARY_MIN_NEW_MESSAGES, sehingga LLM
+        dipanggil sekali per beberapa giliran, bukan setiap request.
+        """
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        try:
+            state = await self.get(key)
+            pending = unsummarized(history, state)
+            to_fold = pending[:max(0, len(pending) - SUMMARY_KEEP_RECENT)]
+            # Jangan memisahkan pesan dengan timestamp sama (satu giliran) ke dua sisi batas ringkasan
+            while to_fold and len(to_fold) < len(pending) and pending[len(to_fold)][2] == to_fold[-1][2]:
+                to_fold.pop()
+            if len(to_fold) < SUMMARY_MIN_NEW_MESSAGES:
+                return
+
+            transcript = "\n".join(
+                f"{'Pengguna' if role == 'human' else 'Karakter'}: {content}" for role, content, _ in to_fold
+            )
+            prompt = SUMMARY_PROMPT.format(
+                character_id=key[1],
+                max_words=SUMMARY_MAX_WORDS,
+                previous=state.summary if state else "(belum ada)",
+                transcript=transcript,
+            )
+            response = await llm.ainvoke(prompt)
+            summary = response.content if isinstance(response.content, str) else str(response.content)
+            new_state = SummaryState(
+                summary=summary.strip(),
+                covered_until=to_fold[-1][2],
+                message_count=(state.message_count if state else 0) + len(to_fold),
+            )
+
+            async with AsyncSessionLocal() as session:
+                row = await session.get(ConversationSummary, key)
+                if row is None:
+                    row = ConversationSummary(user_id=key[0], character_id=key[1], summary="", covered_until=new_state.covered_until)
+                row.summary = new_state.summary
+                row.covered_until = new_state.covered_until
+                row.message_count = new_state.message_count
+                row.updated_at = datetime.utcnow()
+                session.add(row)
+                await session.commit()
+            self._store(key, new_state)
+            self.refreshes += 1
+            self.folded_messages += len(to_fold)
+            logger.info(f"Ringkasan {key} diperbarui: {len(to_fold)} pesan dilipat, total {new_state.message_count}.")
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Gagal memperbarui ringkasan percakapan {key}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "folded_messages": self.folded_messages,
+            "failures": self.failures,
+            "entries": len(self._entries),
+        }
+
+
+summary_store = SummaryStore()
@@ -1,12 +1,14 @@
-from typing import Optional
+from typing import Any, Dict, Optional
 from fastapi import Depends, Request # <-- 1. Tambahkan impor 'Request'
 from fastapi_users import FastAPIUsers, BaseUserManager, IntegerIDMixin
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport, JWTStrategy
 from fastapi_users.password import PasswordHelper
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from fastapi_users_db_sqlmodel import SQLModelUserDatabase
 
+from app.auth_cache import auth_user_cache
 from app.db import get_async_session
 from app.models import User, UserCreate
 
@@ -23,7 +25,31 @@ class CustomSQLModelUserDatabase(SQLModelUserDatabase[User, int]):
         return results.first()
 
     async def get(self, id: int) -> Optional[User]:
-        return await self.session.get(self.user_model, id)
+        if not auth_user_cache.enabled:
+            return await self.session.get(self.user_model, id)
+        values = auth_user_cache.get(id)
+        if values is not None:
+            # Lampirkan ke sesi request ini sebagai baris yang sudah ada, tanpa SELECT (load=False)
+            user = self.user_model(**values)
+            make_transient_to_detached(user)
+            return await self.session.merge(user, load=False)
+        version = auth_user_cache.version(id)
+        user = await self.session.get(self.user_model, id)
+        if user is not None:
+            auth_user_cache.set(id, user.model_dump(), version)
+        return user
+
+    # Semua perubahan user (PATCH /users/me, /users/{id}, nonaktifkan, reset password, verifikasi)
+    # lewat dua method ini, jadi invalidasi cache cukup di sini
+    async def update(self, user: User, update_dict: Dict[str, Any]) -> User:
+        user = await super().update(user, update_dict)
+        auth_user_cache.invalidate(user.id)
+        return user
+
+    async def delete(self, user: User) -> None:
+        user_id = user.id
+        await super().delete(user)
+        auth_user_cache.invalidate(user_id)
 
 
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
@@ -86,4 +112,5 @@ fastapi_users = FastAPIUsers[User, int](
 
 # === Dependency untuk endpoint ===
 current_active_user = fastapi_users.current_user(active=True)
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
 
@@ -0,0 +1,265 @@
+import io
+import os
+import json
+import math
+import mmap
+import logging
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Metadata tipe indeks disimpan di samping file FAISS agar server memuatnya dengan parameter yang sama
+INDEX_META_FILENAME = "index_meta.json"
+# Indeks pencarian untuk server disimpan terpisah (di-mmap oleh semua worker);
+# index.faiss + index.pkl (flat, LangChain) hanya dipakai builder untuk build inkremental.
+SEARCH_INDEX_FILENAME = "index_search.faiss"
+# Docstore ringkas: teks + metadata chunk dalam urutan ID FAISS, diakses lewat tabel offset
+DOCSTORE_FILENAME = "docstore.bin"
+DOCSTORE_OFFSETS_FILENAME = "docstore_offsets.npy"
+# Rata-rata arah (ter-normalisasi) semua chunk shard; dipakai gerbang retrieval (app/retrieval_gate.py)
+CENTROID_FILENAME = "centroid.npy"
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf_flat": {"nlist": 100, "nprobe": 10},
+    "hnsw": {"m": 32, "ef_construction": 200, "ef_search": 64},
+    "ivf_pq": {"nlist": 100, "nprobe": 10, "pq_m": 48, "pq_nbits": 8},
+}
+
+
+def resolve_params(index_type: str, overrides: dict | None = None) -> dict:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipe indeks tidak dikenal: {index_type}. Pilihan: {', '.join(INDEX_TYPES)}")
+    params = dict(DEFAULT_INDEX_PARAMS[index_type])
+    params.update({k: v for k, v in (overrides or {}).items() if k in params and v is not None})
+    return params
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str, params: dict):
+    """
+    Bangun indeks FAISS dari matriks vektor (urutan baris = ID internal FAISS, sama dengan indeks flat,
+    sehingga `index_to_docstore_id` bisa dipakai bersama). Parameter disesuaikan jika korpus terlalu kecil.
+    """
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        # FAISS menyarankan minimal ~39 titik latih per centroid
+        nlist = max(1, min(params["nlist"], n // 39))
+        if nlist != params["nlist"]:
+            logger.warning(f"nlist diturunkan dari {params['nlist']} ke {nlist} karena korpus hanya {n} vektor.")
+        quantizer = faiss.IndexFlatL2(d)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist)
+        else:
+            if d % params["pq_m"] != 0:
+                raise ValueError(f"pq_m={params['pq_m']} harus membagi dimensi {d}.")
+            nbits = max(1, min(params["pq_nbits"], int(math.log2(max(n, 2)))))
+            if nbits != params["pq_nbits"]:
+                logger.warning(f"pq_nbits diturunkan dari {params['pq_nbits']} ke {nbits} karena korpus hanya {n} vektor.")
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, params["pq_m"], nbits)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Tipe indeks tidak dikenal: {index_type}")
+
+    index.add(vectors)
+    apply_search_params(index, index_type, params)
+    return index
+
+
+def apply_search_params(index, index_type: str, params: dict) -> None:
+    """Parameter waktu-cari (nprobe / efSearch) tidak selalu ikut tersimpan, jadi set ulang setelah load."""
+    import faiss
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    elif index_type == "hnsw":
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def flat_vectors(index) -> np.ndarray:
+    """Ambil semua vektor dari indeks flat (urutan ID internal)."""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def compute_centroid(vectors: np.ndarray) -> np.ndarray:
+    """Rata-rata vektor ter-normalisasi L2, dinormalisasi lagi (arah topik shard)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    centroid = unit.mean(axis=0)
+    return (centroid / max(float(np.linalg.norm(centroid)), 1e-12)).astype(np.float32)
+
+
+def write_centroid(vectors: np.ndarray, index_dir: str) -> None:
+    buffer = io.BytesIO()
+    np.save(buffer, compute_centroid(vectors))
+    _atomic_write(os.path.join(index_dir, CENTROID_FILENAME), buffer.getvalue())
+
+
+def load_centroid(index_dir: str) -> np.ndarray | None:
+    path = os.path.join(index_dir, CENTROID_FILENAME)
+    if not os.path.exists(path):
+        return None
+    return np.load(path)
+
+
+def save_index_meta(index_dir: str, index_type: str, params: dict) -> None:
+    meta = {"type": index_type, "params": params, "file": SEARCH_INDEX_FILENAME}
+    _atomic_write(os.path.join(index_dir, INDEX_META_FILENAME), json.dumps(meta, indent=2).encode("utf-8"))
+
+
+def load_index_meta(index_dir: str) -> dict:
+    """Indeks lama tanpa metadata dianggap flat."""
+    path = os.path.join(index_dir, INDEX_META_FILENAME)
+    if not os.path.exists(path):
+        return {"type": "flat", "params": {}, "file": "index.faiss"}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """
+    Tulis ke file sementara lalu os.replace: worker yang masih me-mmap file lama tetap
+    membaca inode lama yang utuh, bukan file yang sedang ditimpa.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_search_index(index, index_dir: str) -> None:
+    import faiss
+
+    tmp_path = os.path.join(index_dir, f"{SEARCH_INDEX_FILENAME}.tmp")
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, os.path.join(index_dir, SEARCH_INDEX_FILENAME))
+
+
+def write_docstore(documents, index_dir: str) -> None:
+    """
+    Simpan chunk (urutan = ID internal FAISS) sebagai JSON per record yang disambung di docstore.bin,
+    plus docstore_offsets.npy (int64, panjang n+1). Tidak ada pickle yang perlu dimuat oleh server.
+    """
+    offsets = [0]
+    chunks = []
+    for doc in documents:
+        record = json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False).encode("utf-8")
+        chunks.append(record)
+        offsets.append(offsets[-1] + len(record))
+    _atomic_write(os.path.join(index_dir, DOCSTORE_FILENAME), b"".join(chunks))
+
+    tmp_path = os.path.join(index_dir, f"{DOCSTORE_OFFSETS_FILENAME}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.asarray(offsets, dtype=np.int64))
+    os.replace(tmp_path, os.path.join(index_dir, DOCSTORE_OFFSETS_FILENAME))
+
+
+def has_mmap_format(index_dir: str) -> bool:
+    return all(
+        os.path.exists(os.path.join(index_dir, name))
+        for name in (INDEX_META_FILENAME, SEARCH_INDEX_FILENAME, DOCSTORE_FILENAME, DOCSTORE_OFFSETS_FILENAME)
+    )
+
+
+class MmapDocstore:
+    """Docstore read-only berbasis mmap; halaman file dibagi lewat page cache antar worker."""
+
+    def __init__(self, index_dir: str):
+        self.offsets = np.load(os.path.join(index_dir, DOCSTORE_OFFSETS_FILENAME), mmap_mode="r")
+        self._file = open(os.path.join(index_dir, DOCSTORE_FILENAME), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, i: int) -> Document:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        record = json.loads(self._mm[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+
+# Tipe indeks yang datanya (inverted list IVF) sudah di-mmap dengan IO_FLAG_MMAP saja;
+# flat & HNSW butuh IO_FLAG_MMAP_IFC (faiss >= 1.10), tanpa itu kodenya disalin ke heap tiap worker
+_MMAP_WITHOUT_IFC = ("ivf_flat", "ivf_pq")
+_warned_copied_types: set[str] = set()
+
+
+def mmap_shares_index(index_type: str) -> bool:
+    """True jika data indeks tipe ini dibagi antar worker lewat page cache dengan faiss yang terpasang."""
+    import faiss
+
+    return index_type in _MMAP_WITHOUT_IFC or hasattr(faiss, "IO_FLAG_MMAP_IFC")
+
+
+class MmapVectorStore:
+    """
+    Vector store read-only untuk server: indeks FAISS dimuat dengan mmap dan chunk dibaca dari
+    MmapDocstore. Antarmukanya cukup untuk SemanticRetrievalCache (`embeddings`,
+    `similarity_search_by_vector`).
+    """
+
+    def __init__(self, index_dir: str, embeddings):
+        import faiss
+
+        meta = load_index_meta(index_dir)
+        # IO_FLAG_MMAP memetakan inverted list IVF; IO_FLAG_MMAP_IFC (faiss >= 1.10) juga
+        # memetakan kode IndexFlat/HNSW sehingga tidak disalin ke heap tiap worker.
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        self.index = faiss.read_index(os.path.join(index_dir, meta["file"]), flags)
+        apply_search_params(self.index, meta["type"], meta["params"])
+        self.index_type = meta["type"]
+        self.shared = mmap_shares_index(self.index_type)
+        if not self.shared and self.index_type not in _warned_copied_types:
+            _warned_copied_types.add(self.index_type)
+            logger.warning(
+                f"faiss {faiss.__version__} tidak punya IO_FLAG_MMAP_IFC (butuh >= 1.10): indeks {self.index_type} "
+                f"disalin ke memori tiap worker, hanya docstore yang dibagi. Perbarui faiss-cpu atau pakai ivf_flat/ivf_pq."
+            )
+        self.docstore = MmapDocstore(index_dir)
+        self.embeddings = embeddings
+        if self.index.ntotal != len(self.docstore):
+            raise ValueError(f"Indeks ({self.index.ntotal}) dan docstore ({len(self.docstore)}) tidak sinkron; jalankan ulang create_vector_store.py.")
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4) -> list[tuple[Document, float]]:
+        """Sama seperti LangChain FAISS: skor = jarak L2 (makin kecil makin relevan)."""
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        distances, ids = self.index.search(query, k)
+        return [(self.docstore.get(int(i)), float(d)) for d, i in zip(distances[0], ids[0]) if i >= 0]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+
+def has_index(index_dir: str) -> bool:
+    """Direktori berisi indeks yang bisa dimuat (format mmap atau format LangChain lama)."""
+    return has_mmap_format(index_dir) or os.path.exists(os.path.join(index_dir, "index.faiss"))
+
+
+def list_shards(index_root: str) -> list[str]:
+    """
+    Nama shard (= nama subfolder knowledge_base) yang sudah dibangun di bawah `index_root`.
+    Direktori berawalan titik adalah build/penghapusan yang sedang berjalan dan diabaikan.
+    """
+    if not os.path.isdir(index_root):
+        return []
+    return sorted(
+        name for name in os.listdir(index_root)
+        if not name.startswith(".")
+        and os.path.isdir(os.path.join(index_root, name))
+        and has_index(os.path.join(index_root, name))
+    )
@@ -0,0 +1,108 @@
+"""
+Benchmark konkurensi pipeline chat (LangGraph agent) dengan LLM stub.
+
+Menjalankan N chat paralel terhadap `chat_agent.ainvoke` dan melaporkan latensi p50/p99,
+throughput, serta lag maksimum event loop (indikator apakah ada pemanggilan yang memblokir).
+
+Contoh:
+    python benchmark_chat_concurrency.py --concurrency 50 --requests 200 --llm-latency 0.5
+    python benchmark_chat_concurrency.py --blocking   # simulasikan perilaku lama (invoke sinkron)
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
+
+import app.agent as agent
+from app.providers import StubChatModel
+
+
+class StubRetriever:
+    """Retriever palsu: waktu CPU/IO sinkron tetap, seperti embedding + pencarian FAISS."""
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def query_vector_and_similarity(self, query: str, shard_names: Optional[List[str]] = None):
+        # Tanpa centroid: gerbang retrieval selalu meneruskan ke retrieval (beban benchmark tetap sama)
+        return None, None, False
+
+    def get_relevant_documents(self, query: str, shard_names: Optional[List[str]] = None, query_vector=None) -> List[Document]:
+        time.sleep(self.latency)
+        return [Document(page_content=f"konteks untuk: {query}")] * 3
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Ukur keterlambatan terbesar event loop selama benchmark berjalan."""
+    max_lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    stub = StubChatModel(latency=args.llm_latency, token_delay=0.0, blocking=args.blocking)
+    agent.llm_resource.override(stub)
+    if args.real_retriever:
+        await agent.general_retriever_resource.aget()
+    else:
+        agent.general_retriever_resource.override(StubRetriever(args.retrieval_latency))
+
+    characters = ["AIKO_CHAN", "HINATA_CHAN", "YUNA_CHAN"]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+
+    async def one_chat(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await agent.chat_agent.ainvoke({
+                "character_id": characters[i % len(characters)],
+                "messages": [HumanMessage(content=f"halo, ini pesan nomor {i}")],
+                "user_name": "Penguji",
+                "summary": "",
+            })
+            latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one_chat(i) for i in range(args.requests)))
+    wall = time.perf_counter() - wall_start
+    stop.set()
+    max_lag = await lag_task
+
+    mode = "blocking (lama)" if args.blocking else "async"
+    print(f"Mode                : {mode}")
+    print(f"Request / paralel   : {args.requests} / {args.concurrency}")
+    print(f"Latensi LLM stub    : {args.llm_latency * 1000:.0f} ms")
+    print(f"p50                 : {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"p99                 : {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"rata-rata           : {statistics.mean(latencies) * 1000:.1f} ms")
+    print(f"throughput          : {len(latencies) / wall:.1f} chat/detik")
+    print(f"lag maks event loop : {max_lag * 1000:.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark konkurensi /api/chat dengan LLM stub.")
+    parser.add_argument("--concurrency", type=int, default=50, help="Jumlah chat paralel.")
+    parser.add_argument("--requests", type=int, default=200, help="Total chat yang dijalankan.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Latensi LLM stub (detik).")
+    parser.add_argument("--retrieval-latency", type=float, default=0.02, help="Latensi retriever stub (detik).")
+    parser.add_argument("--real-retriever", action="store_true", help="Gunakan retriever FAISS asli.")
+    parser.add_argument("--blocking", action="store_true", help="Simulasikan LLM yang memblokir event loop.")
+    asyncio.run(run_benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
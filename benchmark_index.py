@@ -0,0 +1,114 @@
+"""
+Benchmark tipe indeks FAISS terhadap baseline flat (pencarian exhaustive).
+
+Vektor diambil dari indeks yang sudah dibangun oleh create_vector_store.py (tanpa embedding ulang).
+Query berupa vektor korpus yang diberi noise kecil, atau teks dari file (--queries, satu query per baris).
+Untuk setiap tipe dilaporkan: recall@k terhadap flat, latensi query p50/p99, waktu build, dan ukuran indeks.
+
+Contoh:
+    python benchmark_index.py --k 3 --num-queries 500
+    python benchmark_index.py --types flat hnsw --ef-search 32 --queries pertanyaan.txt
+    python benchmark_index.py --synthetic 100000   # simulasi korpus besar dengan vektor acak
+"""
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+from app.vector_index import INDEX_TYPES, build_ann_index, flat_vectors, list_shards, resolve_params
+
+FAISS_INDEX_PATH = "faiss_index_all_subjects"
+
+
+def load_corpus(args: argparse.Namespace) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(args.seed)
+        vectors = rng.standard_normal((args.synthetic, 384)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Satu shard (--shard) atau gabungan semua shard; fallback ke indeks gabungan lama
+    shards = [args.shard] if args.shard else list_shards(FAISS_INDEX_PATH)
+    paths = [f"{FAISS_INDEX_PATH}/{name}/index.faiss" for name in shards] or [f"{FAISS_INDEX_PATH}/index.faiss"]
+    return np.concatenate([flat_vectors(faiss.read_index(path)) for path in paths])
+
+
+def load_queries(args: argparse.Namespace, corpus: np.ndarray) -> np.ndarray:
+    if args.queries:
+        from app.embeddings import get_embedding_service
+
+        with open(args.queries, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        return np.asarray(get_embedding_service().encode(texts), dtype=np.float32)
+    rng = np.random.default_rng(args.seed)
+    picks = rng.choice(len(corpus), size=args.num_queries, replace=len(corpus) < args.num_queries)
+    noisy = corpus[picks] + rng.normal(scale=args.noise, size=(len(picks), corpus.shape[1])).astype(np.float32)
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def query_latencies(index, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Cari satu per satu (seperti satu request chat) dan catat latensinya."""
+    results = np.empty((len(queries), k), dtype=np.int64)
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies[i] = time.perf_counter() - start
+        results[i] = ids[0]
+    return results, latencies
+
+
+def recall_at_k(results: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(r[r >= 0]) & set(t)) for r, t in zip(results, truth))
+    return hits / truth.size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark recall/latensi tipe indeks FAISS.")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--queries", help="File teks berisi satu query per baris.")
+    parser.add_argument("--noise", type=float, default=0.02, help="Simpangan noise untuk query sintetis.")
+    parser.add_argument("--synthetic", type=int, default=0, help="Gunakan N vektor acak sebagai korpus.")
+    parser.add_argument("--shard", help="Benchmark satu shard subjek saja (default: semua shard digabung).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--m", type=int)
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--ef-search", type=int)
+    parser.add_argument("--pq-m", type=int)
+    parser.add_argument("--pq-nbits", type=int)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    queries = load_queries(args, corpus)
+    k = min(args.k, len(corpus))
+    overrides = {
+        "nlist": args.nlist, "nprobe": args.nprobe, "m": args.m, "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search, "pq_m": args.pq_m, "pq_nbits": args.pq_nbits,
+    }
+    print(f"Korpus: {len(corpus)} vektor berdimensi {corpus.shape[1]}, {len(queries)} query, k={k}\n")
+
+    flat = build_ann_index(corpus, "flat", {})
+    truth, _ = flat.search(queries, k)
+
+    header = f"{'tipe':<10} {'recall@k':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'build (s)':>10} {'ukuran (MB)':>12}  parameter"
+    print(header)
+    print("-" * len(header))
+    for index_type in args.types:
+        params = resolve_params(index_type, overrides)
+        start = time.perf_counter()
+        index = build_ann_index(corpus, index_type, params)
+        build_seconds = time.perf_counter() - start
+        results, latencies = query_latencies(index, queries, k)
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        print(
+            f"{index_type:<10} {recall_at_k(results, truth):>9.3f} "
+            f"{np.percentile(latencies, 50) * 1000:>9.3f} {np.percentile(latencies, 99) * 1000:>9.3f} "
+            f"{build_seconds:>10.2f} {size_mb:>12.2f}  {params}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark cache pencarian kerja terhadap server SerpAPI palsu (fake_serpapi.py).
+Mengirim banyak pencarian paralel dengan sedikit variasi query (huruf besar/spasi berbeda),
+lalu membandingkan jumlah panggilan keluar yang diterima server dengan jumlah pencarian.
+
+    uvicorn fake_serpapi:app --port 8100
+    python benchmark_job_search.py --searches 200 --distinct 10 --rounds 2
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+
+from app.job_search_cache import JobSearchCache
+from app.providers import CachedJobSearch, SerpApiJobSearch
+
+QUERIES = [
+    "lowongan python", "data analyst", "frontend developer", "machine learning engineer",
+    "backend golang", "ui ux designer", "devops", "qa engineer", "data engineer", "android developer",
+]
+LOCATIONS = ["Jakarta", "Bandung", "Surabaya", "Yogyakarta", "Indonesia"]
+
+
+def variant(query: str) -> str:
+    """Variasi penulisan yang harus dinormalisasi ke kunci cache yang sama."""
+    return random.choice([query, query.upper(), f"  {query} ", query.title(), query.replace(" ", "  ")])
+
+
+async def run(args: argparse.Namespace) -> None:
+    os.environ.setdefault("SERPAPI_API_KEY", "fake")
+    pairs = [(q, loc) for q in QUERIES for loc in LOCATIONS][:args.distinct]
+    provider = SerpApiJobSearch(base_url=args.base_url)
+    job_search = CachedJobSearch(provider, JobSearchCache(ttl_seconds=args.ttl, path=args.cache_path))
+
+    async with httpx.AsyncClient(base_url=args.base_url) as admin:
+        await admin.post("/reset")
+        for round_no in range(1, args.rounds + 1):
+            searches = [random.choice(pairs) for _ in range(args.searches)]
+            start = time.perf_counter()
+            results = await asyncio.gather(*(job_search.search(variant(q), loc) for q, loc in searches))
+            elapsed = time.perf_counter() - start
+            upstream = (await admin.get("/stats")).json()["total_requests"]
+            ok = sum(1 for r in results if r.get("jobs_results"))
+            print(f"Putaran {round_no}: {args.searches} pencarian ({ok} berhasil) dalam {elapsed:.2f} s, "
+                  f"total panggilan ke SerpAPI sejauh ini: {upstream}")
+    print(f"Statistik cache: {job_search.cache.stats()}")
+    await job_search.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cache & deduplikasi pencarian kerja.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8100")
+    parser.add_argument("--searches", type=int, default=200, help="Pencarian paralel per putaran.")
+    parser.add_argument("--distinct", type=int, default=10, help="Jumlah pasangan (query, lokasi) berbeda.")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--ttl", type=float, default=1800)
+    parser.add_argument("--cache-path", default="", help="File JSON cache (kosong = in-memory).")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
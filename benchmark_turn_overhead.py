@@ -0,0 +1,109 @@
+"""
+Microbenchmark overhead per giliran chat di luar panggilan LLM.
+
+Membandingkan cara lama (format ulang system prompt, bangun ChatPromptTemplate, dan pipe
+`prompt | llm` di setiap giliran, dispatch if/elif) dengan registry karakter yang dikompilasi
+sekali (app/characters.py). LLM diganti stub tanpa latensi; waktu stub saja diukur terpisah
+lalu dikurangkan, sehingga angka yang dilaporkan adalah overhead murni per giliran.
+
+Contoh:
+    python benchmark_turn_overhead.py --turns 2000 --history 12
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from app.agent import TOOLS_BY_NAME
+from app.characters import CHARACTERS, DEFAULT_CONTEXT_PROMPT
+from app.providers import StubChatModel
+from app.waifu import WAIFU
+
+CONTEXT = "Portofolio yang baik berisi 3-5 proyek nyata dengan deskripsi dampak. " * 20
+SUMMARY = "\n\nRINGKASAN PERCAKAPAN SEBELUMNYA DENGAN PENGGUNA:\nPengguna mahasiswa semester 5, tertarik data."
+
+
+async def legacy_turn(character_id: str, llm, llm_with_tools, history: List[BaseMessage], user_input: str) -> None:
+    """Replika jalur lama: semua prompt dibangun ulang per request."""
+    character = WAIFU[character_id]
+    system_prompt = character["system_prompt"].format(user_name="Budi") + SUMMARY.replace("{", "{{").replace("}", "}}")
+    if character_id == "HINATA_CHAN":
+        system = f"{system_prompt}{character['context_prompt']}"
+        model = llm_with_tools
+    elif character_id == "YUNA_CHAN":
+        system = system_prompt + DEFAULT_CONTEXT_PROMPT
+        model = llm
+    else:
+        system = system_prompt
+        model = llm
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}"),
+    ])
+    chain = prompt | model
+    await chain.ainvoke({"chat_history": history, "input": user_input, "context": CONTEXT})
+
+
+async def registry_turn(character_id: str, llm, history: List[BaseMessage], user_input: str) -> None:
+    profile = CHARACTERS[character_id]
+    variables = {"user_name": "Budi", "summary": SUMMARY, "chat_history": history, "input": user_input}
+    if profile.rag:
+        variables["context"] = CONTEXT
+    await profile.chain(llm, TOOLS_BY_NAME).ainvoke(variables)
+
+
+async def measure(turn, turns: int) -> List[float]:
+    for i in range(min(100, turns)):
+        await turn(i)
+    samples = []
+    for i in range(turns):
+        start = time.perf_counter()
+        await turn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def run(args: argparse.Namespace) -> None:
+    llm = StubChatModel(latency=0.0, token_delay=0.0, output_tokens=args.output_tokens)
+    llm_with_tools = llm.bind_tools(list(TOOLS_BY_NAME.values()))
+    characters = list(WAIFU)
+    history: List[BaseMessage] = []
+    for i in range(args.history // 2):
+        history += [HumanMessage(content=f"pertanyaan ke-{i} tentang karir"), AIMessage(content=f"jawaban ke-{i} " * 20)]
+    user_input = "Bagaimana cara menyusun portofolio data analyst?"
+    messages = history + [HumanMessage(content=user_input)]
+
+    results = {
+        "stub LLM saja": await measure(lambda i: llm.ainvoke(messages), args.turns),
+        "lama (per request)": await measure(
+            lambda i: legacy_turn(characters[i % len(characters)], llm, llm_with_tools, history, user_input), args.turns
+        ),
+        "registry": await measure(
+            lambda i: registry_turn(characters[i % len(characters)], llm, history, user_input), args.turns
+        ),
+    }
+    baseline = statistics.median(results["stub LLM saja"])
+    print(f"{'jalur':<20} {'p50 us':>9} {'p99 us':>9} {'overhead p50 us':>16}")
+    for name, samples in results.items():
+        ordered = sorted(samples)
+        p50 = statistics.median(ordered)
+        p99 = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+        overhead = "-" if name == "stub LLM saja" else f"{(p50 - baseline) * 1e6:.0f}"
+        print(f"{name:<20} {p50 * 1e6:>9.0f} {p99 * 1e6:>9.0f} {overhead:>16}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmark overhead per giliran chat (di luar LLM).")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--history", type=int, default=12, help="Jumlah pesan riwayat per giliran.")
+    parser.add_argument("--output-tokens", type=int, default=5, help="Token jawaban stub (kecil agar LLM murah).")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Ukur memori per worker saat memuat vector store: format lama (index.pkl + indeks di heap)
+vs format mmap (index_search.faiss + docstore.bin dibagi lewat page cache).
+
+N proses dijalankan bersamaan (seperti `uvicorn --workers N`). Masing-masing memuat indeks,
+menjalankan sejumlah pencarian acak, lalu melaporkan RSS dan PSS dari /proc (Linux).
+PSS membagi halaman bersama secara adil antar proses, jadi total PSS ~ memori fisik sebenarnya.
+Model embedding tidak dimuat; query berupa vektor acak berdimensi sama dengan indeks.
+
+Contoh:
+    python create_vector_store.py            # pastikan format mmap sudah ditulis
+    python benchmark_worker_memory.py --workers 4 --mode both
+"""
+import os
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+FAISS_INDEX_PATH = "faiss_index_all_subjects"
+
+
+def read_memory_kb() -> dict:
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                memory["rss"] = int(line.split()[1])
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    memory["pss"] = int(line.split()[1])
+    except FileNotFoundError:
+        memory["pss"] = None
+    return memory
+
+
+class _NoEmbeddings:
+    """
+    Model embedding tidak dimuat agar RSS hanya mencerminkan vector store; benchmark hanya
+    memanggil pencarian by-vector, jadi panggilan embedding berarti ada jalur yang salah.
+    """
+
+    def embed_query(self, text):
+        raise RuntimeError("benchmark_worker_memory tidak memuat model embedding; gunakan pencarian by-vector.")
+
+    def embed_documents(self, texts):
+        raise RuntimeError("benchmark_worker_memory tidak memuat model embedding; gunakan pencarian by-vector.")
+
+
+def load_stores(mode: str, index_root: str) -> list:
+    """Muat semua shard subjek (atau indeks gabungan lama jika shard belum dibangun)."""
+    from app.vector_index import list_shards
+
+    paths = [os.path.join(index_root, name) for name in list_shards(index_root)] or [index_root]
+    if mode == "mmap":
+        from app.vector_index import MmapVectorStore
+
+        return [MmapVectorStore(path, _NoEmbeddings()) for path in paths]
+    from langchain_community.vectorstores import FAISS
+
+    return [FAISS.load_local(path, _NoEmbeddings(), allow_dangerous_deserialization=True) for path in paths]
+
+
+def worker(mode: str, index_root: str, num_queries: int, seed: int, loaded: mp.Barrier, done: mp.Barrier, results) -> None:
+    baseline = read_memory_kb()
+    stores = load_stores(mode, index_root)
+    rng = np.random.default_rng(seed)
+    for i in range(num_queries):
+        store = stores[i % len(stores)]
+        vector = rng.standard_normal(store.index.d).astype(np.float32)
+        store.similarity_search_by_vector(vector.tolist(), k=3)
+    # Tunggu semua worker selesai memuat agar PSS mencerminkan halaman yang benar-benar dibagi
+    loaded.wait()
+    after = read_memory_kb()
+    results.put({"baseline": baseline, "after": after})
+    done.wait()
+
+
+def run(mode: str, args: argparse.Namespace) -> None:
+    ctx = mp.get_context("spawn")
+    loaded, done = ctx.Barrier(args.workers), ctx.Barrier(args.workers + 1)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(mode, args.index_path, args.num_queries, args.seed + i, loaded, done, results))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    done.wait()
+    for process in processes:
+        process.join()
+
+    def total(key: str, when: str) -> float:
+        values = [r[when][key] for r in reports]
+        return sum(values) / 1024 if None not in values else float("nan")
+
+    delta_rss = total("rss", "after") - total("rss", "baseline")
+    print(f"{mode:<7} {args.workers:>7} {total('rss', 'after'):>12.1f} {total('pss', 'after'):>12.1f} {delta_rss / args.workers:>18.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bandingkan RSS/PSS worker untuk vector store pickle vs mmap.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--index-path", default=FAISS_INDEX_PATH, help="Folder berisi shard (atau indeks gabungan lama).")
+    parser.add_argument("--mode", choices=["legacy", "mmap", "both"], default="both")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import faiss
+    from app.vector_index import mmap_shares_index
+
+    print(f"faiss {faiss.__version__}, IO_FLAG_MMAP_IFC: {'ada' if hasattr(faiss, 'IO_FLAG_MMAP_IFC') else 'tidak ada'}")
+    for index_type in ("flat", "hnsw", "ivf_flat", "ivf_pq"):
+        status = "dibagi (mmap)" if mmap_shares_index(index_type) else "disalin per worker"
+        print(f"  indeks {index_type:<8} {status}")
+    # Angka di bawah adalah hasil ukur; `+RSS/worker` menunjukkan berapa yang benar-benar disalin per proses
+    header = f"{'mode':<7} {'workers':>7} {'RSS (MB)':>12} {'PSS (MB)':>12} {'+RSS/worker (MB)':>18}"
+    print(header)
+    print("-" * len(header))
+    for mode in (["legacy", "mmap"] if args.mode == "both" else [args.mode]):
+        run(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+import argparse
+import hashlib
+import json
 import logging
 import os # Impor os untuk menghapus folder lama
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.vector_index import (
+    INDEX_TYPES,
+    build_ann_index,
+    flat_vectors,
+    list_shards,
+    load_index_meta,
+    resolve_params,
+    save_index_meta,
+    write_centroid,
+    write_docstore,
+    write_search_index,
+)
 
 # Konfigurasi logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,50 +30,389 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # --- PERUBAHAN 1: Path utama sekarang menunjuk ke folder 'knowledge_base' ---
 KNOWLEDGE_BASE_PATH = "knowledge_base"
 # --- PERUBAHAN 2: Nama file indeks yang baru dan lebih umum ---
-FAISS_INDEX_PATH = "faiss_index_all_subjects" 
+FAISS_INDEX_PATH = "faiss_index_all_subjects"
+# Manifest berisi hash isi setiap file dan ID chunk yang berasal dari file tersebut
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+DEFAULT_EMBED_BATCH_SIZE = 64
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_subjects() -> list[str]:
+    """Setiap subfolder langsung di KNOWLEDGE_BASE_PATH adalah satu subjek = satu shard indeks."""
+    if not os.path.isdir(KNOWLEDGE_BASE_PATH):
+        return []
+    subjects, stray = [], []
+    for name in sorted(os.listdir(KNOWLEDGE_BASE_PATH)):
+        (subjects if os.path.isdir(os.path.join(KNOWLEDGE_BASE_PATH, name)) else stray).append(name)
+    if stray:
+        logging.warning(f"File di luar subfolder subjek diabaikan: {', '.join(stray)}")
+    return subjects
+
+
+def shard_path(subject: str) -> str:
+    return os.path.join(FAISS_INDEX_PATH, subject)
 
-def create_vector_store():
+
+def staging_path(subject: str, suffix: str) -> str:
+    # Berawalan titik agar tidak pernah terbaca sebagai shard oleh list_shards
+    return os.path.join(FAISS_INDEX_PATH, f".{subject}.{suffix}")
+
+
+def remove_shard(subject: str) -> None:
+    """Pindahkan shard keluar dari path-nya dulu (satu rename), baru hapus isinya."""
+    index_dir = shard_path(subject)
+    if not os.path.isdir(index_dir):
+        return
+    trash_dir = staging_path(subject, "old")
+    shutil.rmtree(trash_dir, ignore_errors=True)
+    os.rename(index_dir, trash_dir)
+    shutil.rmtree(trash_dir)
+
+
+def publish_shard(subject: str, build_dir: str) -> None:
     """
-    Membaca semua dokumen (.txt dan .pdf) dari SEMUA subfolder di dalam KNOWLEDGE_BASE_PATH,
-    lalu membuat dan menyimpan satu FAISS Vector Store gabungan.
+    Ganti shard lama dengan direktori hasil build. Server membaca path shard yang selalu berisi
+    indeks lengkap (lama atau baru); worker yang masih me-mmap file lama tetap memegang inode
+    lama sampai memuat ulang. Rename direktori non-kosong tidak bisa menimpa, jadi shard lama
+    dipindahkan dulu ke samping.
     """
+    index_dir = shard_path(subject)
+    old_dir = staging_path(subject, "old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.isdir(index_dir):
+        os.rename(index_dir, old_dir)
+    os.rename(build_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def scan_knowledge_base(subject: str) -> dict[str, str]:
+    """Kembalikan {path relatif: sha256} untuk semua .txt dan .pdf di subfolder subjek."""
+    files = {}
+    for root, _, filenames in os.walk(os.path.join(KNOWLEDGE_BASE_PATH, subject)):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                path = os.path.join(root, filename)
+                files[path] = file_sha256(path)
+    return files
+
+
+def load_manifest(index_dir: str) -> dict | None:
+    path = os.path.join(index_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    # Manifest dari konfigurasi chunking/model yang berbeda tidak bisa dipakai ulang
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("embedding_model") != EMBEDDING_MODEL_NAME
+        or manifest.get("chunk_size") != CHUNK_SIZE
+        or manifest.get("chunk_overlap") != CHUNK_OVERLAP
+    ):
+        return None
+    return manifest
+
+
+def save_manifest(index_dir: str, files: dict[str, dict]) -> None:
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "files": files,
+    }
+    with open(os.path.join(index_dir, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+
+def load_and_split(path: str, sha256: str):
+    """
+    Muat satu file lalu bagi menjadi chunks dengan ID stabil `<path>::<hash>::<urutan>`.
+    Dijalankan di process pool, jadi splitter dibuat di dalam worker.
+    Mengembalikan (docs, ids, detik_load, detik_split).
+    """
+    start = time.perf_counter()
+    if path.lower().endswith(".pdf"):
+        documents = PyPDFLoader(path).load()
+    else:
+        documents = TextLoader(path, encoding="utf-8").load()
+    loaded = time.perf_counter()
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    docs = text_splitter.split_documents(documents)
+    ids = [f"{path}::{sha256[:16]}::{i}" for i in range(len(docs))]
+    for doc, chunk_id in zip(docs, ids):
+        doc.metadata["chunk_id"] = chunk_id
+    return docs, ids, loaded - start, time.perf_counter() - loaded
+
+
+class StageTimer:
+    """Akumulasi durasi per tahap build (load, split, embed, index, save)."""
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self, total_chunks: int, wall_seconds: float) -> None:
+        for stage in ("load", "split", "embed", "index", "save"):
+            logging.info(f"  {stage:<6}: {self.seconds.get(stage, 0.0):8.2f} s")
+        embed_index = self.seconds.get("embed", 0.0) + self.seconds.get("index", 0.0)
+        if total_chunks and embed_index:
+            logging.info(f"  throughput embed+index: {total_chunks / embed_index:.1f} chunk/detik")
+        if total_chunks and wall_seconds:
+            logging.info(f"  throughput total      : {total_chunks / wall_seconds:.1f} chunk/detik ({wall_seconds:.2f} s wall)")
+
+
+def export_serving_files(db, index_dir: str, index_type: str, params: dict) -> None:
+    """
+    Tulis format yang dibaca server (app/agent.py): indeks pencarian sesuai tipe, docstore ringkas
+    ber-offset, centroid shard (gerbang retrieval), lalu index_meta.json paling akhir (penanda build selesai untuk hot-reload).
+    index.faiss + index.pkl tetap disimpan sebagai sumber kebenaran untuk build inkremental;
+    tipe selain flat dibangun ulang dari vektornya tanpa embedding ulang.
+    """
+    vectors = flat_vectors(db.index)
+    if index_type == "flat":
+        search_index = db.index
+    else:
+        logging.info(f"Membangun indeks {index_type} dengan parameter {params}...")
+        search_index = build_ann_index(vectors, index_type, params)
+    write_search_index(search_index, index_dir)
+    write_centroid(vectors, index_dir)
+
+    documents = [db.docstore.search(db.index_to_docstore_id[i]) for i in range(db.index.ntotal)]
+    write_docstore(documents, index_dir)
+    save_index_meta(index_dir, index_type, params)
+
+
+def remove_legacy_index() -> None:
+    """Hapus indeks gabungan lama (file langsung di FAISS_INDEX_PATH) setelah shard tersedia."""
+    for filename in os.listdir(FAISS_INDEX_PATH):
+        path = os.path.join(FAISS_INDEX_PATH, filename)
+        if os.path.isfile(path):
+            os.remove(path)
+            logging.info(f"Menghapus file indeks gabungan lama: {path}")
+
+
+def update_shard(
+    subject: str,
+    embeddings,
+    pool: ProcessPoolExecutor,
+    timer: StageTimer,
+    full: bool,
+    batch_size: int,
+    index_type: str,
+    index_params: dict,
+) -> int:
+    """
+    Buat atau perbarui shard FAISS untuk satu subjek. Shard lain tidak disentuh.
+    Mengembalikan jumlah chunk yang di-embed.
+    """
+    index_dir = shard_path(subject)
+
+    # 1. Hitung hash isi setiap file
+    current_files = scan_knowledge_base(subject)
+    if not current_files:
+        logging.warning(f"[{subject}] Tidak ada dokumen (.txt atau .pdf); shard dihapus jika ada.")
+        remove_shard(subject)
+        return 0
+
+    # 2. Muat indeks & manifest lama (jika ada dan tidak dipaksa rebuild penuh)
+    manifest = None if full else load_manifest(index_dir)
+    db = None
+    if manifest is not None:
+        try:
+            db = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            logging.warning(f"[{subject}] Indeks lama tidak bisa dimuat, rebuild penuh. Error: {e}")
+            manifest = None
+    if manifest is None:
+        logging.info(f"[{subject}] Rebuild penuh shard.")
+    previous_files = manifest["files"] if manifest else {}
+
+    # 3. Tentukan file yang berubah
+    added = [p for p in current_files if p not in previous_files]
+    changed = [p for p in current_files if p in previous_files and previous_files[p]["sha256"] != current_files[p]]
+    removed = [p for p in previous_files if p not in current_files]
+    logging.info(f"[{subject}] File baru: {len(added)}, berubah: {len(changed)}, dihapus: {len(removed)}, tetap: {len(current_files) - len(added) - len(changed)}")
+
+    if db is not None and not (added or changed or removed):
+        previous_meta = load_index_meta(index_dir)
+        if previous_meta["type"] == index_type and previous_meta["params"] == index_params:
+            logging.info(f"[{subject}] Tidak ada perubahan. Shard tidak disentuh.")
+            return 0
+        logging.info(f"[{subject}] Dokumen tidak berubah, hanya tipe/parameter indeks yang dibangun ulang.")
+
+    # 4. Buang vektor milik file yang dihapus atau berubah
+    stale_ids = [chunk_id for p in changed + removed for chunk_id in previous_files[p]["chunk_ids"]]
+    if db is not None and stale_ids:
+        logging.info(f"[{subject}] Menghapus {len(stale_ids)} chunk lama dari indeks...")
+        db.delete(stale_ids)
+
+    # 5. Muat & bagi hanya file baru/berubah (paralel), lalu embed per batch
+    new_files = {p: previous_files[p] for p in current_files if p not in added and p not in changed}
+    to_index = added + changed
+    pending_docs, pending_ids = [], []
+    total_chunks = 0
+
+    def flush(docs, ids):
+        # 6. Embed satu batch chunk dan tambahkan ke indeks
+        nonlocal db
+        texts = [doc.page_content for doc in docs]
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents(texts)
+        timer.add("embed", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pairs = list(zip(texts, vectors))
+        metadatas = [doc.metadata for doc in docs]
+        if db is None:
+            db = FAISS.from_embeddings(pairs, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            db.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+        timer.add("index", time.perf_counter() - start)
+
+    if to_index:
+        logging.info(f"[{subject}] Memuat & membagi {len(to_index)} file...")
+        results = pool.map(load_and_split, to_index, [current_files[p] for p in to_index])
+        for path, (docs, ids, load_seconds, split_seconds) in zip(to_index, results):
+            timer.add("load", load_seconds)
+            timer.add("split", split_seconds)
+            new_files[path] = {"sha256": current_files[path], "chunk_ids": ids}
+            pending_docs.extend(docs)
+            pending_ids.extend(ids)
+            while len(pending_docs) >= batch_size:
+                flush(pending_docs[:batch_size], pending_ids[:batch_size])
+                total_chunks += batch_size
+                pending_docs, pending_ids = pending_docs[batch_size:], pending_ids[batch_size:]
+        if pending_docs:
+            flush(pending_docs, pending_ids)
+            total_chunks += len(pending_docs)
+        logging.info(f"[{subject}] {total_chunks} chunk baru di-embed.")
+
+    if db is None or db.index.ntotal == 0:
+        logging.warning(f"[{subject}] Indeks kosong setelah pembaruan; tidak ada yang disimpan.")
+        return total_chunks
+
+    # 7. Simpan file indeks & manifest ke direktori build di samping shard, lalu tukar. Shard lama
+    # tetap utuh selama build; jika build gagal di tengah, shard lama yang tetap dipakai server.
+    build_dir = staging_path(subject, "building")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    start = time.perf_counter()
+    db.save_local(build_dir)
+    save_manifest(build_dir, new_files)
+    timer.add("save", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    export_serving_files(db, build_dir, index_type, index_params)
+    timer.add("index", time.perf_counter() - start)
+    publish_shard(subject, build_dir)
+    logging.info(f"[{subject}] Shard disimpan di: {index_dir} ({db.index.ntotal} chunk)")
+    return total_chunks
+
+
+def create_vector_store(
+    full: bool = False,
+    workers: int | None = None,
+    batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+    index_type: str = "flat",
+    index_params: dict | None = None,
+    subjects: list[str] | None = None,
+):
+    """
+    Membaca dokumen (.txt dan .pdf) dari setiap subfolder KNOWLEDGE_BASE_PATH dan membuat atau
+    memperbarui satu shard FAISS per subfolder di FAISS_INDEX_PATH/<subfolder>. app/agent.py hanya
+    mencari di shard milik karakter (`knowledge_shards` di app/waifu.py).
+
+    Secara default bersifat inkremental per shard: hanya file baru/berubah yang di-embed, dan vektor
+    milik file yang dihapus/berubah dibuang dari indeks & docstore. `full=True` memaksa rebuild bersih.
+    `subjects` membatasi build ke subjek tertentu tanpa menyentuh shard lain.
+
+    Parsing PDF/teks berjalan paralel di process pool (`workers`), lalu chunk di-embed per batch
+    (`batch_size`) dan langsung dimasukkan ke indeks sehingga vektor tidak ditumpuk di memori.
+
+    `index_type` memilih struktur pencarian (flat, ivf_flat, hnsw, ivf_pq); tipe & parameternya
+    disimpan di index_meta.json setiap shard agar app/agent.py memuatnya dengan benar.
+    """
+    index_params = resolve_params(index_type, index_params)
+    timer = StageTimer()
+    build_start = time.perf_counter()
     try:
-        # 1. Muat dokumen .txt dari semua subfolder
-        logging.info(f"Memuat dokumen .txt dari: {KNOWLEDGE_BASE_PATH} dan semua subfoldernya")
-        txt_loader = DirectoryLoader(KNOWLEDGE_BASE_PATH, glob="**/*.txt")
-        txt_documents = txt_loader.load()
-
-        # 2. Muat dokumen .pdf dari semua subfolder
-        logging.info(f"Memuat dokumen .pdf dari: {KNOWLEDGE_BASE_PATH} dan semua subfoldernya")
-        pdf_loader = DirectoryLoader(KNOWLEDGE_BASE_PATH, glob="**/*.pdf", loader_cls=PyPDFLoader)
-        pdf_documents = pdf_loader.load()
-        
-        # 3. Gabungkan semua dokumen
-        documents = txt_documents + pdf_documents
-        
-        if not documents:
-            logging.warning(f"Tidak ada dokumen (.txt atau .pdf) yang ditemukan di dalam '{KNOWLEDGE_BASE_PATH}'. Pastikan file ada di dalam subfolder.")
+        logging.info(f"Memindai subfolder subjek di: {KNOWLEDGE_BASE_PATH}")
+        all_subjects = list_subjects()
+        if not all_subjects:
+            logging.warning(f"Tidak ada subfolder di dalam '{KNOWLEDGE_BASE_PATH}'. Letakkan dokumen di knowledge_base/<subjek>/.")
             return
+        unknown = sorted(set(subjects or []) - set(all_subjects))
+        if unknown:
+            logging.warning(f"Subjek tidak ditemukan di {KNOWLEDGE_BASE_PATH}: {', '.join(unknown)}")
+        selected = [s for s in all_subjects if subjects is None or s in subjects]
 
-        # 4. Bagi dokumen menjadi chunks
-        logging.info("Membagi dokumen menjadi chunks...")
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        docs = text_splitter.split_documents(documents)
-
-        # 5. Inisialisasi model embedding
         logging.info("Menginisialisasi model embedding...")
-        embeddings = HuggingFaceEmbeddings(model_name='all-MiniLM-L6-v2')
+        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs={"batch_size": batch_size})
+
+        os.makedirs(FAISS_INDEX_PATH, exist_ok=True)
+        total_chunks = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            logging.info(f"Parsing dokumen memakai {workers or os.cpu_count()} proses.")
+            for subject in selected:
+                total_chunks += update_shard(subject, embeddings, pool, timer, full, batch_size, index_type, index_params)
 
-        # 6. Buat Vector Store FAISS
-        logging.info("Membuat FAISS vector store...")
-        db = FAISS.from_documents(docs, embeddings)
+        # Shard milik subfolder yang sudah dihapus dari knowledge_base ikut dihapus
+        if subjects is None:
+            for name in list_shards(FAISS_INDEX_PATH):
+                if name not in all_subjects:
+                    logging.info(f"Subjek '{name}' tidak ada lagi, menghapus shard.")
+                    remove_shard(name)
+        if set(all_subjects) <= set(list_shards(FAISS_INDEX_PATH)):
+            remove_legacy_index()
 
-        # 7. Simpan file indeks ke disk
-        db.save_local(FAISS_INDEX_PATH)
-        logging.info(f"Vector store gabungan berhasil dibuat dan disimpan di: {FAISS_INDEX_PATH}")
+        logging.info(f"Shard tersedia di {FAISS_INDEX_PATH}: {', '.join(list_shards(FAISS_INDEX_PATH))}")
+        logging.info("Durasi per tahap (load/split = total waktu CPU di worker):")
+        timer.report(total_chunks, time.perf_counter() - build_start)
 
     except Exception as e:
         logging.error(f"Terjadi error saat membuat vector store: {e}")
 
 if __name__ == "__main__":
-    create_vector_store()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bangun atau perbarui shard FAISS per subjek dari knowledge_base.")
+    parser.add_argument("--full", action="store_true", help="Paksa rebuild bersih seluruh indeks.")
+    parser.add_argument("--subjects", nargs="+", help="Hanya bangun shard untuk subfolder ini (default: semua).")
+    parser.add_argument("--workers", type=int, default=None, help="Jumlah proses untuk parsing dokumen (default: jumlah CPU).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_EMBED_BATCH_SIZE, help="Jumlah chunk per batch embedding.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="Struktur indeks pencarian.")
+    parser.add_argument("--nlist", type=int, help="IVF: jumlah cluster.")
+    parser.add_argument("--nprobe", type=int, help="IVF: jumlah cluster yang diperiksa saat mencari.")
+    parser.add_argument("--m", type=int, help="HNSW: jumlah tetangga per node.")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: lebar pencarian saat membangun graf.")
+    parser.add_argument("--ef-search", type=int, help="HNSW: lebar pencarian saat query.")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ: jumlah sub-kuantizer (harus membagi dimensi embedding).")
+    parser.add_argument("--pq-nbits", type=int, help="IVF-PQ: bit per kode sub-kuantizer.")
+    args = parser.parse_args()
+    overrides = {
+        "nlist": args.nlist, "nprobe": args.nprobe, "m": args.m, "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search, "pq_m": args.pq_m, "pq_nbits": args.pq_nbits,
+    }
+    create_vector_store(
+        full=args.full,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        index_type=args.index_type,
+        index_params=overrides,
+        subjects=args.subjects,
+    )
@@ -0,0 +1,53 @@
+"""
+Server SerpAPI palsu untuk uji lokal pencarian kerja (tanpa kuota & tanpa internet).
+Meniru endpoint GET /search.json engine google_jobs dan menghitung request yang diterima,
+sehingga efek cache & deduplikasi bisa diverifikasi dari GET /stats.
+
+    FAKE_SERPAPI_LATENCY_MS=800 uvicorn fake_serpapi:app --port 8100
+    SERPAPI_BASE_URL=http://127.0.0.1:8100 SERPAPI_API_KEY=fake uvicorn main:app
+"""
+import os
+import asyncio
+import hashlib
+from collections import Counter
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+FAKE_SERPAPI_LATENCY_MS = float(os.environ.get("FAKE_SERPAPI_LATENCY_MS", "500"))
+FAKE_SERPAPI_RESULTS = int(os.environ.get("FAKE_SERPAPI_RESULTS", "5"))
+
+app = FastAPI(title="Fake SerpAPI")
+requests_by_query: Counter = Counter()
+
+
+@app.get("/search.json")
+async def search(q: str = "", location: str = "", engine: str = "", api_key: str = ""):
+    requests_by_query[f"{q}|{location}"] += 1
+    await asyncio.sleep(FAKE_SERPAPI_LATENCY_MS / 1000)
+    if not api_key:
+        return JSONResponse({"error": "Invalid API key."}, status_code=401)
+    if engine != "google_jobs":
+        return JSONResponse({"error": f"Unsupported engine: {engine}"}, status_code=400)
+    digest = hashlib.sha256(f"{q}|{location}".encode("utf-8")).hexdigest()[:10]
+    return {"jobs_results": [
+        {
+            "title": f"{q} ({i})",
+            "company_name": f"PT Fake {i}",
+            "location": location,
+            "job_id": f"fake-{digest}-{i}",
+            "apply_options": [{"title": "Fake", "link": f"https://example.com/jobs/{digest}/{i}"}],
+        }
+        for i in range(1, FAKE_SERPAPI_RESULTS + 1)
+    ]}
+
+
+@app.get("/stats")
+async def stats():
+    return {"total_requests": sum(requests_by_query.values()), "by_query": dict(requests_by_query)}
+
+
+@app.post("/reset")
+async def reset():
+    requests_by_query.clear()
+    return {"ok": True}
@@ -0,0 +1,189 @@
+"""
+Generator beban untuk API WaifuChat: mendaftarkan user, login lewat /auth/jwt/login, lalu
+mengirim trafik chat dan rekomendasi dengan laju (RPS) tetap selama durasi tertentu (open-loop:
+request baru tetap dikirim sesuai jadwal walau server melambat).
+Dilaporkan throughput, persentil latensi, dan tingkat error per jenis request.
+
+Jalankan server tanpa Gemini, SerpAPI, maupun MySQL:
+    LLM_PROVIDER=stub JOB_SEARCH_PROVIDER=stub DATABASE_URL=sqlite+aiosqlite:///./loadtest.db \\
+        uvicorn main:app --port 8000
+
+Lalu:
+    python loadtest.py --users 20 --rps 10 --duration 60
+    python loadtest.py --rps 30 --stream --chat-ratio 0.9   # /api/chat/stream + waktu token pertama
+"""
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+
+import httpx
+
+CHARACTERS = ["AIKO_CHAN", "HINATA_CHAN", "YUNA_CHAN"]
+MESSAGES = [
+    "Halo, apa kabar hari ini?",
+    "Bagaimana cara membuat CV yang ATS-friendly?",
+    "Tolong carikan lowongan kerja data analyst di Jakarta",
+    "Apa bedanya list dan tuple di Python?",
+    "Jelaskan closure di JavaScript dengan contoh",
+    "Apa itu overfitting dalam machine learning?",
+    "Aku lagi capek belajar, kasih semangat dong",
+]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, Counter] = defaultdict(Counter)
+        self.first_token: list[float] = []
+        self.shed = 0
+
+    def record(self, op: str, seconds: float, error: str | None = None) -> None:
+        self.latencies[op].append(seconds)
+        if error is not None:
+            self.errors[op][error] += 1
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def register_and_login(client: httpx.AsyncClient, run_id: str, i: int, password: str) -> str:
+    email = f"loadtest-{run_id}-{i}@example.com"
+    response = await client.post("/auth/register", json={
+        "email": email,
+        "password": password,
+        "nama": f"Penguji {i}",
+        "nim": f"LT{run_id}{i:05d}",
+    })
+    if response.status_code not in (201, 400):
+        response.raise_for_status()
+    response = await client.post("/auth/jwt/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def chat(client: httpx.AsyncClient, token: str, stats: Stats, stream: bool) -> None:
+    payload = {
+        "character_id": random.choice(CHARACTERS),
+        "messages": [{"role": "human", "content": random.choice(MESSAGES)}],
+    }
+    headers = {"Authorization": f"Bearer {token}"}
+    op = "chat_stream" if stream else "chat"
+    start = time.perf_counter()
+    try:
+        if not stream:
+            response = await client.post("/api/chat", json=payload, headers=headers)
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+        else:
+            error = "stream tanpa event done"
+            async with client.stream("POST", "/api/chat/stream", json=payload, headers=headers) as response:
+                if response.status_code != 200:
+                    error = f"HTTP {response.status_code}"
+                else:
+                    first_token = None
+                    async for line in response.aiter_lines():
+                        if line.startswith("event: token") and first_token is None:
+                            first_token = time.perf_counter() - start
+                            stats.first_token.append(first_token)
+                        elif line.startswith("event: done"):
+                            error = None
+                        elif line.startswith("event: error"):
+                            error = "event error"
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    stats.record(op, time.perf_counter() - start, error)
+
+
+async def recommendations(client: httpx.AsyncClient, token: str, stats: Stats) -> None:
+    start = time.perf_counter()
+    try:
+        response = await client.get("/api/recommendations", headers={"Authorization": f"Bearer {token}"})
+        error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+    stats.record("recommendations", time.perf_counter() - start, error)
+
+
+async def run(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        run_id = uuid.uuid4().hex[:6]
+        print(f"Mendaftarkan & login {args.users} user (run {run_id})...")
+        tokens = await asyncio.gather(*(register_and_login(client, run_id, i, args.password) for i in range(args.users)))
+
+        stats = Stats()
+        inflight: set[asyncio.Task] = set()
+        loop = asyncio.get_running_loop()
+        interval = 1 / args.rps
+        started = loop.time()
+        print(f"Mengirim {args.rps} request/detik selama {args.duration} detik...")
+        i = 0
+        while True:
+            scheduled = started + i * interval
+            if scheduled - started >= args.duration:
+                break
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            i += 1
+            if len(inflight) >= args.max_inflight:
+                # Klien sudah jenuh; dicatat agar laju aktual tidak disalahartikan sebagai kapasitas server
+                stats.shed += 1
+                continue
+            token = random.choice(tokens)
+            if random.random() < args.chat_ratio:
+                coro = chat(client, token, stats, args.stream)
+            else:
+                coro = recommendations(client, token, stats)
+            task = asyncio.create_task(coro)
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        await asyncio.gather(*inflight)
+        wall = loop.time() - started
+
+    header = f"{'request':<16} {'jumlah':>7} {'error %':>8} {'rps':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'maks ms':>9}"
+    print()
+    print(header)
+    print("-" * len(header))
+    for op, latencies in sorted(stats.latencies.items()):
+        errors = sum(stats.errors[op].values())
+        print(
+            f"{op:<16} {len(latencies):>7} {100 * errors / len(latencies):>7.1f}% {len(latencies) / wall:>7.1f} "
+            f"{percentile(latencies, 50) * 1000:>9.0f} {percentile(latencies, 90) * 1000:>9.0f} "
+            f"{percentile(latencies, 99) * 1000:>9.0f} {max(latencies) * 1000:>9.0f}"
+        )
+    if stats.first_token:
+        print(f"\nWaktu token pertama (stream): p50 {percentile(stats.first_token, 50) * 1000:.0f} ms, p99 {percentile(stats.first_token, 99) * 1000:.0f} ms")
+    for op, counter in sorted(stats.errors.items()):
+        if counter:
+            print(f"Error {op}: {dict(counter)}")
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f"\nTotal {total} request dalam {wall:.1f} s ({total / wall:.1f} rps), target {args.rps} rps, dibuang klien: {stats.shed}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Uji beban API chat & rekomendasi WaifuChat.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=20, help="Jumlah user yang didaftarkan.")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--rps", type=float, default=10, help="Target request per detik.")
+    parser.add_argument("--duration", type=float, default=30, help="Durasi uji (detik).")
+    parser.add_argument("--chat-ratio", type=float, default=0.8, help="Porsi request chat (sisanya rekomendasi).")
+    parser.add_argument("--stream", action="store_true", help="Gunakan /api/chat/stream.")
+    parser.add_argument("--max-inflight", type=int, default=200, help="Batas request paralel dari klien.")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
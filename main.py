@@ -1,39 +1,91 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Literal
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from sqlmodel import select
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
 # Impor dari file-file konfigurasi
-from app.db import create_db_and_tables, get_async_session
+from app.db import AsyncSessionLocal, create_db_and_tables, get_async_session
 from app.models import User, UserCreate, UserRead, UserUpdate, ChatMessage
-from app.users import auth_backend, current_active_user, fastapi_users
-from app.recomender import hybrid_recommendation
+from app.users import auth_backend, current_active_user, current_superuser, fastapi_users
+from app.auth_cache import auth_user_cache
+from app.retrieval_gate import retrieval_gate
+from app.recomender import get_recommendations, update_user_vector
+from app.rec_cache import recommendation_cache
+from app.rec_worker import recommendation_worker
+from app.rec_snapshot import rec_snapshot, snapshot_exporter
 from app.waifu import WAIFU
+from app.characters import CHARACTERS
+from app.concurrency import shutdown_blocking_pool
+from app.embeddings import embedding_service
+from app.history_cache import CHAT_HISTORY_WINDOW, HistoryItem, conversation_cache, fetch_history_window
+from app.context_builder import fit_history, history_budget, summary_block, to_messages
+from app.summaries import summary_store, unsummarized
+from app.chat_writer import chat_writer
+from app.resources import failed_resources, is_ready, mark_ready, warmup_resources
+from app.metrics import TimingMiddleware, configure_logging, render_metrics, span
 # Impor LangGraph agent Anda
-from app.agent import chat_agent 
+from app.agent import chat_agent, general_retriever_resource, llm_resource
+from app.providers import job_search_resource
+from app.job_search_cache import job_search_cache
 from langchain_core.messages import HumanMessage, AIMessage
 
 from fastapi.middleware.cors import CORSMiddleware
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """
     Menangani event startup dan shutdown. Ini adalah cara modern pengganti on_event.
     """
-    print("Startup: Membuat tabel database...")
+    startup_start = time.perf_counter()
+    logger.info("Startup: Membuat tabel database...")
     await create_db_and_tables()
+    logger.info(f"Startup: tabel database siap dalam {time.perf_counter() - startup_start:.2f} s")
+    await recommendation_worker.start()
+    await chat_writer.start()
+    await snapshot_exporter.start()
+    await job_search_cache.start()
+
+    # Muat LLM, model embedding & indeks FAISS di background; /readyz bernilai 200 setelah selesai.
+    # Jika warmup dimatikan, resource dimuat saat request pertama membutuhkannya.
+    warmup_task = None
+    if WARMUP_ON_STARTUP:
+        warmup_task = asyncio.create_task(warmup_resources())
+    else:
+        mark_ready()
     yield
-    print("Shutdown: Aplikasi dimatikan.")
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # Simpan semua pesan yang masih di antrean write-behind sebelum aplikasi berhenti
+    await chat_writer.stop()
+    await snapshot_exporter.stop()
+    await recommendation_worker.stop()
+    await job_search_cache.stop()
+    if job_search_resource.loaded:
+        await job_search_resource.get().aclose()
+    shutdown_blocking_pool()
+    logger.info("Shutdown: Aplikasi dimatikan.")
 
 # Setup App
-app = FastAPI(title="WaifuChat AI")
+app = FastAPI(title="WaifuChat AI", lifespan=lifespan)
 
+# Server-Timing per request + histogram durasi per route untuk /metrics
+app.add_middleware(TimingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -54,6 +106,13 @@ class ChatRequest(BaseModel):
         description="Hanya berisi pesan baru dari pengguna di sesi ini."
     )
 
+class WaifuPublic(BaseModel):
+    """Data karakter yang boleh dilihat klien; prompt, shard, dan alat tetap di server."""
+    id: str
+    name: str
+    description: str
+    image: str
+
 def to_langchain_message(messages: List[Message]) -> List[HumanMessage | AIMessage]:
     return [
         HumanMessage(content=msg.content) if msg.role == "human" 
@@ -66,67 +125,246 @@ app.include_router(fastapi_users.get_auth_router(auth_backend), prefix="/auth/jw
 app.include_router(fastapi_users.get_register_router(UserRead, UserCreate), prefix="/auth", tags=["auth"])
 app.include_router(fastapi_users.get_users_router(UserRead, UserUpdate), prefix="/users", tags=["users"])
     
+# Probe untuk orkestrator (Kubernetes, load balancer)
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+# Histogram durasi per tahap & per route dalam format Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    failed = failed_resources()
+    if failed:
+        return JSONResponse({"status": "failed", "failed": failed}, status_code=503)
+    if not is_ready():
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return {"status": "ready"}
+
 # Routes API
-@app.get("/api/waifu", summary="Dapatkan semua karakter")
+@app.get("/api/waifu", summary="Dapatkan semua karakter", response_model=List[WaifuPublic])
 async def get_waifus(user: User = Depends(current_active_user)):
-    return list(WAIFU.values())
+    return [WaifuPublic(**{field: waifu[field] for field in WaifuPublic.model_fields}) for waifu in WAIFU.values()]
+
+async def build_agent_input(request: ChatRequest, user: User, session: AsyncSession) -> tuple[dict, HumanMessage | AIMessage] | None:
+    """
+    Siapkan state awal agent (riwayat + pesan baru + variabel prompt karakter).
+    Mengembalikan None jika karakter tidak ditemukan.
+    """
+    profile = CHARACTERS.get(request.character_id)
+    if profile is None:
+        return None
+
+    # 1. Ambil Riwayat Chat (Memori): dari cache jendela percakapan, atau dari Database jika belum ada
+    key = (user.id, request.character_id)
+    history = await load_history(session, user.id, request.character_id)
+    summary = await summary_store.get(key)
+
+    # 2. Ambil pesan terbaru dari frontend
+    latest_user_message_obj = to_langchain_message(request.messages)[-1]
+
+    # 3. Nama pengguna & ringkasan bergulir diisi sebagai variabel template prompt karakter (tanpa format ulang)
+    summary_text = summary_block(summary.summary if summary else None)
+
+    # 4. Pesan yang belum diringkas dikirim apa adanya, sebanyak yang muat di anggaran token
+    budget = history_budget(profile.system_tokens(user.nama, summary_text), latest_user_message_obj.content, profile.rag)
+    memory_messages = to_messages(fit_history(unsummarized(history, summary), budget))
+    combined_messages = memory_messages + [latest_user_message_obj]
+
+    agent_input = {
+        "character_id": request.character_id,
+        "messages": combined_messages,
+        "user_name": user.nama,
+        "summary": summary_text,
+    }
+    return agent_input, latest_user_message_obj
+
+async def load_history(session: AsyncSession, user_id: int, character_id: str) -> list[HistoryItem]:
+    key = (user_id, character_id)
+    loader = lambda: fetch_history_window(session, user_id, character_id)
+    if chat_writer.enabled:
+        # Pesan yang masih di antrean write-behind digabung dengan hasil query
+        db_loader = loader
+        loader = lambda: chat_writer.load_window(key, db_loader, CHAT_HISTORY_WINDOW)
+    with span("history"):
+        return await conversation_cache.get_or_load(key, loader)
+
+async def save_conversation(session: AsyncSession, user_id: int, character_id: str, human_content: str, ai_content: str) -> None:
+    """
+    Simpan pasangan pesan (input & output) ke Database. Dalam mode write-behind pesan hanya
+    diantrekan (di-INSERT per batch oleh chat_writer) sehingga commit tidak ada di jalur response.
+    """
+    # Satu timestamp per giliran, dibulatkan ke detik seperti kolom DATETIME MySQL,
+    # agar nilai di cache sama dengan yang nanti dibaca ulang (dipakai batas ringkasan)
+    now = datetime.utcnow().replace(microsecond=0)
+    items = [("human", human_content, now), ("ai", ai_content, now)]
+    with span("persist"):
+        if chat_writer.enabled:
+            await chat_writer.enqueue(user_id, character_id, items)
+        else:
+            for role, content, timestamp in items:
+                session.add(ChatMessage(user_id=user_id, character_id=character_id, role=role, content=content, timestamp=timestamp))
+            await session.commit()
+    # Write-through: jendela percakapan di cache ikut diperbarui setelah pesan disimpan/diantrekan
+    conversation_cache.append((user_id, character_id), items)
+
+async def refresh_conversation_summary(user_id: int, character_id: str) -> None:
+    """Background task: lipat pesan lama ke ringkasan bergulir (LLM dipanggil beberapa giliran sekali)."""
+    async with AsyncSessionLocal() as session:
+        history = await load_history(session, user_id, character_id)
+    await summary_store.refresh((user_id, character_id), history, await llm_resource.aget())
+
+async def refresh_user_profile(user_id: int, texts: list[str]) -> None:
+    """
+    Background task setelah chat tersimpan: perbarui vektor profil user,
+    lalu naikkan lagi versi cache rekomendasinya agar hasil yang dihitung
+    sebelum vektor selesai diperbarui tidak dipakai, dan jadwalkan precompute.
+    """
+    try:
+        await update_user_vector(user_id, texts)
+    finally:
+        # Tetap dijalankan jika pembaruan vektor gagal, agar rekomendasi lama tidak tertahan di cache
+        recommendation_cache.bump(user_id)
+        recommendation_worker.notify(user_id)
 
 @app.post("/api/chat", summary="Kirim pesan ke karakter")
 async def chat_with_character(
     request: ChatRequest, 
+    background_tasks: BackgroundTasks,
     user: User = Depends(current_active_user),
     session: AsyncSession = Depends(get_async_session)
 ):
     """
     Endpoint utama untuk chat, terintegrasi dengan LangGraph Agent.
     """
-    # 1. Ambil Riwayat Chat dari Database (Memori)
-    stmt = select(ChatMessage).where(
-        ChatMessage.user_id == user.id,
-        ChatMessage.character_id == request.character_id
-    ).order_by(ChatMessage.timestamp.desc()).limit(20)
-    
-    result = await session.exec(stmt)
-    db_history = result.all()
-    db_history.reverse()
-    memory_messages = to_langchain_message([Message(role=msg.role, content=msg.content) for msg in db_history])
-
-    # 2. Ambil pesan terbaru dari frontend
-    latest_user_message_obj = to_langchain_message(request.messages)[-1]
-
-    # 3. Gabungkan memori dan pesan baru untuk dikirim ke agent
-    combined_messages = memory_messages + [latest_user_message_obj]
-
-    # 4. Siapkan System Prompt yang Dinamis
-    character = WAIFU.get(request.character_id)
-    if not character:
+    prepared = await build_agent_input(request, user, session)
+    if prepared is None:
         return {"role": "ai", "content": "Maaf, karakter tidak ditemukan."}
+    agent_input, latest_user_message_obj = prepared
 
-    # Format system_prompt dengan nama pengguna yang sedang login
-    formatted_system_prompt = character["system_prompt"].format(user_name=user.nama)
-
-    # 5. Panggil LangGraph Agent dengan state yang lengkap
-    final_state = chat_agent.invoke({
-        "character_id": request.character_id,
-        "messages": combined_messages,
-        "system_prompt": formatted_system_prompt # <-- Kirim prompt yang sudah diformat
-    })
+    # Panggil LangGraph Agent dengan state yang lengkap
+    final_state = await chat_agent.ainvoke(agent_input)
 
     # Ekstrak respons AI dari state akhir
     ai_response_content = final_state["messages"][-1].content
     
-    # 6. Simpan percakapan baru (input & output) ke Database
-    user_msg_to_save = ChatMessage(user_id=user.id, character_id=request.character_id, role="human", content=latest_user_message_obj.content)
-    ai_msg_to_save = ChatMessage(user_id=user.id, character_id=request.character_id, role="ai", content=ai_response_content)
-    session.add(user_msg_to_save)
-    session.add(ai_msg_to_save)
-    await session.commit()
+    # Simpan percakapan baru (input & output) ke Database
+    await save_conversation(session, user.id, request.character_id, latest_user_message_obj.content, ai_response_content)
+    recommendation_cache.bump(user.id)
+    # Perbarui vektor profil user untuk rekomendasi di luar jalur response
+    background_tasks.add_task(refresh_user_profile, user.id, [latest_user_message_obj.content, ai_response_content])
+    background_tasks.add_task(refresh_conversation_summary, user.id, request.character_id)
 
     return {"role": "ai", "content": ai_response_content}
 
+def sse_event(event: str, data: dict) -> str:
+    """Format satu frame Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def chunk_text(chunk) -> str:
+    """Ambil teks dari AIMessageChunk (Gemini bisa mengirim content berupa list part)."""
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+@app.post("/api/chat/stream", summary="Kirim pesan ke karakter (streaming token via SSE)")
+async def chat_with_character_stream(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(current_active_user),
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    Versi streaming dari /api/chat. Mengirim event SSE:
+    `token` (potongan jawaban), `tool_start`/`tool_end` (progres alat),
+    `done` (jawaban final) atau `error`.
+    Pasangan ChatMessage hanya disimpan jika stream selesai dengan sukses.
+    """
+    prepared = await build_agent_input(request, user, session)
+    user_id = user.id
+
+    async def event_stream() -> AsyncGenerator[str, None]:
+        if prepared is None:
+            yield sse_event("done", {"content": "Maaf, karakter tidak ditemukan."})
+            return
+        agent_input, latest_user_message_obj = prepared
+
+        final_state = None
+        try:
+            async for event in chat_agent.astream_events(agent_input, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream" and event.get("metadata", {}).get("langgraph_node") == "chat":
+                    text = chunk_text(event["data"]["chunk"])
+                    if text:
+                        yield sse_event("token", {"content": text})
+                elif kind == "on_tool_start":
+                    yield sse_event("tool_start", {"name": event["name"], "input": event["data"].get("input")})
+                elif kind == "on_tool_end":
+                    yield sse_event("tool_end", {"name": event["name"]})
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # Event akhir dari graph root berisi state final
+                    final_state = event["data"]["output"]
+        except Exception as e:
+            logger.error(f"Streaming chat gagal: {e}")
+            yield sse_event("error", {"content": "Terjadi kesalahan saat memproses pesan."})
+            return
+
+        if not final_state or not final_state.get("messages"):
+            yield sse_event("error", {"content": "Agent tidak menghasilkan jawaban."})
+            return
+
+        ai_response_content = final_state["messages"][-1].content
+        # Sesi dependency bisa sudah ditutup saat response streaming berjalan, jadi buka sesi sendiri
+        async with AsyncSessionLocal() as save_session:
+            await save_conversation(save_session, user_id, request.character_id, latest_user_message_obj.content, ai_response_content)
+        recommendation_cache.bump(user_id)
+        # Dijalankan Starlette setelah stream selesai dikirim
+        background_tasks.add_task(refresh_user_profile, user_id, [latest_user_message_obj.content, ai_response_content])
+        background_tasks.add_task(refresh_conversation_summary, user_id, request.character_id)
+        yield sse_event("done", {"content": ai_response_content})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background_tasks,
+    )
+
 @app.get("/api/recommendations", response_model=List[str], summary="Dapatkan rekomendasi karakter")
 async def get_character_recommendations(user: User = Depends(current_active_user)):
-    return await hybrid_recommendation(user_id=user.id)
+    user_id = user.id
+    return await recommendation_cache.get_or_compute(user_id, lambda: get_recommendations(user_id))
+
+@app.get("/api/recommendations/stats", summary="Statistik cache rekomendasi")
+async def get_recommendation_cache_stats(user: User = Depends(current_superuser)):
+    return {"cache": recommendation_cache.stats(), "worker": recommendation_worker.stats(), "snapshot": rec_snapshot.stats()}
+
+@app.get("/api/retrieval/stats", summary="Statistik cache retrieval RAG & gerbang retrieval")
+async def get_retrieval_cache_stats(user: User = Depends(current_superuser)):
+    general_retriever = general_retriever_resource.get() if general_retriever_resource.loaded else None
+    stats = general_retriever.stats() if general_retriever is not None else {}
+    return {**stats, "gate": retrieval_gate.stats()}
+
+@app.get("/api/history/stats", summary="Statistik cache jendela riwayat & penulisan pesan chat")
+async def get_history_cache_stats(user: User = Depends(current_superuser)):
+    return {"cache": conversation_cache.stats(), "writer": chat_writer.stats(), "summaries": summary_store.stats()}
+
+@app.get("/api/jobs/stats", summary="Statistik cache pencarian lowongan kerja")
+async def get_job_search_stats(user: User = Depends(current_superuser)):
+    return job_search_cache.stats()
+
+@app.get("/api/auth/stats", summary="Statistik cache user terautentikasi")
+async def get_auth_cache_stats(user: User = Depends(current_superuser)):
+    return auth_user_cache.stats()
+
+@app.get("/api/embeddings/stats", summary="Statistik layanan embedding bersama")
+async def get_embedding_stats(user: User = Depends(current_superuser)):
+    return embedding_service.get().stats() if embedding_service.loaded else {}
 
 # Sajikan Frontend... (Tidak ada perubahan)
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from app.recomender import COLLAB_TOP_K, CollaborativeIndex
+
+
+def reference_scores(target_user_id: int, user_vectors: dict, interactions: list[tuple[int, str]]) -> dict:
+    """Implementasi lama: kosinus per pasangan user, top-5 tetangga, jumlahkan skor karakter yang mereka sukai."""
+    if target_user_id not in user_vectors or len(user_vectors) < 2:
+        return {}
+    target = user_vectors[target_user_id]
+    similarities = {
+        uid: float(np.dot(target, vec) / (np.linalg.norm(target) * np.linalg.norm(vec)))
+        for uid, vec in user_vectors.items() if uid != target_user_id
+    }
+    similar_users = sorted(similarities.items(), key=lambda item: item[1], reverse=True)[:COLLAB_TOP_K]
+    scores: dict[str, float] = {}
+    for uid, score in similar_users:
+        for liked_uid, char_id in interactions:
+            if liked_uid == uid:
+                scores[char_id] = scores.get(char_id, 0.0) + score
+    return scores
+
+
+@pytest.fixture
+def fixture():
+    rng = np.random.default_rng(7)
+    user_vectors = {uid: rng.standard_normal(16).astype(np.float32) for uid in range(1, 11)}
+    characters = ["AIKO_CHAN", "HINATA_CHAN", "YUNA_CHAN"]
+    interactions = sorted({(uid, characters[int(c)]) for uid in range(1, 11) for c in rng.integers(0, 3, size=2)})
+    # User tanpa interaksi tetap boleh jadi tetangga (tidak menyumbang skor)
+    interactions = [(uid, char_id) for uid, char_id in interactions if uid != 4]
+    return user_vectors, interactions
+
+
+def test_scores_match_pairwise_reference(fixture):
+    user_vectors, interactions = fixture
+    index = CollaborativeIndex.build(user_vectors, interactions)
+    for uid in user_vectors:
+        expected = reference_scores(uid, user_vectors, interactions)
+        actual = index.scores(uid)
+        assert actual.keys() == expected.keys()
+        for char_id, score in expected.items():
+            assert actual[char_id] == pytest.approx(score, abs=1e-5)
+
+
+def test_unknown_or_lonely_user_has_no_scores(fixture):
+    user_vectors, interactions = fixture
+    assert CollaborativeIndex.build(user_vectors, interactions).scores(999) == {}
+    assert CollaborativeIndex.build({1: user_vectors[1]}, interactions).scores(1) == {}
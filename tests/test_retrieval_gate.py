@@ -0,0 +1,36 @@
+import pytest
+
+from app.retrieval_gate import CHITCHAT_WORDS, is_chitchat, is_job_request
+
+
+@pytest.mark.parametrize("text", ["hai kak", "makasih ya 😊", "wkwkwk", "Halo kak, apa kabar?", "ok sip"])
+def test_greetings_are_chitchat(text):
+    assert is_chitchat(text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["apa itu OOP?", "gimana cara belajar python", "aku bingung", "tidak paham rekursi", "kamu tahu SQL?"],
+)
+def test_short_questions_are_not_chitchat(text):
+    assert not is_chitchat(text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["cari lowongan data analyst di Jakarta", "carikan magang UI/UX", "lowongan backend engineer", "loker frontend bandung"],
+)
+def test_explicit_job_searches(text):
+    assert is_job_request(text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["tips magang pertama", "tips cari kerja buat fresh graduate", "cara melamar lowongan kerja", "internship itu apa"],
+)
+def test_career_questions_are_not_job_searches(text):
+    assert not is_job_request(text)
+
+
+def test_chitchat_vocabulary_has_no_function_words():
+    assert not CHITCHAT_WORDS & {"apa", "gimana", "aku", "kamu", "saya", "tidak", "bukan", "lagi", "juga"}